@@ -0,0 +1,1191 @@
+"""
+Banc d'essai hors ligne de bot.py.
+
+La vraie Application (handlers, jobs, envois, stockage) tourne contre un faux
+serveur Bot API et un faux Mistral en local : aucun appel réseau externe, aucun
+token réel. Les données sont écrites dans un dossier temporaire.
+
+    python bench.py                               # scénarios synthétiques
+    python bench.py --updates 5000 --chats 200
+    python bench.py --replay updates.jsonl        # updates Telegram enregistrées (JSON, une par ligne)
+    python bench.py --save base.json              # garde les résultats...
+    python bench.py --compare base.json           # ... et échoue (code 1) en cas de régression
+    python bench.py --only parse,fuzz             # analyse des dates / heures seule (sans Application)
+    python bench.py --only import --import-rows 50000
+    python bench.py --only dispatch               # dispatcher seul, messages hors drunk mode (avant / après filtre)
+    python bench.py --only webhook                # mêmes updates par la file (polling) puis POST au webhook
+    python bench.py --only mixed                  # drunk mode pendant des /ask sur un Mistral lent
+    python bench.py --only calendar               # rappels du jour sur 1M events : planificateur / balayage
+    python bench.py --only memory                 # tracemalloc : events en dicts / en Event (100k / 1M)
+    python bench.py --only journal                # ajout journalisé contre réécriture complète (10k / 100k)
+
+Pour chaque scénario : débit, latence p50 / p99 (update reçue -> première
+réponse du bot à l'API) et mémoire (RSS max, tracemalloc avec --tracemalloc).
+Le fuzz de l'analyse des dates échoue (code 1) à la première incohérence.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+from datetime import date, datetime, timedelta
+from urllib.parse import parse_qsl
+
+BENCH_TOKEN = "123456:bench"
+ANSWER_END = "(fin)"        # dernier token du faux Mistral : marque une réponse /ask complète
+
+
+# =========================
+# MESURE DES LATENCES
+# =========================
+
+class Recorder:
+    """
+    Associe chaque update injectée à la première requête Bot API qu'elle provoque :
+    clé ("chat", chat_id), ("cb", callback_query_id) ou ("ask", chat_id) (réponse complète).
+    """
+
+    def __init__(self):
+        self.pending = {}       # clé -> deque de dates d'injection
+        self.latencies = []
+        self.by_kind = {}       # "chat" / "cb" / "ask" -> latences (scénarios mélangés)
+        self.outstanding = 0
+        self.api_calls = 0
+        self.last_activity = time.perf_counter()
+        self.last_match = None
+
+    def expect(self, key):
+        self.last_activity = time.perf_counter()
+        self.pending.setdefault(key, deque()).append(self.last_activity)
+        self.outstanding += 1
+
+    def _match(self, key):
+        waiting = self.pending.get(key)
+        if not waiting:
+            return
+        self.last_match = time.perf_counter()
+        latency = self.last_match - waiting.popleft()
+        self.latencies.append(latency)
+        self.by_kind.setdefault(key[0], []).append(latency)
+        self.outstanding -= 1
+
+    def missing(self, kind):
+        return sum(len(waiting) for key, waiting in self.pending.items() if key[0] == kind)
+
+    def on_api_call(self, method, params):
+        self.api_calls += 1
+        self.last_activity = time.perf_counter()
+        if method == "answerCallbackQuery":
+            self._match(("cb", str(params.get("callback_query_id"))))
+            return
+        chat_id = params.get("chat_id")
+        if chat_id is None:
+            return
+        chat_id = int(chat_id)
+        if ANSWER_END in (params.get("text") or ""):
+            self._match(("ask", chat_id))
+        self._match(("chat", chat_id))
+
+    async def wait_done(self, app, timeout, settle):
+        """Toutes les réponses reçues, ou plus rien ne bouge depuis `settle` s (updates sans réponse)."""
+        deadline = time.perf_counter() + timeout
+        while self.outstanding and time.perf_counter() < deadline:
+            if app.update_queue.empty() and time.perf_counter() - self.last_activity > settle:
+                break
+            await asyncio.sleep(0.02)
+
+    def reset(self):
+        missing = self.outstanding
+        self.pending.clear()
+        self.latencies = []
+        self.by_kind = {}
+        self.outstanding = 0
+        self.last_match = None
+        return missing
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+# =========================
+# FAUX SERVEURS
+# =========================
+
+def make_fake_servers(bot, recorder, args):
+    """Serveurs HTTP locaux basés sur bot.HttpServer (réponses en flux pour Mistral)."""
+
+    class StreamingHttpServer(bot.HttpServer):
+        @staticmethod
+        async def _respond(writer, status, content_type, payload, close=False):
+            if isinstance(payload, bytes):
+                return await bot.HttpServer._respond(writer, status, content_type, payload, close)
+            writer.write((
+                f"HTTP/1.1 {status} OK\r\n"
+                f"Content-Type: {content_type}\r\n"
+                "Transfer-Encoding: chunked\r\n"
+                f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n"
+            ).encode("latin-1"))
+            async for chunk in payload:
+                writer.write(f"{len(chunk):x}\r\n".encode("latin-1") + chunk + b"\r\n")
+                await writer.drain()
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+
+    message_ids = itertools.count(1_000_000)
+
+    def message(chat_id, text):
+        chat_type = "private" if chat_id > 0 else "supergroup"
+        return {
+            "message_id": next(message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": chat_type},
+            "text": text or "",
+        }
+
+    async def telegram(method, target, headers, body):
+        api_method = target.rsplit("/", 1)[-1]
+        if headers.get("content-type", "").startswith("application/json"):
+            params = json.loads(body or b"{}")
+        else:
+            params = dict(parse_qsl(body.decode("utf-8")))
+        recorder.on_api_call(api_method, params)
+        if args.api_latency:
+            await asyncio.sleep(args.api_latency / 1000)
+
+        if api_method == "getMe":
+            result = {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif api_method in ("sendMessage", "editMessageText"):
+            result = message(int(params.get("chat_id", 0)), params.get("text"))
+        else:
+            result = True
+        return 200, "application/json", json.dumps({"ok": True, "result": result}).encode()
+
+    tokens = ["Les ", "astres ", "disent ", "que ", "oui, ", "sans ", "hésiter. ", ANSWER_END]
+
+    async def mistral(method, target, headers, body):
+        request = json.loads(body or b"{}")
+        await asyncio.sleep(args.mistral_latency / 1000)
+        if not request.get("stream"):
+            await asyncio.sleep(args.mistral_token_ms / 1000 * len(tokens))
+            return 200, "application/json", json.dumps({
+                "id": "bench", "object": "chat.completion", "created": int(time.time()),
+                "model": request.get("model", "bench"),
+                "choices": [{
+                    "index": 0, "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                }],
+                "usage": {"prompt_tokens": 10, "completion_tokens": len(tokens), "total_tokens": 10 + len(tokens)},
+            }).encode()
+
+        async def stream():
+            for i, token in enumerate(tokens):
+                if i:
+                    await asyncio.sleep(args.mistral_token_ms / 1000)
+                chunk = {
+                    "id": "bench", "model": request.get("model", "bench"),
+                    "choices": [{
+                        "index": 0, "delta": {"content": token},
+                        "finish_reason": "stop" if i == len(tokens) - 1 else None,
+                    }],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n".encode()
+            yield b"data: [DONE]\n\n"
+
+        return 200, "text/event-stream", stream()
+
+    return StreamingHttpServer(telegram), StreamingHttpServer(mistral)
+
+
+# =========================
+# UPDATES SYNTHÉTIQUES
+# =========================
+
+class UpdateFactory:
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._callback_ids = itertools.count(1)
+
+    @staticmethod
+    def _user(user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+    def message(self, chat_id, user_id, text):
+        raw = {
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "supergroup", "title": f"Groupe {chat_id}"},
+                "from": self._user(user_id),
+                "text": text,
+            },
+        }
+        if text.startswith("/"):
+            command = text.split(" ", 1)[0]
+            raw["message"]["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        return raw
+
+    def callback(self, user_id, data):
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._callback_ids)),
+                "from": self._user(user_id),
+                "chat_instance": "bench",
+                "data": data,
+                "message": {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "text": "prompt",
+                },
+            },
+        }
+
+
+def expected_key(raw):
+    """Clé de réponse attendue pour une update brute (voir Recorder)."""
+    if "callback_query" in raw:
+        return ("cb", str(raw["callback_query"]["id"]))
+    message = raw.get("message") or raw.get("edited_message") or {}
+    chat_id = message.get("chat", {}).get("id")
+    if chat_id is None:
+        return None
+    if (message.get("text") or "").startswith("/ask "):
+        return ("ask", chat_id)
+    return ("chat", chat_id)
+
+
+def synthetic_scenarios(args):
+    """Liste de (nom, [update brute, ...]) ; ordre = ordre d'exécution."""
+    factory = UpdateFactory()
+    rng = random.Random(args.seed)
+    chats = [-1_000_000_000 - i for i in range(args.chats)]
+    users = [10_000 + i for i in range(args.users)]
+    n = args.updates
+    today = date.today()
+
+    def pick():
+        return rng.choice(chats), rng.choice(users)
+
+    add_bday = []
+    for i in range(n):
+        chat_id, user_id = pick()
+        d = date(2000, 1, 1) + timedelta(days=rng.randrange(366))
+        add_bday.append(factory.message(chat_id, user_id, f"/add_bday Personne{i} {d:%d-%m}"))
+
+    add_event = []
+    for i in range(n):
+        chat_id, user_id = pick()
+        d = today + timedelta(days=rng.randrange(1, 400))
+        add_event.append(factory.message(chat_id, user_id, f"/add_event {d:%d-%m-%Y} Soirée {i}"))
+
+    # Drunk mode : un utilisateur ivre par groupe
+    drunk = [(chat_id, users[k % len(users)]) for k, chat_id in enumerate(chats)]
+    drunk_on = [factory.message(chat_id, user_id, "/drunk_on") for chat_id, user_id in drunk]
+    drunk_messages = []
+    for i in range(n):
+        chat_id, user_id = drunk[i % len(drunk)]
+        drunk_messages.append(factory.message(chat_id, user_id, f"message un peu arrosé n°{i}"))
+    drunk_callbacks = [factory.callback(user_id, f"confirm|{chat_id}|{user_id}") for chat_id, user_id in drunk]
+
+    # /ask : une partie des questions revient (cache, coalescing)
+    ask = []
+    for i in range(n):
+        chat_id, user_id = pick()
+        ask.append(factory.message(chat_id, user_id, f"/ask Question n°{rng.randrange(args.questions)} ?"))
+
+    return [
+        ("add_bday", add_bday),
+        ("add_event", add_event),
+        ("drunk_on", drunk_on),
+        ("drunk_message", drunk_messages),
+        ("drunk_callback", drunk_callbacks),
+        ("ask", ask),
+    ]
+
+
+def replay_scenario(path):
+    with open(path, "r", encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    return [("replay", updates)]
+
+
+# =========================
+# EXÉCUTION
+# =========================
+
+def memory():
+    """RSS max du process (Mo) et, si actif, mémoire tracée par tracemalloc (Mo)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024     # Ko sous Linux
+    result = {"max_rss_mb": round(rss, 1)}
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        result["traced_mb"] = round(current / 2**20, 1)
+        result["traced_peak_mb"] = round(peak / 2**20, 1)
+    return result
+
+
+async def run_updates(bot_module, app, recorder, name, updates, args):
+    from telegram import Update
+
+    started = time.perf_counter()
+    for i, raw in enumerate(updates):
+        key = expected_key(raw)
+        if key is not None:
+            recorder.expect(key)
+        await app.update_queue.put(Update.de_json(raw, app.bot))
+        if args.rate:
+            await asyncio.sleep(max(0.0, started + (i + 1) / args.rate - time.perf_counter()))
+    await recorder.wait_done(app, args.timeout, args.settle)
+    # Débit jusqu'à la dernière réponse (l'attente des updates sans réponse ne compte pas)
+    elapsed = (recorder.last_match or time.perf_counter()) - started
+    return summarize(name, len(updates), elapsed, recorder)
+
+
+def summarize(name, count, elapsed, recorder, kind=None):
+    """kind : seulement les réponses de ce type (le recorder n'est alors pas remis à zéro)."""
+    latencies = recorder.latencies if kind is None else recorder.by_kind.get(kind, [])
+    result = {
+        "count": count,
+        "seconds": round(elapsed, 3),
+        "per_second": round(count / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 2),
+        "missing": recorder.reset() if kind is None else recorder.missing(kind),
+        **memory(),
+    }
+    print_result(name, result)
+    return result
+
+
+def _job_result(name, count, elapsed):
+    result = {
+        "count": count,
+        "seconds": round(elapsed, 3),
+        "per_second": round(count / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0, "missing": 0,
+        **memory(),
+    }
+    print_result(name, result)
+    return result
+
+
+async def run_mixed(bot_module, app, recorder, args):
+    """
+    drunk_message_filter pendant des /ask sur un Mistral lent (--slow-mistral-latency) :
+    le même flux de messages drunk mode (--mixed-rate updates/s) seul, puis avec un /ask
+    toutes les 25 updates (2/s par défaut : sous la capacité de MISTRAL_MAX_CONCURRENCY,
+    pas de timeout). Les /ask sont posés dans d'autres groupes : seules les réponses
+    aux messages drunk comptent pour mixed_drunk_*.
+    """
+    from telegram import Update
+
+    factory = UpdateFactory()
+    drunk = [(-5_000_000_000 - k, 20_000 + k) for k in range(max(args.chats, 1))]
+    ask_chats = [-5_500_000_000 - k for k in range(max(args.chats, 1))]
+    for key in drunk:
+        bot_module.set_drunk(key, None)
+
+    async def inject(updates):
+        started = time.perf_counter()
+        for i, raw in enumerate(updates):
+            recorder.expect(expected_key(raw))
+            await app.update_queue.put(Update.de_json(raw, app.bot))
+            await asyncio.sleep(max(0.0, started + (i + 1) / args.mixed_rate - time.perf_counter()))
+        await recorder.wait_done(app, args.timeout, args.settle)
+        return (recorder.last_match or time.perf_counter()) - started
+
+    count = max(args.updates // 4, 1)
+    results = {}
+    alone = [
+        factory.message(*drunk[i % len(drunk)], f"message seul n°{i}") for i in range(count)
+    ]
+    elapsed = await inject(alone)
+    results["mixed_drunk_alone"] = summarize("mixed_drunk_alone", count, elapsed, recorder)
+
+    mixed, asks = [], 0
+    for i in range(count):
+        mixed.append(factory.message(*drunk[i % len(drunk)], f"message avec /ask n°{i}"))
+        if i % 25 == 0:
+            # Questions toutes différentes : pas de cache ni de coalescing, chaque /ask attend Mistral
+            mixed.append(factory.message(ask_chats[asks % len(ask_chats)], 30_000 + asks, f"/ask Question lente {asks} ?"))
+            asks += 1
+    latency, args.mistral_latency = args.mistral_latency, args.slow_mistral_latency
+    try:
+        elapsed = await inject(mixed)
+    finally:
+        args.mistral_latency = latency
+    results["mixed_drunk_ask"] = summarize("mixed_drunk_ask", count, elapsed, recorder, kind="chat")
+    results["mixed_ask"] = summarize("mixed_ask", asks, elapsed, recorder, kind="ask")
+    recorder.reset()
+
+    for key in drunk:
+        bot_module.clear_drunk(key)
+    alone_p99, ask_p99 = results["mixed_drunk_alone"]["p99_ms"], results["mixed_drunk_ask"]["p99_ms"]
+    print(f"   p99 drunk_message_filter : {alone_p99:.2f}ms seul, {ask_p99:.2f}ms avec /ask en cours")
+    return results
+
+
+async def run_dispatch(bot_module, app, args):
+    """
+    Dispatcher seul (app.process_update, sans file ni réseau) sur des messages de groupe
+    d'utilisateurs qui ne sont pas en drunk mode : handler drunk_message_filter avec
+    l'ancien filtre (texte de groupe : le handler tourne pour rien), puis avec DRUNK_USER.
+    """
+    from telegram import Update
+    from telegram.ext import MessageHandler, filters
+
+    factory = UpdateFactory()
+    count = max(args.updates, 1) * 5
+    updates = [
+        Update.de_json(factory.message(-8_000_000_000 - i % 100, 40_000 + i % 500, f"message sobre n°{i}"), app.bot)
+        for i in range(count)
+    ]
+    handler = next(
+        h for group in app.handlers.values() for h in group
+        if isinstance(h, MessageHandler)
+        and getattr(h.callback, "__wrapped__", h.callback) is bot_module.drunk_message_filter
+    )
+
+    async def measure(name):
+        latencies = []
+        started = time.perf_counter()
+        for update in updates:
+            t0 = time.perf_counter()
+            await app.process_update(update)
+            latencies.append(time.perf_counter() - t0)
+        return _latency_result(name, latencies, time.perf_counter() - started)
+
+    results = {}
+    current = handler.filters
+    handler.filters = filters.TEXT & ~filters.COMMAND & filters.ChatType.GROUPS
+    try:
+        results["dispatch_before"] = await measure("dispatch_before")
+    finally:
+        handler.filters = current
+    results["dispatch_after"] = await measure("dispatch_after")
+    before, after = results["dispatch_before"], results["dispatch_after"]
+    print(
+        f"   par message : {before['seconds'] / count * 1e6:.1f}µs -> {after['seconds'] / count * 1e6:.1f}µs "
+        f"(p99 {before['p99_ms'] * 1000:.1f}µs -> {after['p99_ms'] * 1000:.1f}µs)"
+    )
+    return results
+
+
+async def run_webhook(bot_module, app, recorder, args):
+    """
+    Mêmes messages drunk mode à --webhook-rate updates/s (0 = au plus vite) : poussés
+    directement dans app.update_queue (ce que fait le polling après getUpdates), puis
+    POSTés en JSON à WebhookReceiver derrière bot.HttpServer (secret vérifié, file bornée,
+    --webhook-connections connexions keep-alive comme Telegram). Latence de bout en bout :
+    POST / mise en file -> première réponse du bot à l'API.
+    """
+    import httpx
+    from telegram import Update
+
+    factory = UpdateFactory()
+    drunk = [(-9_000_000_000 - k, 50_000 + k) for k in range(max(args.chats, 1))]
+    for key in drunk:
+        bot_module.set_drunk(key, None)
+    count = max(args.updates // 4, 1)
+    secret = "bench-secret"
+    receiver = bot_module.WebhookReceiver(app, "/telegram", secret=secret, backpressure="wait")
+    server = bot_module.HttpServer(receiver.handle)
+    port = await server.start("127.0.0.1", 0)
+    url = f"http://127.0.0.1:{port}/telegram"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret, "Content-Type": "application/json"}
+
+    results = {}
+    errors = 0
+    try:
+        limits = httpx.Limits(max_connections=args.webhook_connections)
+        async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+            async def post(raw):
+                nonlocal errors
+                response = await client.post(url, content=json.dumps(raw).encode(), headers=headers)
+                if response.status_code != 200:
+                    errors += 1
+
+            for name in ("webhook_queue", "webhook"):
+                posts = []
+                started = time.perf_counter()
+                for i in range(count):
+                    raw = factory.message(*drunk[i % len(drunk)], f"message {name} n°{i}")
+                    recorder.expect(expected_key(raw))
+                    if name == "webhook":
+                        posts.append(asyncio.create_task(post(raw)))
+                    else:
+                        await app.update_queue.put(Update.de_json(raw, app.bot))
+                    if args.webhook_rate:
+                        await asyncio.sleep(max(0.0, started + (i + 1) / args.webhook_rate - time.perf_counter()))
+                    else:
+                        await asyncio.sleep(0)
+                await asyncio.gather(*posts)
+                await recorder.wait_done(app, args.timeout, args.settle)
+                elapsed = (recorder.last_match or time.perf_counter()) - started
+                results[name] = summarize(name, count, elapsed, recorder)
+    finally:
+        await server.stop()
+        for key in drunk:
+            bot_module.clear_drunk(key)
+    results["webhook"]["failures"] = errors
+    if errors:
+        print(f"❌ webhook : {errors} POST refusé(s) ({receiver.rejected} file pleine)")
+    return results
+
+
+async def run_reminders(bot_module, app, recorder, args):
+    """
+    Rappels dus dans chaque groupe (J-1, J-7, H-1) : un réveil du planificateur mesuré,
+    puis un réveil à vide.
+    """
+    for k in range(args.chats):
+        chat_id = -2_000_000_000 - k
+        local_now = datetime.now(bot_module.chat_tz(chat_id))
+        today = local_now.date()
+        for delta in (1, 7):
+            d = today + timedelta(days=delta)
+            bot_module.add_event_record(chat_id, bot_module.EventType.BIRTHDAY, f"@r{k}", f"Anniv r{k}", d.day, d.month)
+            bot_module.add_event_record(chat_id, bot_module.EventType.EVENT, None, f"Soirée r{k}", d.day, d.month, d.year)
+        # Dans moins d'une heure (même jour) : le rappel H-1 est dû
+        if local_now.hour < 23:
+            bot_module.add_event_record(
+                chat_id, bot_module.EventType.EVENT, None, f"Apéro r{k}", today.day, today.month, today.year,
+                time_of_day=local_now.hour * 60 + local_now.minute + 30, reminders=("H-1",),
+            )
+
+    results = {}
+    for name in ("reminders", "reminders_idle"):
+        calls = recorder.api_calls
+        started = time.perf_counter()
+        await bot_module.send_due_reminders()
+        elapsed = time.perf_counter() - started
+        results[name] = _job_result(name, recorder.api_calls - calls, elapsed)
+    return results
+
+
+async def run_startup_load(bot_module, args):
+    """
+    Démarrage avec --load-events events à venir (anniversaires, soirées avec heure et
+    rappels H-n, un quart hebdomadaires, plus un anniversaire au 31-02 d'une ancienne version) :
+    load_data (stockage ; index calendrier et tas des rappels attendent le premier besoin),
+    puis le tas des rappels seul (coût du premier réveil).
+    """
+    rng = random.Random(args.seed)
+    today = date.today()
+    EventType = bot_module.EventType
+    for i in range(args.load_events):
+        chat_id = -3_000_000_000 - i % max(args.chats, 1)
+        d = today + timedelta(days=rng.randint(1, 365))
+        if i % 2:
+            event = bot_module.Event(chat_id, EventType.BIRTHDAY, f"Anniv l{i}", d.day, d.month, display=f"l{i}")
+        else:
+            event = bot_module.Event(
+                chat_id, EventType.EVENT, f"Soirée l{i}", d.day, d.month, d.year,
+                time_of_day=rng.randrange(0, 24 * 60, 15), reminders=("J-1", "H-2"),
+                rule=f"weekly:{d.weekday()}" if i % 4 == 0 else None,
+            )
+        bot_module.WRITER.submit(bot_module.STORAGE.add(event))
+    # Date impossible acceptée par les anciennes versions de /add_bday : doit se charger sans erreur
+    legacy = bot_module.Event(-3_000_000_000, EventType.BIRTHDAY, "Anniv 31-02", 31, 2, display="legacy")
+    bot_module.WRITER.submit(bot_module.STORAGE.add(legacy))
+    await bot_module.WRITER.flush()
+    bot_module.STORAGE.save()
+
+    results = {}
+    started = time.perf_counter()
+    bot_module.load_data()
+    results["startup_load"] = _job_result("startup_load", len(bot_module.STORAGE), time.perf_counter() - started)
+    started = time.perf_counter()
+    bot_module.REMINDERS.load(bot_module.STORAGE.items())
+    results["reminders_load"] = _job_result("reminders_load", len(bot_module.REMINDERS), time.perf_counter() - started)
+    return results
+
+
+def _latency_result(name, latencies, elapsed):
+    result = {
+        "count": len(latencies),
+        "seconds": round(elapsed, 3),
+        "per_second": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 3),
+        "missing": 0,
+        **memory(),
+    }
+    print_result(name, result)
+    return result
+
+
+def run_journal(bot_module, args):
+    """
+    Coût d'un ajout d'event avec --journal-sizes events déjà stockés (--journal-adds ajouts,
+    un lot WRITER chacun) : une ligne de journal + fsync, contre la réécriture complète de
+    l'ancien save_data (json.dump indent=2 de tous les events, sans fsync). Puis une
+    compaction (snapshot complet, faite en arrière-plan par le bot).
+    """
+    EventType = bot_module.EventType
+    today = date.today()
+
+    def make_event(i):
+        d = today + timedelta(days=1 + i % 365)
+        if i % 2:
+            return bot_module.Event(-6_000_000_000 - i % 100, EventType.BIRTHDAY, f"Anniv j{i}", d.day, d.month, display=f"j{i}")
+        return bot_module.Event(-6_000_000_000 - i % 100, EventType.EVENT, f"Soirée j{i}", d.day, d.month, d.year)
+
+    results = {}
+    for size in (int(n) for n in args.journal_sizes.split(",")):
+        label = f"{size // 1000}k" if size >= 1000 else str(size)
+        storage = bot_module.JsonStorage(
+            f"journal_{label}.json", f"journal_{label}.journal",
+            fsync_every=bot_module.JOURNAL_FSYNC_EVERY, compact_every=10**9,
+        )
+        for i in range(size):
+            storage.add(make_event(i))
+        storage.save()
+
+        latencies = []
+        started = time.perf_counter()
+        for i in range(size, size + args.journal_adds):
+            t0 = time.perf_counter()
+            storage.write([storage.add(make_event(i))])
+            latencies.append(time.perf_counter() - t0)
+        results[f"journal_append_{label}"] = _latency_result(f"journal_append_{label}", latencies, time.perf_counter() - started)
+
+        # Ancien chemin : DATA["events"] (dicts) réécrit en entier à chaque ajout
+        data = {"events": [e.to_dict() for e in storage.events]}
+        latencies = []
+        started = time.perf_counter()
+        for i in range(size, size + args.journal_adds):
+            t0 = time.perf_counter()
+            data["events"].append(make_event(i).to_dict())
+            with open(f"rewrite_{label}.json", "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            latencies.append(time.perf_counter() - t0)
+        results[f"full_rewrite_{label}"] = _latency_result(f"full_rewrite_{label}", latencies, time.perf_counter() - started)
+        del data
+
+        started = time.perf_counter()
+        storage.save()
+        results[f"compaction_{label}"] = _job_result(f"compaction_{label}", len(storage), time.perf_counter() - started)
+        storage.close()
+    return results
+
+
+def run_memory(bot_module, args):
+    """
+    Mémoire tracée (tracemalloc) des events chargés, pour chaque taille de --memory-sizes :
+    le même snapshot JSON décodé en dicts (l'ancien DATA["events"]) puis en Event
+    (__slots__, types et entiers partagés) comme JsonStorage.load pour un snapshot de l'ancien format.
+    """
+    today = date.today()
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    results = {}
+    try:
+        for size in (int(n) for n in args.memory_sizes.split(",")):
+            label = f"{size // 1000}k" if size >= 1000 else str(size)
+            events = []
+            for i in range(size):
+                d = today + timedelta(days=1 + i % 365)
+                chat_id = -10_000_000_000 - i % 1000
+                if i % 2:
+                    events.append({
+                        "chat_id": chat_id, "type": "birthday", "username": f"@m{i}", "title": f"Anniv m{i}",
+                        "day": d.day, "month": d.month, "year": None, "display": f"m{i}",
+                    })
+                else:
+                    events.append({
+                        "chat_id": chat_id, "type": "event", "username": None, "title": f"Soirée m{i}",
+                        "day": d.day, "month": d.month, "year": d.year, "time": "20:30", "reminders": ["J-1", "H-2"],
+                    })
+            text = json.dumps({"seq": 0, "events": events}, ensure_ascii=False)
+            del events
+
+            per_event = {}
+            for name, hook in (("dicts", None), ("events", bot_module._event_hook)):
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                started = time.perf_counter()
+                loaded = json.loads(text, object_hook=hook)["events"]
+                elapsed = time.perf_counter() - started
+                current, peak = tracemalloc.get_traced_memory()
+                result = {
+                    "count": len(loaded),
+                    "seconds": round(elapsed, 3),
+                    "per_second": round(len(loaded) / elapsed, 1) if elapsed else 0.0,
+                    "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0, "missing": 0,
+                    "max_rss_mb": memory()["max_rss_mb"],
+                    "traced_mb": round((current - before) / 2**20, 1),
+                    "traced_peak_mb": round((peak - before) / 2**20, 1),
+                }
+                per_event[name] = (current - before) / len(loaded)
+                del loaded
+                results[f"memory_{name}_{label}"] = result
+                print_result(f"memory_{name}_{label}", result)
+            del text
+            print(f"   {label} : {per_event['dicts']:.0f} octets/event en dicts, {per_event['events']:.0f} en Event")
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+    return results
+
+
+def run_calendar(bot_module, args):
+    """
+    Rappels du jour avec --index-events events (1M) : un réveil du planificateur (tas
+    d'échéances : seuls les events dont un rappel approche ressortent) contre le balayage
+    linéaire de l'ancien daily_reminder (date de chaque event recalculée, J-7 / J-1 gardés).
+    """
+    rng = random.Random(args.seed)
+    EventType = bot_module.EventType
+    today = date.today()
+    keyed = []
+    for i in range(args.index_events):
+        chat_id = -7_000_000_000 - i % 1000
+        d = today + timedelta(days=rng.randint(1, 365))
+        if i % 2:
+            if (d.day, d.month) == (29, 2):
+                d -= timedelta(days=1)      # l'ancien balayage levait ValueError les années non bissextiles
+            event = bot_module.Event(chat_id, EventType.BIRTHDAY, f"Anniv c{i}", d.day, d.month, display=f"c{i}")
+        else:
+            event = bot_module.Event(chat_id, EventType.EVENT, f"Soirée c{i}", d.day, d.month, d.year)
+        keyed.append((f"c{i}", event))
+    events = dict(keyed)
+
+    results = {}
+    now = time.time()
+    scheduler = bot_module.ReminderScheduler()      # sans JobQueue : rien n'est armé
+    started = time.perf_counter()
+    scheduler.load(keyed, now)
+    results["calendar_load"] = _job_result("calendar_load", len(scheduler), time.perf_counter() - started)
+
+    def wake(name, at):
+        """Même travail que send_due_reminders, envoi en moins ; renvoie (examinés, dus)."""
+        started = time.perf_counter()
+        popped = due = 0
+        for key in scheduler.pop_due(at):
+            popped += 1
+            reminders, later = bot_module.plan_reminders(events[key], key, at)
+            due += len(reminders)
+            if later is not None:
+                scheduler.schedule(key, later)
+        scheduler.rearm()
+        results[name] = _job_result(name, popped, time.perf_counter() - started)
+        return popped, due
+
+    # Premier réveil : les bornes basses du chargement ressortent toutes (quelques jours d'avance)
+    wake("calendar_wake", now)
+    # Régime établi : les échéances sont exactes, un jour de rappels ressort
+    popped, due = wake("calendar_wake_day", now + 86400)
+
+    started = time.perf_counter()
+    found = 0
+    for _, e in keyed:
+        if e.type is EventType.BIRTHDAY:
+            evt_date = date(today.year, e.month, e.day)
+            if evt_date < today:
+                evt_date = date(today.year + 1, e.month, e.day)
+        else:
+            if not e.year:
+                continue
+            evt_date = date(e.year, e.month, e.day)
+        if (evt_date - today).days in (7, 1):
+            found += 1
+    results["calendar_scan"] = _job_result("calendar_scan", len(keyed), time.perf_counter() - started)
+    print(
+        f"   {len(keyed)} events : une journée de réveils {results['calendar_wake_day']['seconds']}s "
+        f"({popped} examinés, {due} rappels dus), balayage {results['calendar_scan']['seconds']}s "
+        f"({found} à J-7 / J-1)"
+    )
+    return results
+
+
+async def run_import_export(bot_module, args):
+    """
+    /import d'un CSV de --import-rows lignes dans un groupe (lecture + insertion + écriture
+    disque, qui doit tenir en un seul lot de WRITER), puis /export de ce groupe en ICS.
+    """
+    chat_id = -4_000_000_000
+    tz = bot_module.chat_tz(chat_id)
+    today = date.today()
+    with tempfile.TemporaryFile() as f:
+        f.write("type,nom,date,heure,rappels\n".encode())
+        for i in range(args.import_rows):
+            d = today + timedelta(days=1 + i % 365)
+            if i % 2:
+                line = f"anniv,Ami {i},{d:%d-%m},,\n"
+            elif i % 4 == 0:
+                line = f"event,Soirée {i},tous les {bot_module.WEEKDAY_NAMES[d.weekday()]}s,20h,J-1 H-2\n"
+            else:
+                line = f"event,Soirée {i},{d:%d-%m-%Y},19h30,\n"
+            f.write(line.encode())
+        f.seek(0)
+
+        results = {}
+        batches = bot_module.WRITER.batches
+        started = time.perf_counter()
+        events, errors = await asyncio.to_thread(bot_module.read_import, f, chat_id, tz, "csv")
+        durable, _replaced = bot_module.add_event_records(events)
+        await durable
+        results["import"] = _job_result("import", len(events), time.perf_counter() - started)
+        results["import"]["failures"] = errors.count
+        results["import"]["batches"] = bot_module.WRITER.batches - batches
+        if errors.count or results["import"]["batches"] != 1:
+            print(f"❌ import : {errors.count} ligne(s) rejetée(s), {results['import']['batches']} lot(s) écrit(s)")
+
+    with tempfile.TemporaryFile() as f:
+        started = time.perf_counter()
+        count = await asyncio.to_thread(bot_module.write_ics, f, chat_id, tz)
+        results["export"] = _job_result("export", count, time.perf_counter() - started)
+    return results
+
+
+def print_result(name, r):
+    mem = f"rss max {r['max_rss_mb']} Mo"
+    if "traced_mb" in r:
+        mem += f", tracé {r['traced_mb']} Mo (pic {r['traced_peak_mb']} Mo)"
+    print(
+        f"{name:<20} {r['count']:>7} en {r['seconds']:>7.3f}s  {r['per_second']:>9.1f}/s  "
+        f"p50 {r['p50_ms']:>8.2f}ms  p99 {r['p99_ms']:>8.2f}ms  max {r['max_ms']:>8.2f}ms  "
+        f"sans réponse {r['missing']:>4}  {mem}"
+    )
+
+
+# =========================
+# ANALYSE DES DATES / HEURES
+# =========================
+
+PARSE_SAMPLES = [
+    "14-02-2026 Soirée raclette",
+    "14/02 Soirée raclette",
+    "demain à 20h Resto",
+    "samedi prochain 19h30 Jeux",
+    "15 février 2027 Fondue",
+    "1er mars Apéro",
+    "dans 3 semaines Ciné",
+    "après-demain vers 18:45 Foot",
+    "tous les jeudis 20h Soirée jeux",
+    "premier vendredi du mois à 19h Apéro",
+    "14-02 tous les ans Saint-Valentin",
+    "Soirée sans date",
+]
+BDAY_SAMPLES = ["Satya IV le baiseur 15-02", "@satya 15/02", "Jean Paul 1er mars", "Al 29 février 1992", "Bob"]
+
+FUZZ_WORDS = [
+    "demain", "Demain", "après-demain", "aujourd'hui", "samedi", "lundi", "prochain", "prochaine",
+    "dans", "jours", "semaine", "à", "a", "vers", "le", "er", "1er", "février", "fevrier", "mars",
+    "août", "décembre", "Soirée", "@satya", "h", "20h", "20h30", "24h", "7h05", "23:59", "19:60",
+    "2026", "1990", "0", "-", "/", "",
+    "tous", "les", "chaque", "premier", "dernier", "2e", "jeudis", "du", "mois", "ans", "année",
+]
+
+
+def run_parse(bot_module, args):
+    """Coût d'un appel aux parseurs de /add_event et /add_bday, sur des entrées typiques."""
+    today = date.today()
+    event_inputs = [text.split() for text in PARSE_SAMPLES]
+    bday_inputs = [text.split() for text in BDAY_SAMPLES]
+    latencies = []
+    count = max(args.updates, len(event_inputs))
+    started = time.perf_counter()
+    for i in range(count):
+        tokens = event_inputs[i % len(event_inputs)]
+        t0 = time.perf_counter()
+        bot_module.parse_when(tokens, today)
+        bot_module.parse_day_month_suffix(bday_inputs[i % len(bday_inputs)])
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    result = {
+        "count": count,
+        "seconds": round(elapsed, 3),
+        "per_second": round(count / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 4),
+        "max_ms": round(max(latencies) * 1000, 4),
+        "missing": 0,
+        **memory(),
+    }
+    print_result("parse", result)
+    return result
+
+
+def _random_token(rng):
+    kind = rng.random()
+    if kind < 0.5:
+        return rng.choice(FUZZ_WORDS)
+    if kind < 0.8:
+        sep = rng.choice("-/.")
+        parts = [str(rng.randint(0, 40)), str(rng.randint(0, 14))]
+        if rng.random() < 0.5:
+            parts.append(str(rng.choice([rng.randint(0, 99), rng.randint(1900, 2100)])))
+        return sep.join(parts)
+    return str(rng.randint(0, 99)) + rng.choice(["", "h", "er", ":", "h5", ":07"])
+
+
+def _fuzz_one(bot_module, tokens, today):
+    """Invariants des parseurs ; renvoie la description de l'écart, ou None."""
+    try:
+        d, minutes, n = bot_module.parse_date_prefix(tokens, today)
+    except ValueError:
+        pass
+    else:
+        if d is None:
+            if minutes is not None or n:
+                return f"parse_date_prefix {tokens!r} : pas de date mais {minutes!r}, {n}"
+        else:
+            if not 0 < n <= len(tokens):
+                return f"parse_date_prefix {tokens!r} : {n} tokens lus"
+            if minutes is not None and not 0 <= minutes < 24 * 60:
+                return f"parse_date_prefix {tokens!r} : heure {minutes}"
+            # Ce qu'on affiche doit se relire pareil
+            again, _, m = bot_module.parse_date_prefix([d.strftime("%d-%m-%Y")], today)
+            if again != d or m != 1:
+                return f"parse_date_prefix {tokens!r} : {d} relu {again}"
+
+    try:
+        d, minutes, rule, n = bot_module.parse_when(tokens, today)
+    except ValueError:
+        pass
+    else:
+        if rule is not None:
+            if not 0 < n <= len(tokens):
+                return f"parse_when {tokens!r} : {n} tokens lus"
+            # La première date doit appartenir à la série de la règle
+            probe = bot_module.Event(0, "event", "x", d.day, d.month, d.year, rule=rule)
+            if bot_module.next_occurrence(probe, d) != d or (rule != "yearly" and d < today):
+                return f"parse_when {tokens!r} : {d} hors de la règle {rule}"
+
+    try:
+        day, month, n = bot_module.parse_day_month_suffix(tokens)
+    except ValueError:
+        return None
+    if day is None:
+        return f"parse_day_month_suffix {tokens!r} : {month!r}, {n}" if month is not None or n else None
+    if not 0 < n <= len(tokens):
+        return f"parse_day_month_suffix {tokens!r} : {n} tokens lus"
+    try:
+        date(2000, month, day)
+    except ValueError:
+        return f"parse_day_month_suffix {tokens!r} : {day}-{month} invalide"
+    if bot_module.parse_day_month_suffix([f"{day:02d}-{month:02d}"])[:2] != (day, month):
+        return f"parse_day_month_suffix {tokens!r} : {day}-{month} ne se relit pas"
+    return None
+
+
+def run_fuzz(bot_module, args):
+    """Suites de tokens aléatoires : seul ValueError est permis, et les résultats doivent être cohérents."""
+    rng = random.Random(args.seed)
+    today = date.today()
+    failures = []
+    count = max(args.updates, 1) * 10
+    started = time.perf_counter()
+    for _ in range(count):
+        tokens = [_random_token(rng) for _ in range(rng.randint(0, 5))]
+        try:
+            failure = _fuzz_one(bot_module, tokens, today)
+        except Exception as exc:
+            failure = f"{tokens!r} : {type(exc).__name__} {exc}"
+        if failure:
+            failures.append(failure)
+    elapsed = time.perf_counter() - started
+    for failure in failures[:20]:
+        print(f"❌ {failure}")
+    result = {
+        "count": count,
+        "seconds": round(elapsed, 3),
+        "per_second": round(count / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0,
+        "missing": 0,
+        "failures": len(failures),
+        **memory(),
+    }
+    print_result("fuzz", result)
+    return result
+
+
+async def bench(args):
+    import bot
+    from mistralai.async_client import MistralAsyncClient
+
+    only = set(args.only.split(",")) if args.only else None
+    results = {}
+    if not args.replay:
+        for name, run in (("parse", run_parse), ("fuzz", run_fuzz)):
+            if only is None or name in only:
+                results[name] = run(bot, args)
+        if only is None or "journal" in only:
+            results.update(run_journal(bot, args))
+        if only is None or "memory" in only:
+            results.update(run_memory(bot, args))
+        if only is not None and only <= {"parse", "fuzz", "journal", "memory"}:
+            return results
+
+    recorder = Recorder()
+    telegram_server, mistral_server = make_fake_servers(bot, recorder, args)
+    telegram_port = await telegram_server.start("127.0.0.1", 0)
+    mistral_port = await mistral_server.start("127.0.0.1", 0)
+    bot.mistral = MistralAsyncClient(
+        api_key="bench", endpoint=f"http://127.0.0.1:{mistral_port}",
+        timeout=bot.MISTRAL_TIMEOUT, max_retries=1,
+    )
+    if not args.telegram_limits:
+        # On mesure le code du bot, pas les limites anti-flood de Telegram
+        bot.SENDER.private_rate = bot.SENDER.group_rate = 1e6
+
+    bot.load_data()
+    bot.load_state()
+    bot.load_drunk_state()
+
+    app = bot.build_application(base_url=f"http://127.0.0.1:{telegram_port}/bot")
+    await app.initialize()
+    await app.post_init(app)
+    await app.start()
+
+    if args.replay:
+        scenarios = replay_scenario(args.replay)
+    else:
+        scenarios = synthetic_scenarios(args)
+
+    try:
+        if not args.replay and (only is None or "dispatch" in only):
+            results.update(await run_dispatch(bot, app, args))
+        for name, updates in scenarios:
+            if only is None or name in only:
+                results[name] = await run_updates(bot, app, recorder, name, updates, args)
+        if not args.replay and (only is None or "mixed" in only):
+            results.update(await run_mixed(bot, app, recorder, args))
+        if not args.replay and (only is None or "webhook" in only):
+            results.update(await run_webhook(bot, app, recorder, args))
+        if not args.replay and (only is None or "reminders" in only):
+            results.update(await run_reminders(bot, app, recorder, args))
+        if not args.replay and (only is None or "import" in only):
+            results.update(await run_import_export(bot, args))
+        if not args.replay and (only is None or "startup_load" in only):
+            results.update(await run_startup_load(bot, args))
+        if not args.replay and (only is None or "calendar" in only):
+            results.update(run_calendar(bot, args))
+    finally:
+        await app.stop()
+        await app.post_stop(app)
+        await app.shutdown()
+        await app.post_shutdown(app)
+        await bot.mistral.close()
+        await telegram_server.stop()
+        await mistral_server.stop()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Régression : débit en baisse ou p99 en hausse de plus de `tolerance` (p99 : au moins 2 ms)."""
+    regressions = []
+    for name, base in baseline.items():
+        current = results.get(name)
+        if current is None:
+            continue
+        if base["per_second"] and current["per_second"] < base["per_second"] * (1 - tolerance):
+            regressions.append(f"{name} : débit {base['per_second']}/s -> {current['per_second']}/s")
+        if current["p99_ms"] > max(base["p99_ms"] * (1 + tolerance), base["p99_ms"] + 2):
+            regressions.append(f"{name} : p99 {base['p99_ms']}ms -> {current['p99_ms']}ms")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Banc d'essai hors ligne de bot.py")
+    parser.add_argument("--updates", type=int, default=2000, help="updates par scénario")
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--load-events", type=int, default=100_000, help="events chargés par startup_load")
+    parser.add_argument("--index-events", type=int, default=1_000_000, help="events du scénario calendar")
+    parser.add_argument("--memory-sizes", default="100000,1000000", help="events décodés, scénario memory")
+    parser.add_argument("--journal-sizes", default="10000,100000", help="events déjà stockés, scénario journal")
+    parser.add_argument("--journal-adds", type=int, default=20, help="ajouts mesurés par taille, scénario journal")
+    parser.add_argument("--import-rows", type=int, default=20_000, help="lignes du CSV importé par le scénario import")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--questions", type=int, default=200, help="questions /ask distinctes")
+    parser.add_argument("--rate", type=float, default=0, help="updates / seconde (0 = au plus vite)")
+    parser.add_argument("--only", help="scénarios à lancer, séparés par des virgules")
+    parser.add_argument("--replay", help="fichier JSON lines d'updates Telegram à rejouer")
+    parser.add_argument("--api-latency", type=float, default=0, help="latence du faux Bot API (ms)")
+    parser.add_argument("--mistral-latency", type=float, default=50, help="délai avant le premier token (ms)")
+    parser.add_argument("--mistral-token-ms", type=float, default=5, help="délai entre tokens (ms)")
+    parser.add_argument("--slow-mistral-latency", type=float, default=1000, help="délai avant le premier token, scénario mixed (ms)")
+    parser.add_argument("--mixed-rate", type=float, default=50, help="updates / seconde du scénario mixed")
+    parser.add_argument("--webhook-rate", type=float, default=100, help="updates / seconde du scénario webhook (0 = au plus vite)")
+    parser.add_argument("--webhook-connections", type=int, default=40, help="connexions HTTP simultanées vers le webhook")
+    parser.add_argument("--telegram-limits", action="store_true", help="garder les limites d'envoi par chat")
+    parser.add_argument("--timeout", type=float, default=120, help="attente max des réponses par scénario (s)")
+    parser.add_argument("--settle", type=float, default=2, help="inactivité au bout de laquelle on n'attend plus (s)")
+    parser.add_argument("--tracemalloc", action="store_true", help="mémoire tracée (plus lent)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="écrit les résultats (JSON)")
+    parser.add_argument("--compare", help="résultats de référence (JSON) : code 1 si régression")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    if args.replay:
+        args.replay = os.path.abspath(args.replay)
+    for option in ("save", "compare"):
+        if getattr(args, option):
+            setattr(args, option, os.path.abspath(getattr(args, option)))
+
+    # Configuration lue par bot.py à l'import
+    os.environ.setdefault("BOT_TOKEN", BENCH_TOKEN)
+    os.environ.setdefault("MISTRAL_API_KEY", "bench")
+    os.environ["BOT_MODE"] = "polling"
+    os.environ["METRICS_PORT"] = "0"
+    os.environ["REMINDER_HOUR"] = "0"
+    os.environ["REMINDER_WINDOW_MINUTES"] = "0"
+    os.environ.setdefault("SEND_GLOBAL_RATE", "1000000")
+    for quota in ("ASK_QUOTA_USER_PER_HOUR", "ASK_QUOTA_CHAT_PER_HOUR", "ASK_QUOTA_GLOBAL_PER_MINUTE"):
+        os.environ.setdefault(quota, "1000000")
+
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    with tempfile.TemporaryDirectory(prefix="bot-bench-") as workdir:
+        os.chdir(workdir)   # bot.py écrit ses fichiers dans le dossier courant
+        results = asyncio.run(bench(args))
+
+    if results.get("fuzz", {}).get("failures"):
+        sys.exit(1)
+    if results.get("import", {}).get("failures") or results.get("import", {}).get("batches", 1) != 1:
+        sys.exit(1)
+    if results.get("webhook", {}).get("failures"):
+        sys.exit(1)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"❌ {line}")
+        if regressions:
+            sys.exit(1)
+        print("✅ Pas de régression.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,43 @@
+import asyncio
+import bisect
+import csv
+import enum
+import functools
+import glob
+import hashlib
+import heapq
+import hmac
+import io
+import itertools
 import json
 import re
 import os
 import time
 import random
-from datetime import datetime, date, time as dtime
-from zoneinfo import ZoneInfo
-from mistralai.client import MistralClient
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict, deque
+from datetime import datetime, date, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from apscheduler.jobstores.base import JobLookupError
+from mistralai.async_client import MistralAsyncClient
 
 from telegram import (
+    Bot,
     Update,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
 )
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     ApplicationBuilder,
+    BaseUpdateProcessor,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
@@ -26,650 +50,4970 @@ from telegram.ext import (
 # =========================
 
 BOT_TOKEN = os.environ["BOT_TOKEN"]
-DATA_FILE = "bot_data.json"
-TZ = ZoneInfo("Europe/Paris")
-mistral = MistralClient(api_key=os.environ["MISTRAL_API_KEY"])
+
+# Mode multi-workers : positionnés par le frontal pour chaque worker
+BOT_WORKER = os.environ.get("BOT_WORKER")    # ex: "w0"
+BOT_RING = os.environ.get("BOT_RING")        # ex: "w0,w1,w2"
+_STATE_SUFFIX = f".{BOT_WORKER}" if BOT_WORKER else ""
+
+DATA_FILE = "bot_data.json"              # snapshot
+DATA_JOURNAL = "bot_data.journal"        # journal des mutations depuis le snapshot
+JOURNAL_FSYNC_EVERY = int(os.environ.get("JOURNAL_FSYNC_EVERY", "32"))
+JOURNAL_COMPACT_EVERY = int(os.environ.get("JOURNAL_COMPACT_EVERY", "5000"))
+PERSIST_DEBOUNCE_MS = float(os.environ.get("PERSIST_DEBOUNCE_MS", "50"))  # regroupement des écritures
+PERSIST_RETRY_MIN = float(os.environ.get("PERSIST_RETRY_MIN", "0.5"))    # pause avant de retenter (s),
+PERSIST_RETRY_MAX = float(os.environ.get("PERSIST_RETRY_MAX", "30"))     # doublée à chaque échec
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json")   # "json" ou "sqlite"
+SQLITE_FILE = os.environ.get("SQLITE_FILE", "bot_data.sqlite3")
+TZ = ZoneInfo("Europe/Paris")           # fuseau par défaut (modifiable par groupe via /timezone)
+BOT_STATE_FILE = f"bot_state{_STATE_SUFFIX}.json"    # fuseaux + rappels déjà envoyés
+
+# Rappels J-n : à partir de REMINDER_HOUR (heure locale du groupe), étalés sur une fenêtre.
+# Rappels H-n : n heures avant l'heure de l'événement.
+REMINDER_HOUR = int(os.environ.get("REMINDER_HOUR", "9"))
+REMINDER_WINDOW_MINUTES = int(os.environ.get("REMINDER_WINDOW_MINUTES", "30"))
+REMINDER_OFFSETS = os.environ.get("REMINDER_OFFSETS", "J-7,J-1")     # rappels par défaut de chaque event
+REMINDER_LATE_MINUTES = int(os.environ.get("REMINDER_LATE_MINUTES", "60"))  # H-n encore envoyé avec ce retard
+REMINDER_RETRY_SECONDS = 60             # nouvel essai après une erreur réseau
+
+# Mistral : client async (ne bloque pas la boucle de run_polling)
+MISTRAL_ENDPOINT = os.environ.get("MISTRAL_ENDPOINT", "https://api.mistral.ai")
+MISTRAL_TIMEOUT = float(os.environ.get("MISTRAL_TIMEOUT", "20"))           # secondes par requête
+MISTRAL_MAX_CONCURRENCY = int(os.environ.get("MISTRAL_MAX_CONCURRENCY", "4"))
+
+# Cache des réponses /ask
+ASK_CACHE_SIZE = int(os.environ.get("ASK_CACHE_SIZE", "512"))
+ASK_CACHE_TTL = float(os.environ.get("ASK_CACHE_TTL", "3600"))            # secondes
+ASK_CACHE_FILE = os.environ.get("ASK_CACHE_FILE")                         # ex: "ask_cache.json" (optionnel)
+
+# Métriques Prometheus + profiler sur http://METRICS_LISTEN:METRICS_PORT, en local par défaut
+# (0 = désactivé ; port pris au démarrage : le bot démarre quand même, sans métriques)
+METRICS_LISTEN = os.environ.get("METRICS_LISTEN", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9464"))
+
+# Réception des updates : "polling" (défaut), "webhook" ou "sharded" (voir plus bas)
+BOT_MODE = os.environ.get("BOT_MODE", "polling")
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram")
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL")              # URL publique (setWebhook), optionnelle en local
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")        # header X-Telegram-Bot-Api-Secret-Token
+UPDATE_QUEUE_SIZE = int(os.environ.get("UPDATE_QUEUE_SIZE", "1000"))
+WEBHOOK_BACKPRESSURE = os.environ.get("WEBHOOK_BACKPRESSURE", "wait")   # "wait" ou "reject"
+WEBHOOK_WAIT_TIMEOUT = float(os.environ.get("WEBHOOK_WAIT_TIMEOUT", "10"))
+
+# BOT_MODE=sharded : frontal webhook + BOT_WORKERS process (STORAGE_BACKEND=sqlite requis)
+BOT_WORKERS = int(os.environ.get("BOT_WORKERS", "2"))
+WORKER_SOCKET_DIR = os.environ.get("WORKER_SOCKET_DIR", "/tmp")
+
+# Updates traitées en parallèle entre groupes (ordre conservé dans un groupe).
+# Groupes traités en même temps : au-delà de quelques-uns, le pool de connexions HTTP
+# (httpcore) coûte plus de CPU qu'il ne fait gagner (bench.py --only add_bday).
+UPDATE_MAX_IN_FLIGHT = int(os.environ.get("UPDATE_MAX_IN_FLIGHT", "8"))
+UPDATE_MAX_PENDING = int(os.environ.get("UPDATE_MAX_PENDING", "512"))     # en attente, tous groupes ; au-delà update_queue attend
+
+# Drunk mode : messages en attente de confirmation annulés au bout de ce délai
+PENDING_TIMEOUT_MINUTES = float(os.environ.get("PENDING_TIMEOUT_MINUTES", "30"))
+DRUNK_SWEEP_SECONDS = int(os.environ.get("DRUNK_SWEEP_SECONDS", "10"))
+DRUNK_STATE_FILE = f"drunk_state{_STATE_SUFFIX}.json"       # survit aux redémarrages
+DRUNK_JOURNAL_FILE = f"drunk_state{_STATE_SUFFIX}.journal"
+DRUNK_FLUSH_SECONDS = float(os.environ.get("DRUNK_FLUSH_SECONDS", "2"))
+DRUNK_SNAPSHOT_EVERY = int(os.environ.get("DRUNK_SNAPSHOT_EVERY", "1000"))
+
+# Envois sortants (limites anti-flood Telegram)
+SEND_GLOBAL_RATE = float(os.environ.get("SEND_GLOBAL_RATE", "25"))       # messages / seconde, tous chats
+SEND_WORKERS = int(os.environ.get("SEND_WORKERS", "4"))
+
+# /ask en streaming : réponse éditée au fil des tokens
+ASK_STREAMING = os.environ.get("ASK_STREAMING", "1") == "1"
+ASK_EDIT_INTERVAL = float(os.environ.get("ASK_EDIT_INTERVAL", "1.5"))    # secondes entre deux éditions
+
+# Quotas d'appels Mistral (au-delà : réponse de la boule magique)
+ASK_QUOTA_USER_PER_HOUR = int(os.environ.get("ASK_QUOTA_USER_PER_HOUR", "20"))
+ASK_QUOTA_CHAT_PER_HOUR = int(os.environ.get("ASK_QUOTA_CHAT_PER_HOUR", "100"))
+ASK_QUOTA_GLOBAL_PER_MINUTE = int(os.environ.get("ASK_QUOTA_GLOBAL_PER_MINUTE", "30"))
+
+# /list_bday, /list_events : pages (boutons ◀️/▶️) mises en cache par groupe
+LIST_PAGE_LINES = int(os.environ.get("LIST_PAGE_LINES", "25"))
+LIST_PAGE_CHARS = 3500                  # marge sous la limite de 4096 caractères d'un message
+LIST_CACHE_CHATS = int(os.environ.get("LIST_CACHE_CHATS", "1024"))
+LIST_REPEAT_OCCURRENCES = 3             # prochaines dates affichées pour un événement récurrent...
+LIST_REPEAT_DAYS = 62                   # ... dans cette fenêtre
+
+# /import (CSV ou ICS) et /export (ICS)
+IMPORT_MAX_BYTES = int(os.environ.get("IMPORT_MAX_BYTES", str(5 * 1024 * 1024)))
+IMPORT_SPOOL_BYTES = 1024 * 1024        # au-delà, le fichier téléchargé passe sur disque
+IMPORT_ERRORS_SHOWN = 5                 # lignes en erreur détaillées dans la réponse
+
+mistral = MistralAsyncClient(
+    api_key=os.environ["MISTRAL_API_KEY"],
+    endpoint=MISTRAL_ENDPOINT,
+    timeout=MISTRAL_TIMEOUT,
+    max_retries=1,
+)
 
 
 # =========================
-# STOCKAGE SIMPLE (JSON)
+# MODÈLE D'ÉVÉNEMENT
 # =========================
 
-# Structure:
-# {
-#   "events": [
-#       {
-#           "chat_id": -100123,
-#           "type": "birthday" / "event",
-#           "username": "pseudo" or null,
-#           "title": "Anniv Nolwenn",
-#           "day": 25,
-#           "month": 3,
-#           "year": 2026 or null
-#       },
-#       ...
-#   ]
-# }
+class EventType(str, enum.Enum):
+    """Type d'événement ; les membres sont des singletons (comparables à "birthday"/"event")."""
+    BIRTHDAY = "birthday"
+    EVENT = "event"
 
-DATA = {
-    "events": []
-}
 
-def load_data():
-    global DATA
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, "r", encoding="utf-8") as f:
-                DATA = json.load(f)
-        except Exception:
-            # En cas de fichier corrompu, on repart sur du propre
-            DATA = {"events": []}
+# "birthday" -> EventType.BIRTHDAY sans passer par EventType(...) (lent au chargement de 100k events)
+_EVENT_TYPES = {member.value: member for member in EventType}
 
-def save_data():
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(DATA, f, ensure_ascii=False, indent=2)
 
-# =========================
-# DRUNK MODE (IN-MEMORY)
-# =========================
+# Entiers partagés entre events (chat_id, année) : un seul objet int par valeur
+# au lieu d'un par event (les petits entiers jour/mois le sont déjà par Python).
+_SHARED_INTS = {}
 
-# key: (chat_id, user_id) -> expiry_ts or None (pas d'expiration)
-DRUNK_USERS = {}
-# key: (chat_id, user_id) -> {"text": "..."}
-PENDING_MESSAGES = {}
 
-# =========================
-# MISTRAL
-# =========================
+def _shared_int(value):
+    if value is None:
+        return None
+    return _SHARED_INTS.setdefault(value, value)
 
-async def ask_mistral(prompt: str) -> str:
-    completion = mistral.chat(
-        model="mistral-small-latest",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.9,
-        max_tokens=100,
+
+class Event:
+    """
+    Anniversaire / événement en mémoire. __slots__ : pas de __dict__ par instance,
+    le format JSON (to_dict / from_dict) reste celui des versions précédentes.
+    """
+
+    __slots__ = (
+        "chat_id", "type", "username", "title", "day", "month", "year", "user_id", "display",
+        "time_of_day", "reminders", "rule",
     )
-    return completion.choices[0].message.content
 
+    def __init__(self, chat_id, type, title, day, month, year=None,
+                 username=None, user_id=None, display=None, time_of_day=None, reminders=None, rule=None):
+        self.chat_id = _shared_int(chat_id)
+        self.type = _EVENT_TYPES.get(type) or EventType(type)
+        self.title = title
+        self.day = day
+        self.month = month
+        self.year = _shared_int(year)
+        self.username = username
+        self.user_id = user_id
+        self.display = display
+        self.time_of_day = time_of_day      # minutes depuis minuit (heure locale du groupe) ou None
+        self.reminders = _shared_reminders(reminders)  # ("J-1", "H-2") ou None (REMINDER_OFFSETS)
+        self.rule = rule                    # récurrence ("weekly:3"...) ; la date est la 1re occurrence
+
+    @classmethod
+    def from_dict(cls, d):
+        # Chemin du chargement (100k+ events) : mêmes champs que __init__, sans l'appel à mots-clés
+        e = cls.__new__(cls)
+        e.chat_id = _shared_int(d["chat_id"])
+        e.type = _EVENT_TYPES.get(d["type"]) or EventType(d["type"])
+        e.title = d.get("title", "")
+        e.day = d["day"]
+        e.month = d["month"]
+        e.year = _shared_int(d.get("year"))
+        e.username = d.get("username")
+        e.user_id = d.get("user_id")
+        e.display = d.get("display")
+        e.time_of_day = parse_hhmm(d.get("time"))
+        e.reminders = _shared_reminders(d.get("reminders"))
+        e.rule = d.get("repeat")
+        return e
+
+    # Colonnes du snapshot (une liste de valeurs par attribut), dans l'ordre de from_row
+    COLUMNS = (
+        "chat_id", "type", "title", "day", "month", "year", "username", "user_id", "display",
+        "time_of_day", "reminders", "rule",
+    )
 
+    @classmethod
+    def from_row(cls, row):
+        """Valeurs d'un event dans l'ordre de COLUMNS (une ligne des colonnes du snapshot)."""
+        e = cls.__new__(cls)
+        (chat_id, type_, e.title, e.day, e.month, year,
+         e.username, e.user_id, e.display, e.time_of_day, reminders, e.rule) = row
+        # _shared_int / _shared_reminders en ligne : appelée pour chaque event du snapshot
+        e.chat_id = _SHARED_INTS.setdefault(chat_id, chat_id)
+        e.type = _EVENT_TYPES.get(type_) or EventType(type_)
+        e.year = None if year is None else _SHARED_INTS.setdefault(year, year)
+        e.reminders = _shared_reminders(reminders) if reminders else None
+        return e
+
+    def to_dict(self):
+        d = {
+            "chat_id": self.chat_id,
+            "type": self.type.value,
+            "username": self.username,
+            "title": self.title,
+            "day": self.day,
+            "month": self.month,
+            "year": self.year,
+        }
+        if self.user_id is not None:
+            d["user_id"] = self.user_id
+        if self.display is not None:
+            d["display"] = self.display
+        if self.time_of_day is not None:
+            d["time"] = format_time(self.time_of_day)
+        if self.reminders is not None:
+            d["reminders"] = list(self.reminders)
+        if self.rule is not None:
+            d["repeat"] = self.rule
+        return d
 
-async def ask(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not context.args:
-        await update.message.reply_text("Pose une question : /ask Dois-je sortir ce soir ?")
-        return
+    def __repr__(self):
+        return f"Event({self.to_dict()!r})"
 
-    question = " ".join(context.args)
 
-    # prompt de base
-    base_prompt = f"""
-Tu es un mec un peu facho sur les bords et tu fais que des réponses catchy et bordeline en UNE ou DEUX phrases maximum.
-Question: {question}
-"""
+def format_time(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
 
-    answer = await ask_mistral(base_prompt)
 
-    await update.message.reply_text(f"❓ {question}\n🔮 {answer}")
+def parse_hhmm(raw):
+    """"20:30" (format stocké) -> 1230 ; None si absent."""
+    if not raw:
+        return None
+    hours, _, minutes = raw.partition(":")
+    return int(hours) * 60 + int(minutes)
 
 
+# Rappels d'un event : "J-n" (n jours avant, à REMINDER_HOUR) ou "H-n" (n heures avant l'heure).
+# Tuples normalisés (du plus tôt au plus tard) et partagés entre events, comme les entiers.
+_REMINDER_RE = re.compile(r"([JH])-(\d{1,3})")
+_REMINDER_MAX = {"J": 366, "H": 168}
+_SHARED_REMINDERS = {}
 
-# =========================
-# COMMANDES DRUNK MODE
-# =========================
 
-async def drunk_on(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Active le drunk mode pour l'utilisateur dans ce groupe."""
-    if update.effective_chat.type not in ("group", "supergroup"):
-        await update.message.reply_text("Cette commande est faite pour un groupe 😉")
-        return
+def reminder_lead(offset):
+    """Avance approximative d'un rappel, en minutes (tri, borne basse du planificateur)."""
+    return int(offset[2:]) * (1440 if offset[0] == "J" else 60)
 
-    chat_id = update.effective_chat.id
-    user_id = update.effective_user.id
 
-    expiry_ts = None
-    if context.args:
-        try:
-            minutes = int(context.args[0])
-            expiry_ts = time.time() + minutes * 60
-            msg_extra = f" pour {minutes} minutes"
-        except ValueError:
-            msg_extra = ""
-    else:
-        msg_extra = ""
+def normalize_reminders(raws):
+    """["h-2", "J-1", "H-2"] -> ("J-1", "H-2") ; ValueError si un rappel est invalide."""
+    offsets = set()
+    for raw in raws:
+        m = _REMINDER_RE.fullmatch(raw.strip().upper())
+        if not m:
+            raise ValueError(f"Rappel invalide : {raw} (ex: J-1, H-2)")
+        if int(m[2]) > _REMINDER_MAX[m[1]]:
+            raise ValueError(f"Rappel trop lointain : {raw}")
+        offsets.add(f"{m[1]}-{int(m[2])}")
+    return tuple(sorted(offsets, key=reminder_lead, reverse=True))
 
-    DRUNK_USERS[(chat_id, user_id)] = expiry_ts
 
-    await update.message.reply_text(
-        f"🥴 Drunk Mode activé pour {update.effective_user.first_name}{msg_extra}.\n"
-        f"Tes messages devront être confirmés avant d'être visibles."
-    )
+def _shared_reminders(offsets):
+    if not offsets:
+        return None
+    offsets = tuple(offsets)
+    return _SHARED_REMINDERS.setdefault(offsets, offsets)
 
 
-async def drunk_off(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Désactive le drunk mode pour l'utilisateur dans ce groupe."""
-    chat_id = update.effective_chat.id
-    user_id = update.effective_user.id
+DEFAULT_REMINDERS = normalize_reminders(o for o in REMINDER_OFFSETS.split(",") if o.strip())
 
-    key = (chat_id, user_id)
-    if key in DRUNK_USERS:
-        DRUNK_USERS.pop(key, None)
-        PENDING_MESSAGES.pop(key, None)
-        await update.message.reply_text("✅ Drunk Mode désactivé.")
-    else:
-        await update.message.reply_text("Tu n'es pas en Drunk Mode dans ce groupe.")
 
+# Récurrence (champ "repeat" de l'event ; sa date est la première occurrence) :
+#   "weekly:3"      tous les jeudis (0 = lundi)
+#   "monthly:1:4"   le 1er vendredi du mois (-1 : le dernier)
+#   "yearly"        tous les ans à la date de l'event (29-02 : le 28-02 les autres années)
+# Les anniversaires suivent "yearly". Les dates sont produites par des générateurs
+# infinis, à la demande, et gardées par série (Recurrence) : jamais recalculées.
 
-async def drunk_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Statut du drunk mode."""
-    chat_id = update.effective_chat.id
-    user_id = update.effective_user.id
-    key = (chat_id, user_id)
+_DAY = timedelta(days=1)
+_WEEK = timedelta(days=7)
 
-    now = time.time()
-    expiry_ts = DRUNK_USERS.get(key)
 
-    if expiry_ts is None and key in DRUNK_USERS:
-        await update.message.reply_text("🥴 Tu es actuellement en Drunk Mode (sans limite de temps).")
-    elif expiry_ts and expiry_ts > now:
-        remaining = int((expiry_ts - now) / 60)
-        await update.message.reply_text(
-            f"🥴 Tu es en Drunk Mode pour encore ~{remaining} minute(s)."
-        )
-    else:
-        await update.message.reply_text("Tu n'es pas en Drunk Mode dans ce groupe.")
+def _is_leap(year):
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
 
 
-# =========================
-# GESTION DES MESSAGES (DRUNK)
-# =========================
+def _weekly_dates(weekday, start):
+    d = start + timedelta(days=(weekday - start.weekday()) % 7)
+    while True:
+        yield d
+        d += _WEEK
 
-async def drunk_message_filter(update: Update, context: ContextTypes.DEFAULT_TYPE):
+
+def nth_weekday(year, month, nth, weekday):
+    """n-ième `weekday` du mois (nth=-1 : le dernier) ; None s'il n'existe pas (5e vendredi)."""
+    if nth > 0:
+        first = date(year, month, 1)
+        d = first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (nth - 1))
+        return d if d.month == month else None
+    last = date(year + month // 12, month % 12 + 1, 1) - _DAY
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _monthly_dates(nth, weekday, start):
+    year, month = start.year, start.month
+    while True:
+        d = nth_weekday(year, month, nth, weekday)
+        if d is not None and d >= start:
+            yield d
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _yearly_dates(month, day, start):
+    year = start.year
+    while True:
+        if month == 2 and day == 29 and not _is_leap(year):
+            d = date(year, 2, 28)
+        else:
+            d = date(year, month, day)
+        if d >= start:
+            yield d
+        year += 1
+
+
+class Recurrence:
     """
-    Intercepte les messages des utilisateurs en Drunk Mode
-    dans les groupes et demande confirmation.
+    Série de dates d'une règle, partagée par tous les events qui la suivent.
+    Les dates sortent d'un générateur infini, à la demande, et restent en cache
+    (liste triée, recherche par bisect). Utilisable depuis un thread (rendu des listes).
     """
-    if not update.message:
-        return
 
-    chat = update.effective_chat
-    if chat.type not in ("group", "supergroup"):
-        return
-
-    user = update.effective_user
-    if user.is_bot:
-        return
+    __slots__ = ("_factory", "_origin", "_gen", "_dates", "_lock")
+
+    def __init__(self, factory):
+        self._factory = factory     # start -> générateur des dates >= start
+        self._origin = None         # début du cache
+        self._gen = None
+        self._dates = []
+        self._lock = threading.Lock()
+
+    def _cover(self, d):
+        """(cache, index de la première date >= d), en étendant le cache si besoin."""
+        dates = self._dates
+        if dates and self._origin <= d <= dates[-1]:
+            return dates, bisect.bisect_left(dates, d)
+        with self._lock:
+            if self._origin is None or d < self._origin:
+                # Première demande, ou plus tôt que le cache : la série repart de d
+                self._origin, self._gen, self._dates = d, self._factory(d), []
+            dates = self._dates
+            while not dates or dates[-1] < d:
+                dates.append(next(self._gen))
+            return dates, bisect.bisect_left(dates, d)
+
+    def first(self, start):
+        """Première date >= start."""
+        dates, i = self._cover(start)
+        return dates[i]
+
+    def between(self, start, end=None, limit=None):
+        """Dates de start (inclus) à end (exclu), au plus `limit` : générateur (la série est infinie)."""
+        dates, i = self._cover(start)
+        count = 0
+        while limit is None or count < limit:
+            if i >= len(dates):
+                dates, i = self._cover(dates[-1] + _DAY)
+            d = dates[i]
+            if end is not None and d >= end:
+                return
+            yield d
+            count += 1
+            i += 1
+
+
+@functools.lru_cache(maxsize=4096)
+def recurrence(rule, month=None, day=None):
+    """
+    Série (en cache) d'une règle ; month/day pour "yearly".
+    None pour un "yearly" à une date impossible (31-02 accepté par d'anciennes versions) :
+    la série ne produirait jamais de date.
+    """
+    kind, _, args = rule.partition(":")
+    if kind == "weekly":
+        return Recurrence(functools.partial(_weekly_dates, int(args)))
+    if kind == "monthly":
+        nth, weekday = args.split(":")
+        return Recurrence(functools.partial(_monthly_dates, int(nth), int(weekday)))
+    if kind == "yearly":
+        try:
+            date(2000, month, day)      # 2000 est bissextile : ne rejette que les dates impossibles
+        except (TypeError, ValueError):
+            return None
+        return Recurrence(functools.partial(_yearly_dates, month, day))
+    raise ValueError(f"Règle inconnue : {rule}")
 
-    text = update.message.text
-    if not text:
-        return
 
-    chat_id = chat.id
-    user_id = user.id
-    key = (chat_id, user_id)
+_BIRTHDAY = EventType.BIRTHDAY     # accès à un membre d'Enum : lent dans une boucle de 100k
 
-    # Gestion expiration
-    now = time.time()
-    expiry_ts = DRUNK_USERS.get(key)
-    if expiry_ts is not None:
-        if expiry_ts < now:
-            # Expiré
-            DRUNK_USERS.pop(key, None)
-            PENDING_MESSAGES.pop(key, None)
-            return
 
-    if key not in DRUNK_USERS:
-        return  # pas en drunk mode => on laisse passer
+def event_series(e):
+    """Série de l'event (anniversaire ou récurrent), None pour un événement ponctuel (ou une date impossible)."""
+    if e.type is _BIRTHDAY or e.rule == "yearly":
+        return recurrence("yearly", e.month, e.day)
+    if e.rule is None:
+        return None
+    return recurrence(e.rule)
 
-    # On est en drunk mode : on supprime le message et on demande confirmation
-    PENDING_MESSAGES[key] = {"text": text}
 
-    # Supprimer le message original
+def _event_date(e):
     try:
-        await context.bot.delete_message(chat_id=chat_id, message_id=update.message.message_id)
-    except Exception:
-        # Si le bot n'est pas admin / pas le droit, on ne pourra pas supprimer
-        # Dans ce cas, on sort.
+        return date(e.year, e.month, e.day)
+    except (TypeError, ValueError):
+        return None     # sans année, ou date impossible d'une ancienne version
+
+
+def next_occurrence(e, start):
+    """Première occurrence >= start, None si l'event est passé."""
+    series = event_series(e)
+    if series is None:
+        d = _event_date(e)
+        return d if d is not None and d >= start else None
+    if e.type is not _BIRTHDAY:
+        anchor = _event_date(e)     # pas d'occurrence avant la première
+        if anchor is not None and anchor > start:
+            start = anchor
+    return series.first(start)
+
+
+def event_occurrences(e, start, end=None, limit=None):
+    """Occurrences de start (inclus) à end (exclu), au plus `limit` : générateur."""
+    series = event_series(e)
+    if series is None:
+        d = _event_date(e)
+        if d is not None and d >= start and (end is None or d < end) and limit != 0:
+            yield d
         return
+    if e.type is not _BIRTHDAY:
+        anchor = _event_date(e)
+        if anchor is not None and anchor > start:
+            start = anchor
+    yield from series.between(start, end, limit)
 
-    # Clavier de confirmation
-    data_confirm = f"confirm|{chat_id}|{user_id}"
-    data_cancel = f"cancel|{chat_id}|{user_id}"
-    keyboard = [
-        [
-            InlineKeyboardButton("✅ Envoyer", callback_data=data_confirm),
-            InlineKeyboardButton("❌ Annuler", callback_data=data_cancel),
-        ]
-    ]
-    markup = InlineKeyboardMarkup(keyboard)
 
-    preview = text if len(text) <= 120 else text[:117] + "..."
+def normalize_name(name):
+    """Nom comparable : casse, espaces multiples et @ initial ignorés."""
+    return " ".join((name or "").casefold().split()).lstrip("@")
 
-    # On tente en DM en priorité
-    try:
-        await context.bot.send_message(
-            chat_id=user_id,
-            text=(
-                "🥴 Tu es en Drunk Mode.\n"
-                "Je viens de retenir ce message :\n\n"
-                f"« {preview} »\n\n"
-                "Je l'envoie dans le groupe ?"
-            ),
-            reply_markup=markup,
-        )
-    except Exception:
-        # Si DM impossible, on passe par le groupe
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text=(
-                f"🥴 @{user.username or user.first_name}, tu es en Drunk Mode.\n"
-                "Je retiens ton message. Je l'envoie ?\n\n"
-                f"« {preview} »"
-            ),
-            reply_markup=markup,
-        )
 
+def event_key(e):
+    """
+    Clé d'unicité (et des rappels déjà envoyés) : groupe, type, personne, date.
+    Anniversaire : id Telegram, sinon nom normalisé. Événement : titre normalisé
+    (deux événements différents le même jour avec la même personne restent distincts).
+    """
+    return f"{e.chat_id}|{e.type.value}|{event_who(e)}|{e.day:02d}-{e.month:02d}-{e.year or ''}"
 
-async def drunk_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Gestion des boutons ✅/❌."""
-    query = update.callback_query
-    await query.answer()
 
-    data = query.data  # format: "confirm|chat_id|user_id" ou "cancel|..."
-    try:
-        action, chat_id_str, user_id_str = data.split("|")
-        chat_id = int(chat_id_str)
-        target_user_id = int(user_id_str)
-    except ValueError:
-        return
+def event_who(e):
+    if e.type is EventType.BIRTHDAY:
+        return e.user_id or normalize_name(e.display or e.username or e.title)
+    return normalize_name(e.title)
 
-    # Sécurité : seul l'utilisateur concerné peut confirmer/annuler
-    if query.from_user.id != target_user_id:
-        await query.edit_message_text("Tu ne peux pas valider ce message.")
-        return
 
-    key = (chat_id, target_user_id)
-    stored = PENDING_MESSAGES.get(key)
+def _event_hook(obj):
+    """object_hook JSON : chaque event est converti dès qu'il est parsé (pas de liste de dicts intermédiaire)."""
+    if "chat_id" in obj and "type" in obj:
+        return Event.from_dict(obj)
+    return obj
 
-    if action == "cancel":
-        PENDING_MESSAGES.pop(key, None)
-        await query.edit_message_text("❌ Message annulé.")
-        return
 
-    if action == "confirm":
-        if not stored:
-            await query.edit_message_text("Le message a expiré ou a déjà été traité.")
+def _json_default(obj):
+    if isinstance(obj, Event):
+        return obj.to_dict()
+    raise TypeError(f"{type(obj).__name__} non sérialisable en JSON")
+
+
+# =========================
+# STOCKAGE (JSON PAR DÉFAUT, SQLITE EN OPTION)
+# =========================
+
+# Backend JSON :
+
+# Snapshot (DATA_FILE) :
+# {
+#   "seq": 1234,            # dernier numéro de journal inclus dans le snapshot
+#   "format": 2,
+#   "keys": ["-100123|birthday|nolwenn|25-03-", ...],     # event_key, pas recalculée au chargement
+#   "columns": {            # une liste par attribut (Event.COLUMNS), alignée sur keys
+#       "chat_id": [-100123, ...],
+#       "type": ["birthday", ...],
+#       "title": ["Anniv Nolwenn", ...],
+#       "day": [25, ...], "month": [3, ...], "year": [null, ...],
+#       "time_of_day": [null, ...],     # minutes depuis minuit
+#       ...
+#   }
+# }
+# Quelques grandes listes au lieu d'un objet JSON par event : bien moins d'objets à
+# décoder (et à suivre pour le ramasse-miettes) au démarrage.
+# Les snapshots des versions précédentes (sans "format", un dict par event : to_dict)
+# se relisent toujours ; le suivant est écrit au nouveau format.
+#
+# Journal (DATA_JOURNAL) : une ligne JSON par mutation, append-only
+#   {"seq": 1235, "op": "add", "event": {...}}
+#
+# Au démarrage : snapshot + rejeu du journal (seq > snapshot.seq).
+# Quand le journal grossit, on le fait tourner (DATA_JOURNAL -> DATA_JOURNAL.1)
+# et on réécrit le snapshot en arrière-plan, puis on supprime l'ancien journal.
+#
+# Backend SQLite (STORAGE_BACKEND=sqlite) : table indexée par groupe,
+# le fichier JSON existant est migré automatiquement au premier démarrage.
+
+def _atomic_write_text(path, text):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _atomic_write_json(path, obj, **dump_kwargs):
+    """Écrit un fichier JSON via fichier temporaire + rename (jamais de fichier à moitié écrit)."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, default=_json_default, **dump_kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class Journal:
+    """Journal append-only (JSON lines), fsync par lots."""
+
+    def __init__(self, path, fsync_every=32, fsync_interval=2.0, object_hook=None):
+        self.path = path
+        self.object_hook = object_hook
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.records = 0        # lignes écrites depuis la dernière rotation
+        self._f = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def replay(self, path=None):
+        """Relit les enregistrements ; une dernière ligne tronquée (crash) est ignorée."""
+        path = path or self.path
+        if not os.path.exists(path):
             return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line, object_hook=self.object_hook)
+                except ValueError:
+                    break
+
+    def append(self, record):
+        if self._f is None:
+            self._f = open(self.path, "a", encoding="utf-8")
+        self._f.write(json.dumps(record, ensure_ascii=False, default=_json_default) + "\n")
+        self._f.flush()             # visible par l'OS : survit à un crash du process
+        self.records += 1
+        self._unsynced += 1
+        if (self._unsynced >= self.fsync_every
+                or time.monotonic() - self._last_sync >= self.fsync_interval):
+            self.sync()
+
+    def append_many(self, records):
+        """Un lot d'enregistrements en une seule écriture, suivie d'un fsync."""
+        if not records:
+            return
+        if self._f is None:
+            self._f = open(self.path, "a", encoding="utf-8")
+        self._f.write("".join(
+            json.dumps(record, ensure_ascii=False, default=_json_default) + "\n" for record in records
+        ))
+        self._f.flush()
+        self.records += len(records)
+        self._unsynced += len(records)
+        self.sync()
+
+    def sync(self):
+        if self._f is not None and self._unsynced:
+            os.fsync(self._f.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def rotate(self):
+        """Ferme le journal courant et le renomme en .1 ; renvoie le chemin renommé."""
+        self.sync()
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        rotated = self.path + ".1"
+        if os.path.exists(self.path):
+            os.replace(self.path, rotated)
+        self.records = 0
+        return rotated
+
+    def close(self):
+        self.sync()
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+class Storage:
+    """
+    Interface de stockage des événements.
+    load() charge les events en mémoire, sans doublons (event_key) ; le stockage est la
+    seule copie : items() / len() pour tout parcourir, events_for_chat() pour un groupe.
+    add() (remplace l'event de même clé) et remove(key) mettent à jour la mémoire
+    et renvoient l'enregistrement à persister ; write() l'écrit sur disque
+    (thread de PersistenceWriter, seul écrivain).
+    events_for_chat() peut être appelée depuis un thread (asyncio.to_thread).
+    """
 
-        text = stored["text"]
-        PENDING_MESSAGES.pop(key, None)
+    reads_disk = False      # events_for_chat() lit le disque (et pas la mémoire)
+
+    def load(self):
+        raise NotImplementedError
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def items(self):
+        """(event_key, event) de tout ce qui est en mémoire (clés déjà calculées)."""
+        raise NotImplementedError
+
+    def __len__(self):
+        return len(self.items())
+
+    def add(self, event):
+        raise NotImplementedError
+
+    def remove(self, key):
+        raise NotImplementedError
+
+    def write(self, records):
+        raise NotImplementedError
+
+    def after_write(self):
+        """Appelée sur la boucle après chaque lot écrit (compaction...)."""
+
+    def events_for_chat(self, chat_id, type_):
+        raise NotImplementedError
+
+    def save(self):
+        """Écriture complète (compaction / checkpoint)."""
+
+    def close(self):
+        pass
+
+
+class JsonStorage(Storage):
+    """Snapshot JSON + journal (backend par défaut)."""
+
+    SNAPSHOT_FORMAT = 2     # events en colonnes (Event.COLUMNS) ; absent : un dict par event
+
+    def __init__(self, data_file, journal_file, fsync_every=32, compact_every=5000):
+        self.data_file = data_file
+        self.journal = Journal(journal_file, fsync_every=fsync_every, object_hook=_event_hook)
+        self.compact_every = compact_every
+        self._events = {}       # event_key -> event (ordre d'insertion)
+        self._by_chat = {}      # (chat_id, type) -> {event_key: event}
+        self._seq = 0           # dernier numéro de mutation attribué
+        self._compacting = False
+        self._compactor = None  # thread du dernier snapshot en arrière-plan
+
+    @property
+    def events(self):
+        return list(self._events.values())
+
+    def _put(self, event):
+        """Ajoute ou remplace ; renvoie l'event remplacé (même clé) ou None."""
+        key = event_key(event)
+        previous = self._events.get(key)
+        self._events[key] = event
+        self._by_chat.setdefault((event.chat_id, event.type), {})[key] = event
+        return previous
+
+    def _load_columns(self, keys, columns):
+        """Colonnes du snapshot (clés uniques, déjà calculées) : ni event_key ni recherche de doublon."""
+        events = self._events
+        by_chat = self._by_chat
+        from_row = Event.from_row
+        for key, row in zip(keys, zip(*(columns[name] for name in Event.COLUMNS))):
+            e = events[key] = from_row(row)
+            bucket = by_chat.get((e.chat_id, e.type))
+            if bucket is None:
+                bucket = by_chat[(e.chat_id, e.type)] = {}
+            bucket[key] = e
+
+    def _drop(self, key):
+        event = self._events.pop(key, None)
+        if event is not None:
+            self._by_chat.get((event.chat_id, event.type), {}).pop(key, None)
+        return event
+
+    def _apply(self, record):
+        op = record.get("op")
+        if op == "add":
+            self._put(record["event"])
+        elif op == "del":
+            self._drop(record["key"])
+
+    def load(self):
+        self._events = {}
+        self._by_chat = {}
+        snapshot_seq = 0
+        duplicates = 0
+
+        if os.path.exists(self.data_file):
+            try:
+                with open(self.data_file, "r", encoding="utf-8") as f:
+                    snapshot = json.load(f)
+                snapshot_seq = snapshot.get("seq", 0)
+                if snapshot.get("format") == self.SNAPSHOT_FORMAT:
+                    self._load_columns(snapshot["keys"], snapshot["columns"])
+                else:
+                    # Ancien format (dicts) ; doublons des anciennes versions (add sans upsert) : le dernier gagne
+                    duplicates = sum(1 for d in snapshot.get("events", []) if self._put(Event.from_dict(d)) is not None)
+                del snapshot
+            except Exception:
+                # Snapshot illisible : on le met de côté (au lieu de l'écraser)
+                # et on reconstruit ce qu'on peut depuis le journal.
+                self._events = {}
+                self._by_chat = {}
+                backup = f"{self.data_file}.corrupt-{int(time.time())}"
+                os.replace(self.data_file, backup)
+                print(f"⚠️ {self.data_file} illisible, sauvegardé dans {backup}")
+
+        self._seq = snapshot_seq
+        rotated = self.journal.path + ".1"
+        replayed = 0
+        for path in (rotated, self.journal.path):
+            for record in self.journal.replay(path):
+                seq = record.get("seq", 0)
+                if seq <= snapshot_seq:
+                    continue
+                self._apply(record)
+                self._seq = max(self._seq, seq)
+                replayed += 1
+
+        # Compaction interrompue, journal long ou doublons : on repart d'un snapshot propre
+        if os.path.exists(rotated) or replayed >= self.compact_every or duplicates:
+            self.save()
+        if duplicates:
+            print(f"🧹 {duplicates} doublon(s) supprimé(s) de {self.data_file}")
+
+    def get(self, key):
+        return self._events.get(key)
+
+    def items(self):
+        return self._events.items()
+
+    def add(self, event):
+        self._put(event)
+        return self._record("add", event=event)
+
+    def remove(self, key):
+        if self._drop(key) is None:
+            return None
+        return self._record("del", key=key)
+
+    def events_for_chat(self, chat_id, type_):
+        return list(self._by_chat.get((chat_id, EventType(type_)), {}).values())
+
+    def _record(self, op, **payload):
+        """Numérote une mutation ; elle sera journalisée (une ligne) par write()."""
+        self._seq += 1
+        return {"seq": self._seq, "op": op, **payload}
+
+    def write(self, records):
+        self.journal.append_many(records)
+
+    def after_write(self):
+        if self.journal.records >= self.compact_every:
+            self.compact_in_background()
+
+    def save(self):
+        """Compaction synchrone : snapshot complet puis journaux supprimés."""
+        if self._compactor is not None:
+            self._compactor.join()      # même fichier temporaire que le snapshot en cours
+        self.journal.close()
+        self._write_columns(list(self._events.items()), self._seq)
+        for path in (self.journal.path + ".1", self.journal.path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.journal.records = 0
+
+    def _write_columns(self, items, seq):
+        keys = [key for key, _ in items]
+        events = [e for _, e in items]
+        columns = {name: [getattr(e, name) for e in events] for name in Event.COLUMNS}
+        _atomic_write_json(
+            self.data_file, {"seq": seq, "format": self.SNAPSHOT_FORMAT, "keys": keys, "columns": columns}
+        )
 
-        username = query.from_user.username
-        display_name = f"@{username}" if username else query.from_user.first_name
+    def _write_snapshot(self, items, seq, rotated):
+        try:
+            self._write_columns(items, seq)
+            if os.path.exists(rotated):
+                os.remove(rotated)
+        finally:
+            self._compacting = False
+
+    def compact_in_background(self):
+        """Fait tourner le journal et réécrit le snapshot dans un thread."""
+        if self._compacting or os.path.exists(self.journal.path + ".1"):
+            return
+        self._compacting = True
+        # Copie + rotation sur le thread appelant : le snapshot contient exactement
+        # les mutations jusqu'à _seq, le nouveau journal repart juste après.
+        items = list(self._events.items())
+        rotated = self.journal.rotate()
+        self._compactor = threading.Thread(
+            target=self._write_snapshot, args=(items, self._seq, rotated), daemon=True
+        )
+        self._compactor.start()
 
-        # On envoie dans le groupe
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text=f"💬 Message validé par {display_name} :\n{text}",
+    def close(self):
+        self.journal.close()
+
+
+class SqliteStorage(Storage):
+    """
+    SQLite, indexé sur (chat_id, type, month, day) : les /list_* ne lisent que le groupe concerné.
+    Le reste de l'event est stocké tel quel en JSON (colonne data).
+    Colonne key (event_key) unique : ajout = upsert, suppression par clé.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS events (
+        id      INTEGER PRIMARY KEY,
+        key     TEXT,
+        chat_id INTEGER NOT NULL,
+        type    TEXT    NOT NULL,
+        month   INTEGER NOT NULL,
+        day     INTEGER NOT NULL,
+        year    INTEGER,
+        data    TEXT    NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS events_chat_type_date ON events (chat_id, type, month, day);
+    """
+
+    reads_disk = True
+
+    def __init__(self, path, legacy=None):
+        self.path = path
+        self.legacy = legacy    # JsonStorage à migrer si la base est vide
+        self._events = {}       # event_key -> event (groupes de ce process)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")    # base partagée entre workers
+        self._db.executescript(self.SCHEMA)
+        self._migrate_keys()
+
+    def _migrate_keys(self):
+        """Bases d'avant la colonne key : on la remplit et on supprime les doublons (le dernier gagne)."""
+        with self._lock, self._db:
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(events)")]
+            if "key" not in columns:
+                self._db.execute("ALTER TABLE events ADD COLUMN key TEXT")
+            rows = self._db.execute("SELECT id, data FROM events WHERE key IS NULL").fetchall()
+            self._db.executemany(
+                "UPDATE events SET key = ? WHERE id = ?",
+                ((event_key(json.loads(data, object_hook=_event_hook)), row_id) for row_id, data in rows),
+            )
+            removed = self._db.execute(
+                "DELETE FROM events WHERE id NOT IN (SELECT MAX(id) FROM events GROUP BY key)"
+            ).rowcount
+            self._db.execute("CREATE UNIQUE INDEX IF NOT EXISTS events_key ON events (key)")
+        if removed:
+            print(f"🧹 {removed} doublon(s) supprimé(s) de {self.path}")
+
+    UPSERT = """
+    INSERT INTO events (key, chat_id, type, month, day, year, data) VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (key) DO UPDATE SET
+        chat_id = excluded.chat_id, type = excluded.type, month = excluded.month,
+        day = excluded.day, year = excluded.year, data = excluded.data
+    """
+
+    @staticmethod
+    def _row(event):
+        return (
+            event_key(event), event.chat_id, event.type.value, event.month, event.day, event.year,
+            json.dumps(event.to_dict(), ensure_ascii=False),
         )
 
-        await query.edit_message_text("✅ Message envoyé dans le groupe.")
+    def _insert_many(self, events):
+        with self._lock, self._db:
+            self._db.executemany(self.UPSERT, (self._row(e) for e in events))
+
+    def _migrate_legacy(self):
+        if self.legacy is None or not os.path.exists(self.legacy.data_file):
+            return
+        self.legacy.load()
+        events = self.legacy.events
+        self._insert_many(events)
+        self.legacy.close()
+        # On garde l'ancien fichier, renommé, au cas où
+        os.replace(self.legacy.data_file, self.legacy.data_file + ".migrated")
+        for path in (self.legacy.journal.path + ".1", self.legacy.journal.path):
+            if os.path.exists(path):
+                os.remove(path)
+        print(f"📦 {len(events)} événement(s) migré(s) de {self.legacy.data_file} vers {self.path}")
+
+    def load(self, owns=None):
+        """owns(chat_id) -> bool : en mode multi-workers, ne garde que les groupes du shard."""
+        with self._lock:
+            empty = self._db.execute("SELECT 1 FROM events LIMIT 1").fetchone() is None
+        if empty:
+            self._migrate_legacy()
+        with self._lock:
+            rows = self._db.execute("SELECT key, chat_id, data FROM events ORDER BY id").fetchall()
+        self._events = {
+            key: json.loads(data, object_hook=_event_hook)
+            for key, chat_id, data in rows if owns is None or owns(chat_id)
+        }
 
+    def get(self, key):
+        return self._events.get(key)
+
+    def items(self):
+        return self._events.items()
+
+    def add(self, event):
+        self._events[event_key(event)] = event
+        return {"op": "add", "event": event}
+
+    def remove(self, key):
+        if self._events.pop(key, None) is None:
+            return None
+        return {"op": "del", "key": key}
+
+    def write(self, records):
+        """Un lot = une transaction ; les mutations sont appliquées dans l'ordre."""
+        with self._lock, self._db:
+            # Mutations consécutives de même type regroupées (import : un executemany)
+            for op, group in itertools.groupby(records, key=lambda record: record["op"]):
+                if op == "add":
+                    self._db.executemany(self.UPSERT, (self._row(record["event"]) for record in group))
+                elif op == "del":
+                    self._db.executemany("DELETE FROM events WHERE key = ?", ((record["key"],) for record in group))
+
+    def events_for_chat(self, chat_id, type_):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT data FROM events WHERE chat_id = ? AND type = ? ORDER BY month, day",
+                (chat_id, EventType(type_).value),
+            ).fetchall()
+        return [json.loads(data, object_hook=_event_hook) for (data,) in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def make_storage():
+    json_storage = JsonStorage(
+        DATA_FILE, DATA_JOURNAL,
+        fsync_every=JOURNAL_FSYNC_EVERY, compact_every=JOURNAL_COMPACT_EVERY,
+    )
+    if STORAGE_BACKEND == "sqlite":
+        return SqliteStorage(SQLITE_FILE, legacy=json_storage)
+    return json_storage
 
-# =========================
-# MAGIC 8-BALL
-# =========================
 
-MAGIC_8BALL_ANSWERS = [
-    "Oui, clairement. ✅",
-    "Non, laisse tomber. ❌",
-    "Probablement oui.",
-    "Probablement pas.",
-    "Mmmmm… j’hésite, repose la question plus tard.",
-    "Je ne suis pas sûr, mais ça sent bon. ✨",
-    "Je ne suis pas sûr, mais ça sent le plan foireux. 🤔",
-    "Les astres sont alignés. 🌙",
-    "C’est un grand oui, fonce. 🚀",
-    "C’est un non poli. 🫠",
-    "Demande plutôt un verre d'abord.",
-    "Tu connais déjà la réponse.",
-    "Si tu dois hésiter autant, c’est non.",
-    "Si ça te fait rire rien qu’en y pensant, fais-le.",
-    "Si ça t’angoisse rien qu’en y pensant, évite."
-    "T'as cru que j'étais ta mère pour décider pour toi ?"
-]
+STORAGE = make_storage()
 
 
-async def magic_8ball(update: Update, context: ContextTypes.DEFAULT_TYPE):
+# =========================
+# ÉCRITURES DISQUE (UN SEUL ÉCRIVAIN)
+# =========================
+
+class PersistenceWriter:
     """
-    /8ball Est-ce qu’on fait une raclette ce soir ?
+    Seul écrivain disque pour les événements et l'état des rappels :
+    - les handlers mettent en file (la mémoire est déjà à jour),
+    - une tâche regroupe ce qui arrive pendant `debounce` secondes et l'écrit
+      en une fois dans un thread (journal + fsync, transaction SQLite,
+      fichier temporaire + rename) : jamais deux écritures en même temps,
+    - chaque mise en file renvoie un Future résolu quand c'est sur disque,
+      à attendre seulement quand on a besoin de la durabilité,
+    - un lot en échec est retenté (pause doublée à chaque échec, PERSIST_RETRY_*),
+      compté dans eventbot_persist_failures_total ; abandonné seulement à l'arrêt.
+    Tant que la tâche n'est pas lancée (démarrage) ou après stop(), on écrit directement.
     """
-    if context.args:
-        question = " ".join(context.args)
-    else:
-        question = None
 
-    answer = random.choice(MAGIC_8BALL_ANSWERS)
+    def __init__(self, storage, debounce=0.05):
+        self.storage = storage
+        self.debounce = debounce
+        self.batches = 0
+        self.failures = 0
+        self.last_error = None
+        self._backoff = 0.0     # pause avant de retenter un lot en échec (exponentielle)
+        self._records = []      # mutations du stockage, dans l'ordre
+        self._files = {}        # chemin -> texte (la dernière version gagne)
+        self._waiters = []
+        self._writing = False
+        self._closing = False
+        self._wakeup = None
+        self._task = None
+
+    @property
+    def pending(self):
+        return len(self._records) + len(self._files)
+
+    def start(self):
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Écrit ce qui reste en file puis arrête la tâche."""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+    def submit(self, record):
+        self._records.append(record)
+        return self._schedule()
+
+    def submit_many(self, records):
+        """Plusieurs mutations dans le même lot (une seule écriture), un seul Future."""
+        self._records.extend(records)
+        return self._schedule()
+
+    def submit_file(self, path, text):
+        self._files[path] = text
+        return self._schedule()
+
+    async def flush(self):
+        """Attend que tout ce qui est en file (ou en cours d'écriture) soit sur disque."""
+        if self.pending or self._writing:
+            waiter = self._schedule()
+            if waiter is not None:
+                await waiter
+
+    def _schedule(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if self._task is None:
+            self._write(*self._take())
+            if loop is None:
+                return None
+            done = loop.create_future()
+            done.set_result(None)
+            return done
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        self._wakeup.set()
+        return waiter
+
+    def _take(self):
+        records, self._records = self._records, []
+        files, self._files = self._files, {}
+        return records, files
+
+    def _write(self, records, files):
+        if records:
+            self.storage.write(records)
+        for path, text in files.items():
+            _atomic_write_text(path, text)
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            if not self._closing:
+                await asyncio.sleep(self.debounce)     # on laisse la rafale se terminer
+            self._wakeup.clear()
+
+            records, files = self._take()
+            waiters, self._waiters = self._waiters, []
+            self._writing = True
+            try:
+                await asyncio.to_thread(self._write, records, files)
+            except Exception as exc:
+                # Rien n'est perdu : le lot repasse en tête de file (une version plus récente
+                # d'un fichier reste prioritaire) et sera retenté après une pause croissante.
+                self._records[:0] = records
+                for path, text in files.items():
+                    self._files.setdefault(path, text)
+                self.failures += 1
+                self.last_error = exc
+                PERSIST_FAILURES.inc(type(exc).__name__)
+                self._backoff = min(max(self._backoff * 2, PERSIST_RETRY_MIN), PERSIST_RETRY_MAX)
+                self._waiters[:0] = waiters         # résolus quand le lot sera vraiment écrit
+            else:
+                self.batches += 1
+                self._backoff = 0.0
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+                self.storage.after_write()
+            finally:
+                self._writing = False
+
+            if self._closing and not self.pending:
+                return
+            if self._backoff:
+                if self._closing and self._backoff > 4 * PERSIST_RETRY_MIN:     # 4 essais à l'arrêt
+                    print(f"⚠️ Arrêt : {self.pending} écriture(s) disque abandonnée(s) : {self.last_error!r}")
+                    waiters, self._waiters = self._waiters, []
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_exception(self.last_error)
+                    return
+                await asyncio.sleep(self._backoff)
+                self._wakeup.set()
+
+
+WRITER = PersistenceWriter(STORAGE, debounce=PERSIST_DEBOUNCE_MS / 1000)
+
+
+# Index calendrier (en mémoire, maintenu par add_event_record / remove_event_record) :
+# événements ponctuels par date absolue, récurrents par groupe (/del_event, /edit_event).
+# Construit à la première recherche (_calendar_ready), pas au démarrage.
+# Les rappels ont leur propre planificateur (REMINDERS).
+EVENTS_BY_DATE = {}     # date -> [event, ...]
+RECURRING_BY_CHAT = {}  # chat_id -> [event récurrent, ...]
+_CALENDAR_BUILT = False
+
+
+def _calendar_slot(event):
+    """(index, clé) où ranger l'event, ou None (anniversaire, date impossible)."""
+    if event.type is EventType.BIRTHDAY or not event.year:
+        return None
+    if event.rule is not None:
+        return RECURRING_BY_CHAT, event.chat_id
+    try:
+        return EVENTS_BY_DATE, date(event.year, event.month, event.day)
+    except ValueError:
+        return None     # date impossible enregistrée par une ancienne version
+
+
+def _calendar_ready():
+    """Construit l'index au premier besoin ; ensuite il est tenu à jour event par event."""
+    global _CALENDAR_BUILT
+    if not _CALENDAR_BUILT:
+        _CALENDAR_BUILT = True
+        for _, e in STORAGE.items():
+            _calendar_index(e)
+
+
+def _calendar_index(event):
+    slot = _calendar_slot(event) if _CALENDAR_BUILT else None
+    if slot is not None:
+        index, key = slot
+        index.setdefault(key, []).append(event)
+
+
+def _calendar_unindex(event):
+    slot = _calendar_slot(event) if _CALENDAR_BUILT else None
+    if slot is None:
+        return
+    index, key = slot
+    bucket = index.get(key, [])
+    for i, e in enumerate(bucket):
+        if e is event:
+            del bucket[i]
+            break
+    if not bucket:
+        index.pop(key, None)
+
+
+def load_data():
+    """Charge le stockage ; l'index calendrier et le tas des rappels viennent au premier besoin."""
+    global _CALENDAR_BUILT
+    if SHARD_RING is not None:
+        STORAGE.load(owns=owns_chat)
+    else:
+        STORAGE.load()
+    EVENTS_BY_DATE.clear()
+    RECURRING_BY_CHAT.clear()
+    _CALENDAR_BUILT = False
+    EVENTS_PER_CHAT.clear()
+    for _, e in STORAGE.items():
+        EVENTS_PER_CHAT[e.chat_id] = EVENTS_PER_CHAT.get(e.chat_id, 0) + 1
+    REMINDERS.load_later(STORAGE.items)
+
+# =========================
+# DRUNK MODE (IN-MEMORY)
+# =========================
+
+# key: (chat_id, user_id) -> expiry_ts or None (pas d'expiration)
+DRUNK_USERS = {}
+# key: (chat_id, user_id) -> {"text": "...", "created": ts, "prompt": [chat_id, message_id] or None}
+PENDING_MESSAGES = {}
+
+
+class ExpiryHeap:
+    """
+    Échéances rangées dans un tas : ajout et retrait en O(log n).
+    Ré-armer ou annuler une clé ne touche pas au tas : l'ancienne entrée
+    est simplement ignorée quand elle ressort (échéance différente).
+    """
+
+    def __init__(self):
+        self._heap = []         # (deadline_ts, kind, key)
+        self._deadlines = {}    # (kind, key) -> deadline_ts
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def schedule(self, kind, key, deadline_ts):
+        self._deadlines[(kind, key)] = deadline_ts
+        heapq.heappush(self._heap, (deadline_ts, kind, key))
+
+    def schedule_many(self, kind, items):
+        """[(key, deadline_ts), ...] d'un coup : un heapify au lieu d'un push par entrée."""
+        for key, deadline_ts in items:
+            self._deadlines[(kind, key)] = deadline_ts
+        self._heap.extend((deadline_ts, kind, key) for key, deadline_ts in items)
+        heapq.heapify(self._heap)
+
+    def cancel(self, kind, key):
+        self._deadlines.pop((kind, key), None)
+
+    def deadline(self, kind, key):
+        return self._deadlines.get((kind, key))
+
+    def next_deadline(self):
+        """Échéance la plus proche (les entrées périmées en tête sont retirées), None si vide."""
+        while self._heap:
+            deadline_ts, kind, key = self._heap[0]
+            if self._deadlines.get((kind, key)) == deadline_ts:
+                return deadline_ts
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now):
+        """Renvoie les (kind, key) arrivés à échéance."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline_ts, kind, key = heapq.heappop(self._heap)
+            if self._deadlines.get((kind, key)) == deadline_ts:
+                del self._deadlines[(kind, key)]
+                due.append((kind, key))
+        # Trop d'entrées périmées : on reconstruit le tas
+        if len(self._heap) > 2 * len(self._deadlines) + 1024:
+            self._heap = [(ts, kind, key) for (kind, key), ts in self._deadlines.items()]
+            heapq.heapify(self._heap)
+        return due
+
+
+DRUNK_EXPIRIES = ExpiryHeap()
+
+# Vue par groupe : chat_id -> {user_id, ...} en drunk mode (sert au filtre rapide)
+DRUNK_CHATS = {}
+
+
+class DrunkUserFilter(filters.MessageFilter):
+    """
+    Ne laisse passer que les messages d'un utilisateur en drunk mode dans ce chat.
+    Placé en tête du filtre du MessageHandler : pour l'immense majorité des messages,
+    c'est un seul dict.get et le handler n'est jamais programmé.
+    """
+
+    __slots__ = ()
+
+    def filter(self, message):
+        users = DRUNK_CHATS.get(message.chat_id)
+        return bool(users) and message.from_user is not None and message.from_user.id in users
+
+
+DRUNK_USER = DrunkUserFilter(name="DrunkUser")
+
+
+def set_drunk(key, expiry_ts):
+    DRUNK_USERS[key] = expiry_ts
+    DRUNK_CHATS.setdefault(key[0], set()).add(key[1])
+    _log_drunk("drunk", key, exp=expiry_ts)
+    if expiry_ts is None:
+        DRUNK_EXPIRIES.cancel("drunk", key)
+    else:
+        DRUNK_EXPIRIES.schedule("drunk", key, expiry_ts)
+
+
+def clear_drunk(key):
+    if key in DRUNK_USERS:
+        del DRUNK_USERS[key]
+        users = DRUNK_CHATS.get(key[0])
+        if users is not None:
+            users.discard(key[1])
+            if not users:
+                del DRUNK_CHATS[key[0]]
+        _log_drunk("sober", key)
+    DRUNK_EXPIRIES.cancel("drunk", key)
+    pop_pending(key)
+
+
+def set_pending(key, entry):
+    PENDING_MESSAGES[key] = entry
+    _log_drunk("pending", key, entry=entry)
+    DRUNK_EXPIRIES.schedule("pending", key, entry["created"] + PENDING_TIMEOUT_MINUTES * 60)
+
+
+def pop_pending(key):
+    DRUNK_EXPIRIES.cancel("pending", key)
+    stored = PENDING_MESSAGES.pop(key, None)
+    if stored is not None:
+        _log_drunk("done", key)
+    return stored
+
+
+def set_pending_prompt(key, prompt):
+    """Mémorise le message de confirmation (chat_id, message_id) d'un message retenu."""
+    stored = PENDING_MESSAGES.get(key)
+    if stored is not None:
+        stored["prompt"] = [prompt.chat_id, prompt.message_id]
+        _log_drunk("pending", key, entry=stored)
+
+
+# --- Persistance : snapshot + journal, écrits par un job (jamais sur le chemin des messages) ---
+#
+# drunk_state.json    : {"drunk": [[chat_id, user_id, expiry_ts], ...],
+#                        "pending": [[chat_id, user_id, {...}], ...]}
+# drunk_state.journal : une ligne par mutation depuis le snapshot
+#   {"op": "drunk", "key": [c, u], "exp": ts|null} / {"op": "sober", "key": [c, u]}
+#   {"op": "pending", "key": [c, u], "entry": {...}} / {"op": "done", "key": [c, u]}
+# Le journal contient tout l'historique depuis le snapshot : le rejouer en entier
+# par-dessus un snapshot plus récent redonne le même état.
+
+_DRUNK_LOG = []             # mutations en attente d'écriture (mémoire seulement)
+DRUNK_JOURNAL = Journal(DRUNK_JOURNAL_FILE, fsync_every=64)
+_DRUNK_FLUSH_LOCK = asyncio.Lock()
+
+
+def _log_drunk(op, key, **payload):
+    _DRUNK_LOG.append({"op": op, "key": list(key), **payload})
+
+
+def _apply_drunk_record(record):
+    key = tuple(record["key"])
+    op = record["op"]
+    if op == "drunk":
+        set_drunk(key, record["exp"])
+    elif op == "sober":
+        clear_drunk(key)
+    elif op == "pending":
+        set_pending(key, record["entry"])
+    elif op == "done":
+        pop_pending(key)
+
+
+def load_drunk_state():
+    for path in _state_paths(DRUNK_STATE_FILE):
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    snapshot = json.load(f)
+                for chat_id, user_id, expiry_ts in snapshot.get("drunk", []):
+                    if owns_chat(chat_id):
+                        set_drunk((chat_id, user_id), expiry_ts)
+                for chat_id, user_id, entry in snapshot.get("pending", []):
+                    if owns_chat(chat_id):
+                        set_pending((chat_id, user_id), entry)
+            except Exception:
+                print(f"⚠️ {path} illisible, on repart du journal seul")
+        journal_path = path[: -len(".json")] + ".journal"
+        for record in DRUNK_JOURNAL.replay(journal_path):
+            if owns_chat(record["key"][0]):
+                _apply_drunk_record(record)
+    # Ce qu'on vient de rejouer est déjà sur disque
+    _DRUNK_LOG.clear()
+
+
+def reset_drunk_state():
+    global DRUNK_EXPIRIES
+    DRUNK_USERS.clear()
+    PENDING_MESSAGES.clear()
+    DRUNK_CHATS.clear()
+    DRUNK_EXPIRIES = ExpiryHeap()
+
+
+def _drunk_snapshot_text():
+    return json.dumps(
+        {
+            "drunk": [[c, u, exp] for (c, u), exp in DRUNK_USERS.items()],
+            "pending": [[c, u, entry] for (c, u), entry in PENDING_MESSAGES.items()],
+        },
+        ensure_ascii=False,
+    )
+
+
+def _write_drunk_snapshot(text):
+    _atomic_write_text(DRUNK_STATE_FILE, text)
+    DRUNK_JOURNAL.close()
+    if os.path.exists(DRUNK_JOURNAL.path):
+        os.remove(DRUNK_JOURNAL.path)
+    DRUNK_JOURNAL.records = 0
+
+
+def _append_drunk_records(records):
+    for record in records:
+        DRUNK_JOURNAL.append(record)
+    DRUNK_JOURNAL.sync()
+
+
+async def flush_drunk_state(context: ContextTypes.DEFAULT_TYPE = None):
+    """Job régulier : écrit les mutations en attente (dans un thread), snapshot de temps en temps."""
+    async with _DRUNK_FLUSH_LOCK:
+        if not _DRUNK_LOG and DRUNK_JOURNAL.records < DRUNK_SNAPSHOT_EVERY:
+            return
+        if DRUNK_JOURNAL.records + len(_DRUNK_LOG) >= DRUNK_SNAPSHOT_EVERY:
+            # Le snapshot inclut toutes les mutations en attente
+            text = _drunk_snapshot_text()
+            _DRUNK_LOG.clear()
+            await asyncio.to_thread(_write_drunk_snapshot, text)
+            return
+        records = _DRUNK_LOG[:]
+        _DRUNK_LOG.clear()
+        await asyncio.to_thread(_append_drunk_records, records)
+
+
+
+async def drunk_sweeper(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Job régulier : retire les drunk modes expirés et annule les messages
+    en attente de confirmation depuis trop longtemps (en le disant dans le prompt).
+    """
+    for kind, key in DRUNK_EXPIRIES.pop_due(time.time()):
+        if kind == "drunk":
+            clear_drunk(key)
+            continue
+
+        stored = pop_pending(key)
+        if not stored or not stored.get("prompt"):
+            continue
+        prompt_chat_id, prompt_message_id = stored["prompt"]
+        try:
+            await context.bot.edit_message_text(
+                chat_id=prompt_chat_id,
+                message_id=prompt_message_id,
+                text="⌛ Pas de confirmation à temps : message annulé.",
+            )
+        except Exception:
+            # prompt supprimé entre-temps, etc.
+            pass
+
+
+# =========================
+# ENVOI SORTANT (RATE LIMIT)
+# =========================
+
+class TokenBucket:
+    """Seau à jetons : `rate` jetons par seconde, au plus `capacity` d'avance."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def has_token(self):
+        self._refill()
+        return self.tokens >= 1
+
+    def try_take(self):
+        """Prend un jeton si possible, sans attendre."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def delay(self):
+        """Délai (s) avant qu'un jeton soit disponible, sans le prendre."""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def reserve(self):
+        """Réserve un jeton et renvoie le délai (s) à attendre avant de l'utiliser."""
+        self._refill()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    @property
+    def idle(self):
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class _Outgoing:
+    __slots__ = ("chat_id", "text", "kwargs", "coalesce_key", "future", "attempts")
+
+    def __init__(self, chat_id, text, kwargs, coalesce_key, future):
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.coalesce_key = coalesce_key
+        self.future = future
+        self.attempts = 0
+
+
+class OutboundSender:
+    """
+    File d'envoi vers Telegram :
+    - seau à jetons global + un seau par chat (limites anti-flood de Telegram),
+    - une file par chat ; les chats qui ont des messages sont rangés dans un tas par
+      instant où leur seau aura un jeton, et `workers` envois partent en parallèle
+      au plus, chacun pour le chat prêt le plus tôt. Un chat limité attend dans le
+      tas sans occuper de worker ; il n'est jamais servi par deux workers à la fois
+      (ordre des messages conservé),
+    - RetryAfter (429) / erreur réseau : le chat est remis dans le tas avec le délai
+      demandé (aucun worker ne dort pour lui),
+    - coalescing : les messages d'un même chat avec la même `coalesce_key`
+      encore en file sont regroupés en un seul message.
+    """
+
+    MAX_TEXT = 4000         # marge sous la limite de 4096 caractères
+    MAX_ATTEMPTS = 5
+
+    def __init__(self, global_rate=25.0, private_rate=1.0, group_rate=20 / 60, workers=4):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self.workers = workers
+        self.bot = None
+        self.sent = 0
+        self.failed = 0
+        self._buckets = {}      # chat_id -> TokenBucket
+        self._pending = {}      # chat_id -> deque de _Outgoing (chat dans le tas ou en cours d'envoi)
+        self._ready = []        # tas (instant monotonic, n°, chat_id)
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._idle = None
+        self._tasks = []
+        self._open = {}         # (chat_id, coalesce_key) -> _Outgoing encore en file
+
+    def start(self, bot):
+        self.bot = bot
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        if not self._pending:
+            self._idle.set()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout=5.0):
+        if self._idle is not None:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @property
+    def queued(self):
+        return sum(len(items) for items in self._pending.values())
+
+    def send(self, chat_id, text, coalesce_key=None, **kwargs):
+        """
+        Met un message en file ; renvoie un Future résolu avec le Message envoyé
+        (ou l'exception Telegram). Les échecs non attendus sont loggés.
+        """
+        if coalesce_key is not None and not kwargs:
+            pending = self._open.get((chat_id, coalesce_key))
+            if pending is not None and len(pending.text) + len(text) + 1 <= self.MAX_TEXT:
+                pending.text += "\n" + text
+                return pending.future
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(self._log_failure)
+        item = _Outgoing(chat_id, text, kwargs, coalesce_key, future)
+        if coalesce_key is not None and not kwargs:
+            self._open[(chat_id, coalesce_key)] = item
+        items = self._pending.get(chat_id)
+        if items is None:
+            self._pending[chat_id] = deque([item])
+            self._schedule(chat_id, time.monotonic())
+            if self._idle is not None:
+                self._idle.clear()
+        else:
+            items.append(item)
+        return future
+
+    def _log_failure(self, future):
+        if future.cancelled() or future.exception() is None:
+            return
+        exc = future.exception()
+        self.failed += 1
+        SEND_FAILURES.inc(type(exc).__name__)
+        # Forbidden est le cas normal (MP à quelqu'un qui n'a jamais lancé le bot, bot retiré
+        # du groupe) : seulement compté ; les autres erreurs restent loggées.
+        if not isinstance(exc, Forbidden):
+            print(f"⚠️ Envoi Telegram échoué : {exc!r}")
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) > 10_000:
+                # ménage : on oublie les chats dont le seau est plein (inactifs)
+                self._buckets = {k: b for k, b in self._buckets.items() if not b.idle}
+            if chat_id < 0:     # groupe : ~20 messages / minute
+                bucket = TokenBucket(self.group_rate, 3)
+            else:               # privé : ~1 message / seconde
+                bucket = TokenBucket(self.private_rate, 1)
+            self._buckets[chat_id] = bucket
+        return bucket
+
+    def _schedule(self, chat_id, when):
+        heapq.heappush(self._ready, (when, next(self._seq), chat_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _next_chat(self):
+        """Prochain chat dont le seau a un jeton (jeton pris) ; attend sinon."""
+        while True:
+            timeout = None
+            if self._ready:
+                when, _, chat_id = self._ready[0]
+                now = time.monotonic()
+                if when <= now:
+                    heapq.heappop(self._ready)
+                    bucket = self._chat_bucket(chat_id)
+                    delay = bucket.delay()
+                    if delay:
+                        self._schedule(chat_id, now + delay)
+                        continue
+                    bucket.try_take()
+                    return chat_id
+                timeout = when - now
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._next_chat()
+            items = self._pending[chat_id]
+            item = items[0]
+            if item.coalesce_key is not None:
+                self._open.pop((item.chat_id, item.coalesce_key), None)
+            retry_in = None
+            try:
+                delay = self.global_bucket.reserve()    # limite globale : même attente pour tous
+                if delay:
+                    await asyncio.sleep(delay)
+                retry_in = await self._attempt(item)
+            except Exception as exc:
+                if not item.future.done():
+                    item.future.set_exception(exc)
+            finally:
+                if retry_in is None:
+                    items.popleft()
+                if items:
+                    self._schedule(chat_id, time.monotonic() + (retry_in or 0))
+                else:
+                    del self._pending[chat_id]
+                    if not self._pending:
+                        self._idle.set()
+
+    async def _attempt(self, item):
+        """Un envoi ; renvoie None s'il est terminé (future résolu), sinon le délai avant le suivant."""
+        item.attempts += 1
+        last = item.attempts >= self.MAX_ATTEMPTS
+        try:
+            message = await self.bot.send_message(chat_id=item.chat_id, text=item.text, **item.kwargs)
+        except RetryAfter as exc:
+            if last:
+                raise
+            retry_after = exc.retry_after
+            if hasattr(retry_after, "total_seconds"):
+                retry_after = retry_after.total_seconds()
+            return retry_after
+        except BadRequest:
+            # BadRequest hérite de NetworkError mais ne sert à rien de réessayer
+            raise
+        except (TimedOut, NetworkError):
+            if last:
+                raise
+            return 2 ** (item.attempts - 1)
+        self.sent += 1
+        if not item.future.done():
+            item.future.set_result(message)
+        return None
+
+
+def _worker_send_rate(nodes):
+    """Part de la limite globale Telegram (par bot) revenant à un worker : les workers
+    partagent le même token, la limite est donc répartie entre eux."""
+    return SEND_GLOBAL_RATE / max(1, len(nodes))
+
+
+SENDER = OutboundSender(
+    global_rate=_worker_send_rate(BOT_RING.split(",")) if BOT_RING else SEND_GLOBAL_RATE,
+    workers=SEND_WORKERS,
+)
+
+
+# =========================
+# MÉTRIQUES (FORMAT PROMETHEUS)
+# =========================
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels_text(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v).replace(chr(34), chr(39))}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, help_, labels=()):
+        self.name = name
+        self.help = help_
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for label_values, value in self.values.items():
+            yield f"{self.name}{_labels_text(self.labels, label_values)} {value}"
+
+
+class Histogram:
+    def __init__(self, name, help_, labels=(), buckets=_LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}   # label_values -> [counts par bucket..., sum, count]
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        names = self.labels + ("le",)
+        for label_values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels_text(names, label_values + (bound,))} {cumulative}"
+            yield f"{self.name}_bucket{_labels_text(names, label_values + ('+Inf',))} {series[-1]}"
+            labels = _labels_text(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {series[-2]}"
+            yield f"{self.name}_count{labels} {series[-1]}"
+
+
+class Gauge:
+    """Valeur lue au moment du scrape : `fn()` renvoie un nombre ou {label_values: nombre}."""
+
+    def __init__(self, name, help_, fn, labels=()):
+        self.name = name
+        self.help = help_
+        self.fn = fn
+        self.labels = labels
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in values.items():
+            yield f"{self.name}{_labels_text(self.labels, label_values)} {value}"
+
+
+HANDLER_SECONDS = Histogram("eventbot_handler_seconds", "Durée des handlers et jobs", ("handler",))
+HANDLER_ERRORS = Counter("eventbot_handler_errors_total", "Exceptions levées par les handlers et jobs", ("handler",))
+TELEGRAM_SECONDS = Histogram("eventbot_telegram_api_seconds", "Durée des appels Bot API", ("method",))
+TELEGRAM_FAILURES = Counter("eventbot_telegram_api_failures_total", "Appels Bot API en échec", ("method",))
+MISTRAL_SECONDS = Histogram("eventbot_mistral_seconds", "Durée des appels Mistral", ("outcome",))
+ASK_REQUESTS = Counter("eventbot_ask_requests_total", "Requêtes /ask par issue", ("outcome",))
+MISTRAL_FIRST_TOKEN_SECONDS = Histogram("eventbot_mistral_first_token_seconds", "Délai avant le premier token (streaming)")
+MISTRAL_TOKENS = Counter("eventbot_mistral_tokens_total", "Tokens consommés chez Mistral", ("kind",))
+SEND_FAILURES = Counter("eventbot_send_failures_total", "Messages abandonnés par le sender", ("error",))
+PERSIST_FAILURES = Counter("eventbot_persist_failures_total", "Lots d'écriture disque en échec (retentés)", ("error",))
+
+# chat_id -> nombre d'événements (maintenu par load_data / add_event_record)
+EVENTS_PER_CHAT = {}
+
+METRICS = [
+    HANDLER_SECONDS, HANDLER_ERRORS, TELEGRAM_SECONDS, TELEGRAM_FAILURES,
+    ASK_REQUESTS, MISTRAL_SECONDS, MISTRAL_FIRST_TOKEN_SECONDS, MISTRAL_TOKENS, SEND_FAILURES, PERSIST_FAILURES,
+    Gauge("eventbot_persist_pending", "Écritures disque en attente", lambda: WRITER.pending),
+    Gauge("eventbot_pending_messages", "Messages retenus en attente de confirmation",
+          lambda: len(PENDING_MESSAGES)),
+    Gauge("eventbot_drunk_users", "Utilisateurs en drunk mode", lambda: len(DRUNK_USERS)),
+    Gauge("eventbot_events", "Événements enregistrés par groupe",
+          lambda: {(chat_id,): n for chat_id, n in EVENTS_PER_CHAT.items()}, ("chat_id",)),
+    Gauge("eventbot_ask_cache_hits", "Hits du cache /ask", lambda: ASK_CACHE.hits),
+    Gauge("eventbot_ask_cache_misses", "Misses du cache /ask", lambda: ASK_CACHE.misses),
+    Gauge("eventbot_outbound_queued", "Messages en file d'envoi", lambda: SENDER.queued),
+    Gauge("eventbot_update_queue_depth", "Updates en file (tous groupes)",
+          lambda: sum(UPDATE_PROCESSOR.queue_depths())),
+    Gauge("eventbot_update_active_chats", "Groupes avec des updates en cours",
+          lambda: len(UPDATE_PROCESSOR.queue_depths())),
+]
+
+
+def render_metrics():
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+def instrumented(func):
+    """Enveloppe un handler / job : durée + exceptions, par nom de fonction."""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, name)
+
+    return wrapper
+
+
+def instrument_handlers(app):
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            handler.callback = instrumented(handler.callback)
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """Requêtes Bot API chronométrées, échecs comptés par méthode (sendMessage, deleteMessage...)."""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        start = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            TELEGRAM_FAILURES.inc(api_method)
+            raise
+        finally:
+            TELEGRAM_SECONDS.observe(time.perf_counter() - start, api_method)
+        if code >= 400:
+            TELEGRAM_FAILURES.inc(api_method)
+        return code, payload
+
+
+class SamplingProfiler:
+    """
+    Profiler par échantillonnage, activable à chaud (GET /profile/start, /profile/stop) :
+    un thread relève la pile du thread de la boucle toutes les `interval` secondes.
+    GET /profile renvoie les piles agrégées au format "collapsed" (flamegraph.pl, speedscope).
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = {}
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, thread_id):
+        if self.running:
+            return
+        self.samples = {}
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(thread_id,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self, thread_id):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            self.samples[key] = self.samples.get(key, 0) + 1
+
+    def render(self):
+        samples = self.samples.copy()   # copie atomique : le thread peut encore écrire
+        return "\n".join(f"{stack} {n}" for stack, n in sorted(samples.items())) + "\n"
+
+
+PROFILER = SamplingProfiler()
+_METRICS_SERVER = None
+
+
+async def _metrics_http(method, path, headers, body):
+    if path == "/metrics":
+        return 200, "text/plain; version=0.0.4", render_metrics().encode("utf-8")
+    if path == "/profile/start":
+        PROFILER.start(threading.get_ident())
+        return 200, "text/plain", b"profiler on\n"
+    if path == "/profile/stop":
+        PROFILER.stop()
+        return 200, "text/plain", b"profiler off\n"
+    if path == "/profile":
+        return 200, "text/plain", PROFILER.render().encode("utf-8")
+    return 404, "text/plain", b"not found"
+
+
+async def start_metrics_server():
+    """/metrics (et /profile) en local ; port éphémère pour les workers du mode sharded."""
+    global _METRICS_SERVER
+    if not METRICS_PORT:
+        return
+    server = HttpServer(_metrics_http)
+    try:
+        port = await server.start(METRICS_LISTEN, 0 if BOT_WORKER else METRICS_PORT)
+    except OSError as exc:
+        # Port déjà pris (Prometheus, autre instance) : le bot démarre quand même
+        print(f"⚠️ Métriques désactivées ({METRICS_LISTEN}:{METRICS_PORT}) : {exc}")
+        return
+    _METRICS_SERVER = server
+    print(f"Métriques sur http://{METRICS_LISTEN}:{port}/metrics")
+
+
+async def stop_metrics_server():
+    PROFILER.stop()
+    if _METRICS_SERVER is not None:
+        await _METRICS_SERVER.stop()
+
+
+# =========================
+# MISTRAL
+# =========================
+
+# Limite le nombre d'appels Mistral simultanés (les suivants attendent leur tour)
+MISTRAL_SEMAPHORE = asyncio.Semaphore(MISTRAL_MAX_CONCURRENCY)
+
+
+async def ask_mistral(prompt: str) -> str:
+    """
+    Appel Mistral non bloquant.
+    Lève asyncio.TimeoutError si la réponse n'arrive pas dans MISTRAL_TIMEOUT
+    (attente du sémaphore comprise).
+    """
+    async def _call():
+        async with MISTRAL_SEMAPHORE:
+            return await mistral.chat(
+                model="mistral-small-latest",
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.9,
+                max_tokens=100,
+            )
+
+    start = time.perf_counter()
+    try:
+        completion = await asyncio.wait_for(_call(), timeout=MISTRAL_TIMEOUT)
+    except asyncio.TimeoutError:
+        MISTRAL_SECONDS.observe(time.perf_counter() - start, "timeout")
+        raise
+    except Exception:
+        MISTRAL_SECONDS.observe(time.perf_counter() - start, "error")
+        raise
+    MISTRAL_SECONDS.observe(time.perf_counter() - start, "ok")
+    if completion.usage is not None:
+        MISTRAL_TOKENS.inc("prompt", amount=completion.usage.prompt_tokens)
+        MISTRAL_TOKENS.inc("completion", amount=completion.usage.completion_tokens or 0)
+    return completion.choices[0].message.content
+
+
+async def ask_mistral_stream(prompt: str):
+    """
+    Version streaming : générateur async des morceaux de texte, au fil de l'eau.
+    Même budget MISTRAL_TIMEOUT que ask_mistral (sémaphore + réponse complète).
+    """
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    deadline = loop.time() + MISTRAL_TIMEOUT
+    outcome = "error"
+    first = True
+
+    await asyncio.wait_for(MISTRAL_SEMAPHORE.acquire(), timeout=MISTRAL_TIMEOUT)
+    stream = mistral.chat_stream(
+        model="mistral-small-latest",
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.9,
+        max_tokens=100,
+    )
+    try:
+        while True:
+            try:
+                chunk = await asyncio.wait_for(
+                    stream.__anext__(), timeout=max(0.0, deadline - loop.time())
+                )
+            except StopAsyncIteration:
+                break
+            if chunk.usage is not None:
+                MISTRAL_TOKENS.inc("prompt", amount=chunk.usage.prompt_tokens)
+                MISTRAL_TOKENS.inc("completion", amount=chunk.usage.completion_tokens or 0)
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                if first:
+                    MISTRAL_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - start)
+                    first = False
+                yield delta
+        outcome = "ok"
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        raise
+    finally:
+        MISTRAL_SEMAPHORE.release()
+        MISTRAL_SECONDS.observe(time.perf_counter() - start, outcome)
+        await stream.aclose()
+
+
+
+# =========================
+# CACHE /ASK (LRU + TTL)
+# =========================
+
+_QUESTION_SPACES_RE = re.compile(r"\s+")
+_QUESTION_TRAILING_RE = re.compile(r"[\s?!.…]+$")
+
+
+def normalize_question(question: str) -> str:
+    """'  On sort  ce soir ?? ' -> 'on sort ce soir'"""
+    q = _QUESTION_SPACES_RE.sub(" ", question.strip().lower())
+    return _QUESTION_TRAILING_RE.sub("", q)
+
+
+class AskCache:
+    """
+    Cache LRU avec expiration (TTL) pour les réponses de /ask.
+    Clé = hash(template du prompt) + question normalisée : si le prompt change,
+    les anciennes réponses ne sont plus servies.
+    """
+
+    def __init__(self, max_size=512, ttl=3600.0, path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        # key -> (expiry_ts, answer), ordre = du moins au plus récemment utilisé
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def make_key(template: str, question: str) -> str:
+        tpl_hash = hashlib.sha1(template.encode("utf-8")).hexdigest()[:12]
+        return f"{tpl_hash}:{normalize_question(question)}"
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expiry_ts, answer = entry
+        if expiry_ts < time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return answer
+
+    def put(self, key, answer):
+        self._entries[key] = (time.time() + self.ttl, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+    def load(self):
+        """Recharge le cache depuis le disque (entrées expirées ignorées)."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except Exception:
+            return
+        now = time.time()
+        for key, expiry_ts, answer in raw:
+            if expiry_ts > now:
+                self._entries[key] = (expiry_ts, answer)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def save(self):
+        if not self.path:
+            return
+        now = time.time()
+        raw = [[k, exp, ans] for k, (exp, ans) in self._entries.items() if exp > now]
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(raw, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+
+ASK_CACHE = AskCache(max_size=ASK_CACHE_SIZE, ttl=ASK_CACHE_TTL, path=ASK_CACHE_FILE)
+
+
+# =========================
+# QUOTAS /ASK + COALESCING
+# =========================
+
+class AskQuota:
+    """
+    Seaux à jetons par utilisateur, par groupe et global pour les appels Mistral.
+    Un appel n'est accepté que si les trois seaux ont un jeton.
+    """
+
+    def __init__(self, user_per_hour, chat_per_hour, global_per_minute):
+        self.user_per_hour = user_per_hour
+        self.chat_per_hour = chat_per_hour
+        self.global_bucket = TokenBucket(global_per_minute / 60, global_per_minute)
+        self._users = {}
+        self._chats = {}
+
+    @staticmethod
+    def _bucket(buckets, key, per_hour):
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) > 10_000:
+                # ménage : on oublie les seaux pleins (inactifs)
+                for k in [k for k, b in buckets.items() if b.idle]:
+                    del buckets[k]
+            # rafale autorisée : un quart du quota horaire
+            bucket = buckets[key] = TokenBucket(per_hour / 3600, max(1, per_hour // 4))
+        return bucket
+
+    def allow(self, chat_id, user_id):
+        buckets = (
+            self._bucket(self._users, user_id, self.user_per_hour),
+            self._bucket(self._chats, chat_id, self.chat_per_hour),
+            self.global_bucket,
+        )
+        if not all(b.has_token() for b in buckets):
+            return False
+        for b in buckets:
+            b.try_take()
+        return True
+
+
+ASK_QUOTA = AskQuota(ASK_QUOTA_USER_PER_HOUR, ASK_QUOTA_CHAT_PER_HOUR, ASK_QUOTA_GLOBAL_PER_MINUTE)
+
+# cache_key -> Future de la réponse en cours (singleflight)
+ASK_INFLIGHT = {}
+
+ASK_PROMPT_TEMPLATE = """
+Tu es un mec un peu facho sur les bords et tu fais que des réponses catchy et bordeline en UNE ou DEUX phrases maximum.
+Question: {question}
+"""
+
+
+async def ask(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not context.args:
+        await update.message.reply_text("Pose une question : /ask Dois-je sortir ce soir ?")
+        return
+
+    question = " ".join(context.args)
+
+    # Question déjà posée récemment => réponse directe, sans appel réseau
+    cache_key = AskCache.make_key(ASK_PROMPT_TEMPLATE, question)
+    answer = ASK_CACHE.get(cache_key)
+    if answer is not None:
+        ASK_REQUESTS.inc("cache")
+        await update.message.reply_text(f"❓ {question}\n🔮 {answer}")
+        return
+
+    chat_id = update.effective_chat.id
+
+    # Même question déjà en route vers Mistral => on attend sa réponse (un seul appel)
+    inflight = ASK_INFLIGHT.get(cache_key)
+    if inflight is not None:
+        ASK_REQUESTS.inc("coalesced")
+        answer = await asyncio.shield(inflight)
+        if answer is None:
+            await update.message.reply_text("😵 Mistral ne répond pas pour le moment.")
+            return
+        await SENDER.send(chat_id, f"❓ {question}\n🔮 {answer}")
+        return
+
+    # Quota dépassé => réponse de secours de la boule magique, sans appel Mistral
+    if not ASK_QUOTA.allow(chat_id, update.effective_user.id):
+        ASK_REQUESTS.inc("quota")
+        await SENDER.send(
+            chat_id,
+            f"❓ {question}\n🎱 {random.choice(MAGIC_8BALL_ANSWERS)}\n"
+            "(Trop de questions, Mistral fait une pause : c'est la boule magique qui répond.)",
+        )
+        return
+
+    # prompt de base
+    base_prompt = ASK_PROMPT_TEMPLATE.format(question=question)
+
+    ASK_REQUESTS.inc("upstream")
+    future = asyncio.get_running_loop().create_future()
+    ASK_INFLIGHT[cache_key] = future
+    answer = None
+    try:
+        if ASK_STREAMING:
+            answer = await _ask_streaming(update, context, question, base_prompt)
+        else:
+            answer = await _ask_blocking(update, question, base_prompt)
+        if answer is not None:
+            ASK_CACHE.put(cache_key, answer)
+    finally:
+        del ASK_INFLIGHT[cache_key]
+        future.set_result(answer)
+
+
+async def _ask_blocking(update, question, base_prompt):
+    """Réponse en un seul message ; renvoie la réponse, ou None si Mistral a échoué."""
+    try:
+        answer = await ask_mistral(base_prompt)
+    except asyncio.TimeoutError:
+        await update.message.reply_text("⏳ Mistral met trop de temps à répondre, réessaie plus tard.")
+        return None
+    except Exception:
+        await update.message.reply_text("😵 Mistral ne répond pas pour le moment.")
+        return None
+
+    await SENDER.send(update.effective_chat.id, f"❓ {question}\n🔮 {answer}")
+    return answer
+
+
+async def _edit_answer(context, message, text):
+    """Édite la réponse en cours ; renvoie le délai imposé par Telegram (RetryAfter) ou 0."""
+    try:
+        await context.bot.edit_message_text(
+            chat_id=message.chat_id, message_id=message.message_id, text=text
+        )
+    except RetryAfter as exc:
+        retry_after = exc.retry_after
+        return retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else retry_after
+    except BadRequest:
+        pass    # "message is not modified", message supprimé...
+    return 0
+
+
+async def _ask_streaming(update, context, question, base_prompt):
+    """
+    Réponse progressive : un message d'attente tout de suite, puis édité au fil
+    des tokens, au plus une fois toutes les ASK_EDIT_INTERVAL secondes.
+    Renvoie la réponse complète, ou None si elle a été coupée / n'est pas venue.
+    """
+    loop = asyncio.get_running_loop()
+    header = f"❓ {question}\n🔮 "
+    message = await SENDER.send(update.effective_chat.id, header + "…")
+
+    answer = ""
+    complete = False
+    shown = header + "…"
+    next_edit = 0.0     # le premier token est affiché immédiatement
+    try:
+        async for delta in ask_mistral_stream(base_prompt):
+            answer += delta
+            if loop.time() >= next_edit:
+                shown = header + answer + " …"
+                wait = await _edit_answer(context, message, shown)
+                next_edit = loop.time() + max(ASK_EDIT_INTERVAL, wait)
+    except asyncio.TimeoutError:
+        if not answer:
+            await _edit_answer(context, message, "⏳ Mistral met trop de temps à répondre, réessaie plus tard.")
+            return None
+        answer += " […]"
+    except Exception:
+        if not answer:
+            await _edit_answer(context, message, "😵 Mistral ne répond pas pour le moment.")
+            return None
+        answer += " […]"
+    else:
+        complete = True
+
+    final = header + answer
+    if final != shown:
+        await _edit_answer(context, message, final)
+    return answer if complete else None
+
+
+
+# =========================
+# COMMANDES DRUNK MODE
+# =========================
+
+async def drunk_on(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Active le drunk mode pour l'utilisateur dans ce groupe."""
+    if update.effective_chat.type not in ("group", "supergroup"):
+        await update.message.reply_text("Cette commande est faite pour un groupe 😉")
+        return
+
+    chat_id = update.effective_chat.id
+    user_id = update.effective_user.id
+
+    expiry_ts = None
+    if context.args:
+        try:
+            minutes = int(context.args[0])
+            expiry_ts = time.time() + minutes * 60
+            msg_extra = f" pour {minutes} minutes"
+        except ValueError:
+            msg_extra = ""
+    else:
+        msg_extra = ""
+
+    set_drunk((chat_id, user_id), expiry_ts)
+
+    await update.message.reply_text(
+        f"🥴 Drunk Mode activé pour {update.effective_user.first_name}{msg_extra}.\n"
+        f"Tes messages devront être confirmés avant d'être visibles."
+    )
+
+
+async def drunk_off(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Désactive le drunk mode pour l'utilisateur dans ce groupe."""
+    chat_id = update.effective_chat.id
+    user_id = update.effective_user.id
+
+    key = (chat_id, user_id)
+    if key in DRUNK_USERS:
+        clear_drunk(key)
+        await update.message.reply_text("✅ Drunk Mode désactivé.")
+    else:
+        await update.message.reply_text("Tu n'es pas en Drunk Mode dans ce groupe.")
+
+
+async def drunk_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Statut du drunk mode."""
+    chat_id = update.effective_chat.id
+    user_id = update.effective_user.id
+    key = (chat_id, user_id)
+
+    now = time.time()
+    expiry_ts = DRUNK_USERS.get(key)
+
+    if expiry_ts is None and key in DRUNK_USERS:
+        await update.message.reply_text("🥴 Tu es actuellement en Drunk Mode (sans limite de temps).")
+    elif expiry_ts and expiry_ts > now:
+        remaining = int((expiry_ts - now) / 60)
+        await update.message.reply_text(
+            f"🥴 Tu es en Drunk Mode pour encore ~{remaining} minute(s)."
+        )
+    else:
+        await update.message.reply_text("Tu n'es pas en Drunk Mode dans ce groupe.")
+
+
+# =========================
+# GESTION DES MESSAGES (DRUNK)
+# =========================
+
+async def drunk_message_filter(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Intercepte les messages des utilisateurs en Drunk Mode
+    dans les groupes et demande confirmation.
+    """
+    if not update.message:
+        return
+
+    chat = update.effective_chat
+    if chat.type not in ("group", "supergroup"):
+        return
+
+    user = update.effective_user
+    if user.is_bot:
+        return
+
+    text = update.message.text
+    if not text:
+        return
+
+    chat_id = chat.id
+    user_id = user.id
+    key = (chat_id, user_id)
+
+    # Gestion expiration
+    now = time.time()
+    expiry_ts = DRUNK_USERS.get(key)
+    if expiry_ts is not None:
+        if expiry_ts < now:
+            # Expiré (le sweeper n'est pas encore passé)
+            clear_drunk(key)
+            return
+
+    if key not in DRUNK_USERS:
+        return  # pas en drunk mode => on laisse passer
+
+    # On est en drunk mode : on supprime le message et on demande confirmation
+    set_pending(key, {"text": text, "created": now, "prompt": None})
+
+    # Supprimer le message original
+    try:
+        await context.bot.delete_message(chat_id=chat_id, message_id=update.message.message_id)
+    except Exception:
+        # Si le bot n'est pas admin / pas le droit, on ne pourra pas supprimer
+        # Dans ce cas, on sort (le message est resté visible, rien à retenir).
+        pop_pending(key)
+        return
+
+    # Clavier de confirmation
+    data_confirm = f"confirm|{chat_id}|{user_id}"
+    data_cancel = f"cancel|{chat_id}|{user_id}"
+    keyboard = [
+        [
+            InlineKeyboardButton("✅ Envoyer", callback_data=data_confirm),
+            InlineKeyboardButton("❌ Annuler", callback_data=data_cancel),
+        ]
+    ]
+    markup = InlineKeyboardMarkup(keyboard)
+
+    preview = text if len(text) <= 120 else text[:117] + "..."
+
+    # On tente en DM en priorité
+    try:
+        prompt = await SENDER.send(
+            user_id,
+            (
+                "🥴 Tu es en Drunk Mode.\n"
+                "Je viens de retenir ce message :\n\n"
+                f"« {preview} »\n\n"
+                "Je l'envoie dans le groupe ?"
+            ),
+            reply_markup=markup,
+        )
+    except Exception:
+        # Si DM impossible, on passe par le groupe
+        prompt = await SENDER.send(
+            chat_id,
+            (
+                f"🥴 @{user.username or user.first_name}, tu es en Drunk Mode.\n"
+                "Je retiens ton message. Je l'envoie ?\n\n"
+                f"« {preview} »"
+            ),
+            reply_markup=markup,
+        )
+
+    # Pour pouvoir éditer le prompt si la confirmation n'arrive jamais
+    set_pending_prompt(key, prompt)
+
+
+async def drunk_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Gestion des boutons ✅/❌."""
+    query = update.callback_query
+    await query.answer()
+
+    data = query.data  # format: "confirm|chat_id|user_id" ou "cancel|..."
+    try:
+        action, chat_id_str, user_id_str = data.split("|")
+        chat_id = int(chat_id_str)
+        target_user_id = int(user_id_str)
+    except ValueError:
+        return
+
+    # Sécurité : seul l'utilisateur concerné peut confirmer/annuler
+    if query.from_user.id != target_user_id:
+        await query.edit_message_text("Tu ne peux pas valider ce message.")
+        return
+
+    key = (chat_id, target_user_id)
+    stored = PENDING_MESSAGES.get(key)
+
+    if action == "cancel":
+        pop_pending(key)
+        await query.edit_message_text("❌ Message annulé.")
+        return
+
+    if action == "confirm":
+        if not stored:
+            await query.edit_message_text("Le message a expiré ou a déjà été traité.")
+            return
+
+        text = stored["text"]
+        pop_pending(key)
+
+        username = query.from_user.username
+        display_name = f"@{username}" if username else query.from_user.first_name
+
+        # On envoie dans le groupe
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=f"💬 Message validé par {display_name} :\n{text}",
+        )
+
+        await query.edit_message_text("✅ Message envoyé dans le groupe.")
+
+
+# =========================
+# MAGIC 8-BALL
+# =========================
+
+MAGIC_8BALL_ANSWERS = [
+    "Oui, clairement. ✅",
+    "Non, laisse tomber. ❌",
+    "Probablement oui.",
+    "Probablement pas.",
+    "Mmmmm… j’hésite, repose la question plus tard.",
+    "Je ne suis pas sûr, mais ça sent bon. ✨",
+    "Je ne suis pas sûr, mais ça sent le plan foireux. 🤔",
+    "Les astres sont alignés. 🌙",
+    "C’est un grand oui, fonce. 🚀",
+    "C’est un non poli. 🫠",
+    "Demande plutôt un verre d'abord.",
+    "Tu connais déjà la réponse.",
+    "Si tu dois hésiter autant, c’est non.",
+    "Si ça te fait rire rien qu’en y pensant, fais-le.",
+    "Si ça t’angoisse rien qu’en y pensant, évite."
+    "T'as cru que j'étais ta mère pour décider pour toi ?"
+]
+
+
+async def magic_8ball(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /8ball Est-ce qu’on fait une raclette ce soir ?
+    """
+    if context.args:
+        question = " ".join(context.args)
+    else:
+        question = None
+
+    answer = random.choice(MAGIC_8BALL_ANSWERS)
+
+    if question:
+        await update.message.reply_text(
+            f"❓ {question}\n\n🎱 {answer}"
+        )
+    else:
+        await update.message.reply_text(
+            f"🎱 {answer}"
+        )
+
+
+# =========================
+# PARSING DES ARGUMENTS (DATES, HEURES, MENTIONS)
+# =========================
+
+# Tout est compilé / construit une fois au chargement du module ; les handlers
+# passent leurs context.args (déjà découpés par Telegram) tels quels.
+
+MONTHS = {
+    "janvier": 1, "janv": 1, "jan": 1,
+    "février": 2, "fevrier": 2, "févr": 2, "fevr": 2, "fév": 2, "fev": 2,
+    "mars": 3,
+    "avril": 4, "avr": 4,
+    "mai": 5,
+    "juin": 6,
+    "juillet": 7, "juil": 7,
+    "août": 8, "aout": 8,
+    "septembre": 9, "sept": 9, "sep": 9,
+    "octobre": 10, "oct": 10,
+    "novembre": 11, "nov": 11,
+    "décembre": 12, "decembre": 12, "déc": 12, "dec": 12,
+}
+WEEKDAYS = {"lundi": 0, "mardi": 1, "mercredi": 2, "jeudi": 3, "vendredi": 4, "samedi": 5, "dimanche": 6}
+WEEKDAY_NAMES = list(WEEKDAYS)
+RELATIVE_DAYS = {
+    "aujourd'hui": 0, "aujourd’hui": 0, "auj": 0,
+    "demain": 1,
+    "après-demain": 2, "apres-demain": 2,
+}
+_IN_UNITS = {"jour": 1, "jours": 1, "semaine": 7, "semaines": 7}
+_NEXT_WORDS = frozenset({"prochain", "prochaine"})
+_AT_WORDS = frozenset({"à", "a", "vers"})
+_ORDINALS = {
+    "premier": 1, "première": 1, "premiere": 1, "1er": 1, "1re": 1, "1ère": 1,
+    "deuxième": 2, "deuxieme": 2, "second": 2, "seconde": 2, "2e": 2, "2ème": 2,
+    "troisième": 3, "troisieme": 3, "3e": 3, "3ème": 3,
+    "quatrième": 4, "quatrieme": 4, "4e": 4, "4ème": 4,
+    "dernier": -1, "dernière": -1, "derniere": -1,
+}
+_YEARLY_WORDS = (("tous", "les", "ans"), ("chaque", "année"), ("chaque", "annee"))
+
+_NUMERIC_DATE_RE = re.compile(r"(\d{1,2})[-/.](\d{1,2})(?:[-/.](\d{4}|\d{2}))?")
+_DAY_RE = re.compile(r"(\d{1,2})(?:er)?")
+_YEAR_RE = re.compile(r"\d{4}")
+_TIME_RE = re.compile(r"(\d{1,2})(?:h(\d{2})?|:(\d{2}))")
+_MAX_DAYS_AHEAD = 3660
+
+
+def _full_year(raw):
+    year = int(raw)
+    return year + 2000 if len(raw) == 2 else year
+
+
+def _make_date(year, month, day, raw):
+    try:
+        return date(year, month, day)
+    except ValueError:
+        raise ValueError(f"Date impossible : {raw}") from None
+
+
+def _next_occurrence(day, month, today, raw):
+    """Prochain JJ-MM à partir d'aujourd'hui (29-02 : prochaine année bissextile)."""
+    _make_date(2000, month, day, raw)   # 2000 est bissextile : ne rejette que les dates impossibles
+    for year in range(today.year, today.year + 9):
+        try:
+            d = date(year, month, day)
+        except ValueError:
+            continue
+        if d >= today:
+            return d
+    raise ValueError(f"Date impossible : {raw}")
+
+
+def _parse_date(tokens, today):
+    first = tokens[0].casefold()
+
+    if first in RELATIVE_DAYS:
+        return today + timedelta(days=RELATIVE_DAYS[first]), 1
+
+    if first in WEEKDAYS:
+        # "samedi" / "samedi prochain" : le prochain samedi après aujourd'hui
+        ahead = (WEEKDAYS[first] - today.weekday() - 1) % 7 + 1
+        n = 2 if len(tokens) > 1 and tokens[1].casefold() in _NEXT_WORDS else 1
+        return today + timedelta(days=ahead), n
+
+    if first == "dans" and len(tokens) >= 3 and tokens[1].isdigit() and tokens[2].casefold() in _IN_UNITS:
+        days = int(tokens[1]) * _IN_UNITS[tokens[2].casefold()]
+        if days > _MAX_DAYS_AHEAD:
+            raise ValueError(f"Date trop lointaine : {' '.join(tokens[:3])}")
+        return today + timedelta(days=days), 3
+
+    m = _NUMERIC_DATE_RE.fullmatch(first)
+    if m:
+        day, month = int(m[1]), int(m[2])
+        if m[3]:
+            return _make_date(_full_year(m[3]), month, day, tokens[0]), 1
+        return _next_occurrence(day, month, today, tokens[0]), 1
+
+    m = _DAY_RE.fullmatch(first)
+    if m and len(tokens) >= 2 and tokens[1].casefold() in MONTHS:
+        day, month = int(m[1]), MONTHS[tokens[1].casefold()]
+        if len(tokens) >= 3 and _YEAR_RE.fullmatch(tokens[2]):
+            return _make_date(int(tokens[2]), month, day, " ".join(tokens[:3])), 3
+        return _next_occurrence(day, month, today, " ".join(tokens[:2])), 2
+
+    return None, 0
+
+
+def parse_time(tokens):
+    """
+    Heure au début de `tokens` : "20h", "20h30", "20:30", précédée ou non de "à" / "vers".
+    Renvoie (minutes depuis minuit, nb de tokens lus) ; (None, 0) si pas d'heure.
+    ValueError si l'heure est impossible (25h, 20h75).
+    """
+    n = 1 if tokens and tokens[0].casefold() in _AT_WORDS else 0
+    if n < len(tokens):
+        m = _TIME_RE.fullmatch(tokens[n].casefold())
+        if m:
+            hour, minute = int(m[1]), int(m[2] or m[3] or 0)
+            if hour > 23 or minute > 59:
+                raise ValueError(f"Heure impossible : {tokens[n]}")
+            return hour * 60 + minute, n + 1
+    return None, 0
+
+
+def _singular(word, table):
+    """"jeudis" -> "jeudi", "premiers" -> "premier" (si le singulier est dans `table`)."""
+    if word not in table and word.endswith("s") and word[:-1] in table:
+        return word[:-1]
+    return word
+
+
+def parse_rule_prefix(tokens, today):
+    """
+    Récurrence au début de `tokens` : "tous les jeudis", "chaque jeudi",
+    "chaque premier vendredi [du mois]", "tous les derniers vendredis du mois",
+    "le 1er vendredi du mois". Renvoie (règle, première date >= today, nb de tokens lus) ;
+    (None, None, 0) s'il n'y a pas de règle.
+    """
+    words = [t.casefold() for t in tokens[:6]]
+    if words[:1] == ["chaque"]:
+        i, every = 1, True
+    elif words[:2] in (["tous", "les"], ["toutes", "les"]):
+        i, every = 2, True
+    else:
+        i, every = (1 if words[:1] == ["le"] else 0), False
+
+    nth = _ORDINALS.get(_singular(words[i], _ORDINALS)) if i < len(words) else None
+    if nth is not None:
+        i += 1
+    weekday = WEEKDAYS.get(_singular(words[i], WEEKDAYS)) if i < len(words) else None
+    if weekday is None:
+        return None, None, 0
+    i += 1
+
+    if nth is None:
+        if not every:
+            return None, None, 0    # "jeudi" seul : une date, pas une règle
+        rule = f"weekly:{weekday}"
+    else:
+        if words[i:i + 2] == ["du", "mois"]:
+            i += 2
+        elif not every:
+            return None, None, 0
+        rule = f"monthly:{nth}:{weekday}"
+    return rule, recurrence(rule).first(today), i
+
+
+def parse_when(tokens, today):
+    """
+    Date ou récurrence, heure éventuelle, puis "tous les ans" éventuel :
+    "14-02-2026 20h", "tous les jeudis à 20h", "premier vendredi du mois 19h", "14-02 tous les ans".
+    Renvoie (première date, minutes ou None, règle ou None, nb de tokens lus) ;
+    (None, None, None, 0) s'il n'y a pas de date. ValueError si la date ou l'heure est impossible.
+    """
+    rule, d, n = parse_rule_prefix(tokens, today)
+    if rule is not None:
+        minutes, m = parse_time(tokens[n:])
+        return d, minutes, rule, n + m
+
+    d, minutes, n = parse_date_prefix(tokens, today)
+    if d is None:
+        return None, None, None, 0
+    words = tuple(t.casefold() for t in tokens[n:n + 3])
+    for suffix in _YEARLY_WORDS:
+        if words[:len(suffix)] == suffix:
+            rule, n = "yearly", n + len(suffix)
+            if minutes is None:
+                minutes, m = parse_time(tokens[n:])
+                n += m
+            break
+    return d, minutes, rule, n
+
+
+def parse_date_prefix(tokens, today):
+    """
+    Date (et heure éventuelle) au début de `tokens` :
+    "14-02-2026", "14/02", "15 février", "1er mars 2027", "demain", "après-demain",
+    "samedi", "samedi prochain", "dans 3 jours", puis éventuellement "[à] 20h30".
+    Sans année : prochaine occurrence à partir de `today`.
+    Renvoie (date, minutes ou None, nb de tokens lus) ; (None, None, 0) s'il n'y a pas de date.
+    ValueError si la date ou l'heure est impossible (31-02, 25h).
+    """
+    if not tokens:
+        return None, None, 0
+    d, n = _parse_date(tokens, today)
+    if d is None:
+        return None, None, 0
+    minutes, m = parse_time(tokens[n:])
+    return d, minutes, n + m
+
+
+def parse_day_month_suffix(tokens):
+    """
+    Date d'anniversaire à la fin de `tokens` : "15-02", "15/02", "15.02.1990",
+    "15 février", "1er mars 1990" (l'année ne sert qu'à valider le 29-02).
+    Renvoie (jour, mois, nb de tokens lus) ; (None, None, 0) s'il n'y a pas de date.
+    ValueError si la date est impossible (31-02).
+    """
+    if not tokens:
+        return None, None, 0
+    last = tokens[-1].casefold()
+
+    m = _NUMERIC_DATE_RE.fullmatch(last)
+    if m:
+        year = _full_year(m[3]) if m[3] else 2000
+        d = _make_date(year, int(m[2]), int(m[1]), tokens[-1])
+        return d.day, d.month, 1
+
+    year, n = 2000, 0
+    if _YEAR_RE.fullmatch(last):
+        year, n = int(last), 1
+    if len(tokens) >= n + 2:
+        month = MONTHS.get(tokens[-1 - n].casefold())
+        m = _DAY_RE.fullmatch(tokens[-2 - n])
+        if month and m:
+            d = _make_date(year, month, int(m[1]), " ".join(tokens[-2 - n:]))
+            return d.day, d.month, n + 2
+    return None, None, 0
+
+
+def parse_reminders_suffix(tokens):
+    """
+    Rappels en fin de `tokens` : "... J-1 H-2". Renvoie (tuple normalisé ou None, nb de tokens lus).
+    ValueError si un rappel est hors limites (J-400).
+    """
+    n = 0
+    while n < len(tokens) and _REMINDER_RE.fullmatch(tokens[-1 - n].upper()):
+        n += 1
+    if not n:
+        return None, 0
+    return normalize_reminders(tokens[-n:]), n
+
+
+def check_reminders(reminders, time_of_day):
+    """Les rappels H-n se comptent depuis l'heure de l'événement : il en faut une."""
+    if reminders and time_of_day is None and any(o[0] == "H" for o in reminders):
+        raise ValueError("Les rappels H-n demandent une heure (ex: 20h)")
+
+
+def format_reminders(reminders):
+    return ", ".join(reminders or DEFAULT_REMINDERS)
+
+
+def format_rule(rule):
+    """"weekly:3" -> "tous les jeudis", "monthly:-1:4" -> "le dernier vendredi du mois"."""
+    kind, _, args = rule.partition(":")
+    if kind == "weekly":
+        return f"tous les {WEEKDAY_NAMES[int(args)]}s"
+    if kind == "monthly":
+        nth, weekday = map(int, args.split(":"))
+        which = {1: "1er", -1: "dernier"}.get(nth, f"{nth}e")
+        return f"le {which} {WEEKDAY_NAMES[weekday]} du mois"
+    return "tous les ans"
+
+
+def format_when(d, minutes=None):
+    text = d.strftime("%d-%m-%Y")
+    return f"{text} à {format_time(minutes)}" if minutes is not None else text
+
+
+def find_mention(msg):
+    """
+    Première personne mentionnée dans le message (entités Telegram) : (user_id, username, display).
+    @pseudo -> (None, "pseudo", "@pseudo") ; clic sur un nom -> (id, username ou None, nom complet).
+    """
+    for ent in msg.entities or ():
+        if ent.type == "mention":
+            raw = msg.text[ent.offset: ent.offset + ent.length]  # ex: "@jordan"
+            return None, raw.lstrip("@"), raw
+        if ent.type == "text_mention" and ent.user:
+            return ent.user.id, ent.user.username, ent.user.full_name or ent.user.first_name
+    return None, None, None
+
+
+# =========================
+# ANNIVERSAIRES & EVENTS
+# =========================
+
+def add_event_record(chat_id, type_, username, title, day, month, year=None, user_id=None, display=None,
+                     time_of_day=None, reminders=None, rule=None):
+    """
+    Ajoute l'événement (mémoire + index), ou remplace celui de même clé (event_key) :
+    /add_bday deux fois ne crée pas de doublon. Renvoie un Future résolu une fois écrit sur disque.
+    """
+    event = Event(
+        chat_id, type_, title, day, month, year,
+        username=username,                  # ancien champ (ex: @pseudo ou nom libre)
+        user_id=user_id,                    # id Telegram si on l'a (pour anniv / events liés à un user)
+        display=display or username,        # nom à afficher
+        time_of_day=time_of_day,            # heure (minutes depuis minuit) ou None
+        reminders=reminders,                # rappels propres à l'event, sinon REMINDER_OFFSETS
+        rule=rule,                          # récurrence (la date est alors la première occurrence)
+    )
+    record, _replaced = _put_event(event)
+    REMINDERS.add(event)
+    return WRITER.submit(record)
+
+
+def unique_events(events):
+    """
+    Doublons d'un même fichier (même clé) : le dernier l'emporte, comme s'ils avaient été
+    importés un par un. Renvoie (events distincts, nb de doublons écartés).
+    """
+    by_key = {}
+    for event in events:
+        by_key[event_key(event)] = event
+    return list(by_key.values()), len(events) - len(by_key)
+
+
+def add_event_records(events):
+    """
+    Import en masse : même upsert que add_event_record pour chaque event, mais toutes les
+    mutations partent dans un seul lot de WRITER (un append du journal / une transaction
+    SQLite), quel que soit leur nombre. `events` sans doublons (voir unique_events), pour
+    que le compte des remplacés ne porte que sur les events déjà enregistrés.
+    Renvoie (Future, nb d'events remplacés).
+    """
+    records = []
+    replaced = 0
+    for event in events:
+        record, was_there = _put_event(event)
+        records.append(record)
+        replaced += was_there
+    REMINDERS.add_many(events)
+    return WRITER.submit_many(records), replaced
+
+
+def _put_event(event):
+    """Mémoire + index d'un event (upsert) ; renvoie (mutation à écrire, True s'il en remplace un)."""
+    previous = STORAGE.get(event_key(event))
+    record = STORAGE.add(event)
+    if previous is not None:
+        _calendar_unindex(previous)     # même personne / même titre, même date : remplacé
+    else:
+        EVENTS_PER_CHAT[event.chat_id] = EVENTS_PER_CHAT.get(event.chat_id, 0) + 1
+    _calendar_index(event)
+    _invalidate_list(event.chat_id, event.type)
+    return record, previous is not None
+
+
+def remove_event_record(key):
+    """Supprime l'event de clé `key` ; renvoie un Future (écrit sur disque), None s'il n'existe pas."""
+    event = STORAGE.get(key)
+    if event is None:
+        return None
+    durable = WRITER.submit(STORAGE.remove(key))
+    _calendar_unindex(event)
+    REMINDERS.remove(key)
+    EVENTS_PER_CHAT[event.chat_id] = max(0, EVENTS_PER_CHAT.get(event.chat_id, 0) - 1)
+    _invalidate_list(event.chat_id, event.type)
+    return durable
+
+
+async def add_bday(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Formats acceptés :
+    - /add_bday Satya IV le baiseur 15-02
+    - /add_bday @satya 15-02
+    - /add_bday Satya 15/02
+    - /add_bday Satya 15 février
+    - /add_bday (en cliquant sur le nom) Satya 15-02
+    - /add_bday Satya 15-02 J-3 J-0          (rappels à la place de REMINDER_OFFSETS)
+    """
+    if len(context.args) < 2:
+        await update.message.reply_text("Usage : /add_bday Nom 15-02")
+        return
+
+    msg = update.message
+
+    # 1) Rappels éventuels puis date en fin de message (15-02, 15/02, 15.02, 15 février...)
+    try:
+        reminders, k = parse_reminders_suffix(context.args)
+        check_reminders(reminders, None)
+    except ValueError as exc:
+        await update.message.reply_text(f"{exc}.")
+        return
+    args = context.args[:len(context.args) - k]
+    try:
+        day, month, n = parse_day_month_suffix(args)
+    except ValueError as exc:
+        await update.message.reply_text(f"{exc}. Utilise JJ-MM (ex: 25-03).")
+        return
+    if not n:
+        await update.message.reply_text("Format de date invalide. Utilise JJ-MM (ex: 25-03).")
+        return
+
+    # 2) Pseudo “texte libre” = tout sauf la date
+    raw_pseudo = " ".join(args[:-n]).strip()
+
+    # 3) On regarde les entités Telegram pour détecter vraie mention
+    #    (@pseudo, ou clic sur un nom sans username public)
+    user_id, username, display = find_mention(msg)
+
+    # 4) Si aucune entité structurée, on retombe sur le pseudo texte libre
+    if not display:
+        if not raw_pseudo:
+            await update.message.reply_text("Indique un nom avant la date (ex: /add_bday Satya 15-02)")
+            return
+        display = raw_pseudo
+        if not username:
+            username = raw_pseudo  # pour compat / info
+
+    chat_id = update.effective_chat.id
+    title = f"Anniv {display}"
+
+    add_event_record(
+        chat_id=chat_id,
+        type_=EventType.BIRTHDAY,
+        username=username,
+        title=title,
+        day=day,
+        month=month,
+        year=None,
+        user_id=user_id,
+        display=display,
+        reminders=reminders,
+    )
+
+    await update.message.reply_text(
+        f"🎂 Anniversaire de {display} enregistré le {day:02d}-{month:02d} "
+        f"(rappels {format_reminders(reminders)})."
+    )
+
+# Pages rendues par (chat_id, type) -> (jour de rendu ou None, [texte de page, ...]).
+# Invalidé par add_event_record ; /list_events est aussi re-rendu quand la date
+# locale change (statut passé / à venir).
+LIST_PAGES = OrderedDict()
+_LIST_GENERATION = [0]      # incrémenté à chaque invalidation (rendu concurrent périmé)
+
+
+def _invalidate_list(chat_id, type_):
+    LIST_PAGES.pop((chat_id, type_), None)
+    _LIST_GENERATION[0] += 1
+
+
+LIST_EMPTY = {
+    EventType.BIRTHDAY: "Aucun anniversaire enregistré pour ce groupe.",
+    EventType.EVENT: "Aucun événement enregistré pour ce groupe.",
+}
+LIST_HEADER = {
+    EventType.BIRTHDAY: "🎂 Anniversaires enregistrés :",
+    EventType.EVENT: "📅 Événements du groupe :",
+}
+
+
+def _list_lines(chat_id, type_, today):
+    events = STORAGE.events_for_chat(chat_id, type_)
+    if type_ is EventType.BIRTHDAY:
+        lines = []
+        for e in sorted(events, key=lambda x: (x.month, x.day, (x.display or x.username or ""))):
+            display = e.display or e.username or "?"
+            lines.append(f"- {e.day:02d}-{e.month:02d} : {display}")
+        return lines
+
+    # Récurrents : rangés à leur prochaine occurrence, avec les suivantes de la fenêtre
+    rows = []   # (date, event, occurrences suivantes ou None)
+    window_end = today + timedelta(days=LIST_REPEAT_DAYS)
+    for e in events:
+        if e.rule is None:
+            rows.append((date(e.year, e.month, e.day), e, None))
+            continue
+        upcoming = list(event_occurrences(e, today, window_end, limit=LIST_REPEAT_OCCURRENCES))
+        if not upcoming:
+            upcoming = [next_occurrence(e, today)]
+        rows.append((upcoming[0], e, upcoming[1:]))
+
+    # tri par date
+    lines = []
+    for d, e, following in sorted(rows, key=lambda row: row[0]):
+        when = d.strftime('%d-%m-%Y')
+        if e.time_of_day is not None:
+            when += " " + format_time(e.time_of_day)
+        if following is None:
+            status = "✅ passé" if d < today else "🕒 à venir"
+        else:
+            status = f"🔁 {format_rule(e.rule)}"
+            if following:
+                status += ", puis " + ", ".join(f.strftime('%d-%m') for f in following)
+        lines.append(f"- {when} : {e.title} ({status})")
+    return lines
+
+
+def _render_list_pages(chat_id, type_, today):
+    """Trie, formate et découpe la liste en pages (appelée dans un thread)."""
+    header = LIST_HEADER[type_]
+    chunks, current, size = [], [], 0
+    for line in _list_lines(chat_id, type_, today):
+        line = line[:LIST_PAGE_CHARS]
+        if current and (len(current) >= LIST_PAGE_LINES or size + len(line) + 1 > LIST_PAGE_CHARS):
+            chunks.append(current)
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append(current)
+
+    if len(chunks) <= 1:
+        return [header + "\n" + "\n".join(c) for c in chunks]
+    return [
+        f"{header} (page {i + 1}/{len(chunks)})\n" + "\n".join(c)
+        for i, c in enumerate(chunks)
+    ]
+
+
+async def list_pages(chat_id, type_):
+    """Pages de la liste d'un groupe, depuis le cache si elles sont encore valides."""
+    stamp = datetime.now(chat_tz(chat_id)).date() if type_ is EventType.EVENT else None
+    key = (chat_id, type_)
+    cached = LIST_PAGES.get(key)
+    if cached is not None and cached[0] == stamp:
+        LIST_PAGES.move_to_end(key)
+        return cached[1]
+
+    if STORAGE.reads_disk:
+        await WRITER.flush()    # les ajouts encore en file doivent apparaître
+    generation = _LIST_GENERATION[0]
+    pages = await asyncio.to_thread(_render_list_pages, chat_id, type_, stamp)
+    if generation != _LIST_GENERATION[0]:
+        return pages    # un ajout a eu lieu pendant le rendu : on ne met pas en cache
+    LIST_PAGES[key] = (stamp, pages)
+    LIST_PAGES.move_to_end(key)
+    while len(LIST_PAGES) > LIST_CACHE_CHATS:
+        LIST_PAGES.popitem(last=False)
+    return pages
+
+
+def list_keyboard(type_, page, total):
+    if total <= 1:
+        return None
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️ Précédent", callback_data=f"page|{type_.value}|{page - 1}"))
+    if page < total - 1:
+        buttons.append(InlineKeyboardButton("Suivant ▶️", callback_data=f"page|{type_.value}|{page + 1}"))
+    return InlineKeyboardMarkup([buttons])
+
+
+async def send_list(update: Update, type_):
+    chat_id = update.effective_chat.id
+    pages = await list_pages(chat_id, type_)
+    if not pages:
+        await update.message.reply_text(LIST_EMPTY[type_])
+        return
+    await update.message.reply_text(pages[0], reply_markup=list_keyboard(type_, 0, len(pages)))
+
+
+async def list_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Boutons ◀️/▶️ des listes : callback_data "page|type|numéro"."""
+    query = update.callback_query
+    await query.answer()
+    try:
+        _, type_value, page_str = query.data.split("|")
+        type_ = EventType(type_value)
+        page = int(page_str)
+    except ValueError:
+        return
+
+    pages = await list_pages(update.effective_chat.id, type_)
+    if not pages:
+        await query.edit_message_text(LIST_EMPTY[type_])
+        return
+    page = max(0, min(page, len(pages) - 1))
+    try:
+        await query.edit_message_text(pages[page], reply_markup=list_keyboard(type_, page, len(pages)))
+    except BadRequest as e:
+        if "not modified" not in str(e).lower():
+            raise
+
+
+async def list_bday(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Liste les anniversaires du groupe."""
+    await send_list(update, EventType.BIRTHDAY)
+
+
+async def add_event(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /add_event 14-02-2026 Soirée raclette
+    /add_event 14-02-2026 20h30 Soirée chez @satya
+    /add_event samedi prochain à 19h Soirée chez Satya (en cliquant sur son nom)
+    /add_event demain Resto
+    /add_event demain 20h Resto J-1 H-2 H-0     (rappels à la place de REMINDER_OFFSETS)
+    /add_event tous les jeudis 20h Soirée jeux
+    /add_event premier vendredi du mois 19h Apéro
+    /add_event 14-02 tous les ans Saint-Valentin
+    """
+    usage = "Usage : /add_event 14-02-2026 [20h30] Titre de l'événement [J-1 H-2]"
+    if len(context.args) < 2:
+        await update.message.reply_text(usage)
+        return
+
+    msg = update.message
+    chat_id = update.effective_chat.id
+
+    # 1) Parse de la date (+ heure) en tête
+    today = datetime.now(chat_tz(chat_id)).date()
+    try:
+        reminders, k = parse_reminders_suffix(context.args)
+        args = context.args[:len(context.args) - k]
+        d, time_of_day, rule, n = parse_when(args, today)
+        check_reminders(reminders, time_of_day)
+    except ValueError as exc:
+        await update.message.reply_text(f"{exc}.")
+        return
+    if d is None:
+        await update.message.reply_text(
+            "Format de date invalide. Utilise JJ-MM-AAAA (ex: 14-02-2026), « demain » ou « samedi prochain »."
+        )
+        return
+    title = " ".join(args[n:]).strip()
+    if not title:
+        await update.message.reply_text(usage)
+        return
+
+    # 2) Détection éventuelle d'une personne associée (mention / text_mention)
+    user_id, username, display = find_mention(msg)
+
+    add_event_record(
+        chat_id=chat_id,
+        type_=EventType.EVENT,
+        username=username,
+        title=title,
+        day=d.day,
+        month=d.month,
+        year=d.year,
+        user_id=user_id,
+        display=display,
+        time_of_day=time_of_day,
+        reminders=reminders,
+        rule=rule,
+    )
+
+    repeat = f", {format_rule(rule)}" if rule else ""
+    await update.message.reply_text(
+        f"📅 Événement enregistré le {format_when(d, time_of_day)}{repeat} : {title} "
+        f"(rappels {format_reminders(reminders)})"
+    )
+
+
+
+async def list_events(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Liste les événements du groupe."""
+    await send_list(update, EventType.EVENT)
+
+
+async def del_bday(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /del_bday Satya          (s'il n'y a qu'un anniversaire à ce nom)
+    /del_bday @satya 15-02
+    """
+    if not context.args:
+        await update.message.reply_text("Usage : /del_bday Nom [15-02]")
+        return
+
+    chat_id = update.effective_chat.id
+    try:
+        day, month, n = parse_day_month_suffix(context.args) if len(context.args) > 1 else (None, None, 0)
+    except ValueError as exc:
+        await update.message.reply_text(f"{exc}.")
+        return
+    name_args = context.args[:-n] if n else context.args
+    user_id, _username, display = find_mention(update.message)
+    name = display or " ".join(name_args).strip()
+
+    if n:
+        # Date connue : accès direct par la clé
+        probe = Event(chat_id, EventType.BIRTHDAY, "", day, month, user_id=user_id, display=name)
+        event = STORAGE.get(event_key(probe))
+        matches = [event] if event is not None else []
+    else:
+        if STORAGE.reads_disk:
+            await WRITER.flush()
+        who = user_id or normalize_name(name)
+        bdays = await asyncio.to_thread(STORAGE.events_for_chat, chat_id, EventType.BIRTHDAY)
+        matches = [e for e in bdays if event_who(e) == who]
+
+    if not matches:
+        await update.message.reply_text(f"Aucun anniversaire trouvé pour {name}.")
+        return
+    if len(matches) > 1:
+        dates = ", ".join(f"{e.day:02d}-{e.month:02d}" for e in matches)
+        await update.message.reply_text(
+            f"Plusieurs anniversaires pour {name} ({dates}) : précise la date, ex : /del_bday {name} "
+            f"{matches[0].day:02d}-{matches[0].month:02d}"
+        )
+        return
+
+    e = matches[0]
+    remove_event_record(event_key(e))
+    await update.message.reply_text(
+        f"🗑️ Anniversaire de {e.display or e.username or name} ({e.day:02d}-{e.month:02d}) supprimé."
+    )
+
+
+def find_events(chat_id, d, title):
+    """Événements du groupe le jour d, récurrents compris (titre donné : accès direct par la clé)."""
+    _calendar_ready()
+    if title:
+        probe = Event(chat_id, EventType.EVENT, title, d.day, d.month, d.year)
+        event = STORAGE.get(event_key(probe))
+        if event is not None:
+            return [event]
+        found = []
+    else:
+        found = [e for e in EVENTS_BY_DATE.get(d, ()) if e.chat_id == chat_id]
+    who = normalize_name(title)
+    for e in RECURRING_BY_CHAT.get(chat_id, ()):
+        if (not title or event_who(e) == who) and next_occurrence(e, d) == d:
+            found.append(e)
+    return found
+
+
+async def _resolve_event(update, tokens, usage):
+    """Un seul événement désigné par date (+ titre) ; sinon explique pourquoi et renvoie None."""
+    chat_id = update.effective_chat.id
+    try:
+        d, _time, _rule, n = parse_when(tokens, datetime.now(chat_tz(chat_id)).date())
+    except ValueError as exc:
+        await update.message.reply_text(f"{exc}.")
+        return None
+    if d is None:
+        await update.message.reply_text(f"Format de date invalide. {usage}")
+        return None
+    matches = find_events(chat_id, d, " ".join(tokens[n:]).strip())
+    if not matches:
+        await update.message.reply_text(f"Aucun événement trouvé le {d.strftime('%d-%m-%Y')}.")
+        return None
+    if len(matches) > 1:
+        titles = "\n".join(f"- {e.title}" for e in matches)
+        await update.message.reply_text(
+            f"Plusieurs événements le {d.strftime('%d-%m-%Y')}, précise le titre :\n{titles}"
+        )
+        return None
+    return matches[0]
+
+
+async def del_event(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /del_event 14-02-2026                   (s'il n'y a qu'un événement ce jour-là)
+    /del_event 14-02-2026 Soirée raclette
+    """
+    usage = "Usage : /del_event 14-02-2026 [Titre]"
+    if not context.args:
+        await update.message.reply_text(usage)
+        return
+
+    e = await _resolve_event(update, context.args, usage)
+    if e is None:
+        return
+    remove_event_record(event_key(e))
+    await update.message.reply_text(
+        f"🗑️ Événement supprimé : {format_when(date(e.year, e.month, e.day), e.time_of_day)} : {e.title}"
+    )
+
+
+_EDIT_ARROW_RE = re.compile(r"\s*(?:->|=>|→)\s*")
+
+
+async def edit_event(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /edit_event 14-02-2026 Soirée raclette -> 21-02-2026 Soirée fondue
+    /edit_event 14-02-2026 -> samedi prochain 20h   (nouvelle date / heure, même titre)
+    /edit_event 14-02-2026 -> 21h                   (nouvelle heure)
+    /edit_event 14-02-2026 Soirée raclette -> Soirée fondue
+    /edit_event 14-02-2026 -> H-1                   (nouveaux rappels)
+    /edit_event jeudi Soirée jeux -> tous les mercredis   (une date simple rend l'événement ponctuel)
+    """
+    usage = "Usage : /edit_event 14-02-2026 [Titre] -> [21-02-2026] [20h] [Nouveau titre] [J-1 H-2]"
+    parts = _EDIT_ARROW_RE.split(" ".join(context.args), maxsplit=1)
+    if len(parts) != 2 or not parts[0] or not parts[1]:
+        await update.message.reply_text(usage)
+        return
+
+    e = await _resolve_event(update, parts[0].split(), usage)
+    if e is None:
+        return
+
+    # Nouvelle date (+ heure), ou seulement une heure, puis nouveau titre et rappels éventuels
+    tokens = parts[1].split()
+    try:
+        new_reminders, k = parse_reminders_suffix(tokens)
+        tokens = tokens[:len(tokens) - k]
+        new_date, new_time, new_rule, n = parse_when(tokens, datetime.now(chat_tz(e.chat_id)).date())
+        if new_date is None:
+            new_date, new_rule = date(e.year, e.month, e.day), e.rule
+            new_time, n = parse_time(tokens)
+        if new_time is None:
+            new_time = e.time_of_day
+        new_reminders = new_reminders or e.reminders
+        check_reminders(new_reminders, new_time)
+    except ValueError as exc:
+        await update.message.reply_text(f"{exc}.")
+        return
+    new_title = " ".join(tokens[n:]) or e.title
+
+    remove_event_record(event_key(e))
+    add_event_record(
+        chat_id=e.chat_id,
+        type_=EventType.EVENT,
+        username=e.username,
+        title=new_title,
+        day=new_date.day,
+        month=new_date.month,
+        year=new_date.year,
+        user_id=e.user_id,
+        display=e.display,
+        time_of_day=new_time,
+        reminders=new_reminders,
+        rule=new_rule,
+    )
+    repeat = f", {format_rule(new_rule)}" if new_rule else ""
+    await update.message.reply_text(
+        f"✏️ Événement modifié : {format_when(new_date, new_time)}{repeat} : {new_title} "
+        f"(rappels {format_reminders(new_reminders)})"
+    )
+
+
+# =========================
+# IMPORT / EXPORT (CSV, ICS)
+# =========================
+
+# /import : fichier .csv ou .ics envoyé avec la légende /import (ou /import en réponse au fichier).
+# Lu ligne à ligne dans un thread (jamais chargé en entier comme texte), puis inséré d'un bloc :
+# un seul lot pour WRITER, donc une seule écriture disque quel que soit le nombre de lignes.
+#
+# CSV (séparateur , ou ;) avec en-tête ; seules les colonnes nom et date sont obligatoires :
+#   type,nom,date,heure,rappels
+#   anniv,@satya,15-02,,
+#   event,Soirée raclette,14-02-2026,20h30,J-1 H-2
+#   event,Soirée jeux,tous les jeudis,20h,
+# type : anniv ou event (défaut) ; date : comme /add_bday et /add_event (ou AAAA-MM-JJ).
+#
+# ICS : VEVENT avec DTSTART, SUMMARY, RRULE (FREQ=WEEKLY;BYDAY=TH, FREQ=MONTHLY;BYDAY=1FR,
+# FREQ=YEARLY) et VALARM (TRIGGER:-P1D -> J-1, -PT2H -> H-2) ; CATEGORIES:BIRTHDAY = anniversaire.
+# /export écrit ce format (réimportable) event par event dans un fichier temporaire.
+
+_CSV_COLUMNS = {
+    "type": "type",
+    "nom": "nom", "name": "nom", "titre": "nom", "title": "nom",
+    "date": "date",
+    "heure": "heure", "time": "heure",
+    "rappels": "rappels", "reminders": "rappels",
+}
+_CSV_TYPES = {
+    "": EventType.EVENT, "event": EventType.EVENT, "événement": EventType.EVENT, "evenement": EventType.EVENT,
+    "anniv": EventType.BIRTHDAY, "anniversaire": EventType.BIRTHDAY, "birthday": EventType.BIRTHDAY,
+}
+_ISO_DATE_RE = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+
+_ICS_WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+_ICS_DATE_RE = re.compile(r"(\d{4})(\d{2})(\d{2})")
+_ICS_DATETIME_RE = re.compile(r"(\d{4})(\d{2})(\d{2})T(\d{2})(\d{2})(\d{2})?(Z?)")
+_ICS_BYDAY_RE = re.compile(r"([+-]?\d)?(MO|TU|WE|TH|FR|SA|SU)")
+_ICS_TRIGGER_RE = re.compile(r"([+-]?)P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?")
+_ICS_UNESCAPE_RE = re.compile(r"\\([\\;,nN])")
+_ICS_BIRTHDAY_CATEGORIES = frozenset({"birthday", "birthdays", "anniversaire", "anniversaires"})
+_BDAY_PREFIX_RE = re.compile(r"(?:anniv(?:ersaire)?(?:\s+de)?|birthday)\s*:?\s+", re.IGNORECASE)
+
+
+class ImportErrors:
+    """Lignes rejetées par /import : leur nombre, et le détail des premières seulement."""
+
+    def __init__(self, shown=IMPORT_ERRORS_SHOWN):
+        self.count = 0
+        self.shown = shown
+        self.first = []
+
+    def add(self, line, exc):
+        self.count += 1
+        if len(self.first) < self.shown:
+            self.first.append(f"ligne {line} : {exc}")
+
+
+def _import_birthday(chat_id, name, day, month, user_id=None, reminders=None):
+    """Anniversaire importé, rangé comme /add_bday (@pseudo : username sans @, affiché avec)."""
+    check_reminders(reminders, None)
+    username = name[1:] if name.startswith("@") else name
+    return Event(
+        chat_id, EventType.BIRTHDAY, f"Anniv {name}", day, month,
+        username=username, user_id=user_id, display=name, reminders=reminders,
+    )
+
+
+def _csv_event(row, columns, chat_id, today):
+    def cell(name):
+        i = columns.get(name)
+        return row[i].strip() if i is not None and i < len(row) else ""
+
+    type_ = _CSV_TYPES.get(cell("type").casefold())
+    if type_ is None:
+        raise ValueError(f"Type inconnu : {cell('type')} (anniv ou event)")
+    name = cell("nom")
+    if not name:
+        raise ValueError("Nom manquant")
+    reminders = normalize_reminders(cell("rappels").replace(",", " ").split()) or None
+    raw_date = cell("date")
+    tokens = raw_date.split()
+    iso = _ISO_DATE_RE.fullmatch(raw_date)
+
+    if type_ is EventType.BIRTHDAY:
+        if iso:
+            d = _make_date(int(iso[1]), int(iso[2]), int(iso[3]), raw_date)
+            day, month = d.day, d.month
+        else:
+            day, month, n = parse_day_month_suffix(tokens)
+            if not n or n != len(tokens):
+                raise ValueError(f"Date invalide : {raw_date or '(vide)'}")
+        return _import_birthday(chat_id, name, day, month, reminders=reminders)
+
+    if iso:
+        d, minutes, rule = _make_date(int(iso[1]), int(iso[2]), int(iso[3]), raw_date), None, None
+    else:
+        d, minutes, rule, n = parse_when(tokens, today)
+        if d is None or n != len(tokens):
+            raise ValueError(f"Date invalide : {raw_date or '(vide)'}")
+    raw_time = cell("heure").split()
+    if raw_time:
+        minutes, n = parse_time(raw_time)
+        if minutes is None or n != len(raw_time):
+            raise ValueError(f"Heure invalide : {cell('heure')}")
+    check_reminders(reminders, minutes)
+    return Event(
+        chat_id, EventType.EVENT, name, d.day, d.month, d.year,
+        time_of_day=minutes, reminders=reminders, rule=rule,
+    )
+
+
+def read_csv_events(lines, chat_id, today, errors):
+    """Events d'un CSV (itérable de lignes), au fil de la lecture ; lignes invalides -> errors."""
+    lines = iter(lines)
+    header = next(lines, "")
+    delimiter = ";" if header.count(";") > header.count(",") else ","
+    columns = {}
+    for i, title in enumerate(next(csv.reader([header], delimiter=delimiter), [])):
+        column = _CSV_COLUMNS.get(title.strip().casefold())
+        if column is not None:
+            columns.setdefault(column, i)
+    if "nom" not in columns or "date" not in columns:
+        raise ValueError("En-tête CSV attendu : type,nom,date,heure,rappels")
+
+    reader = csv.reader(lines, delimiter=delimiter)
+    for row in reader:
+        if not any(field.strip() for field in row):
+            continue
+        try:
+            yield _csv_event(row, columns, chat_id, today)
+        except ValueError as exc:
+            errors.add(reader.line_num + 1, exc)
+
+
+def _ics_unfold(lines):
+    """(n° de ligne, ligne logique) : une ligne qui commence par un espace continue la précédente."""
+    current, start = None, 0
+    for number, raw in enumerate(lines, 1):
+        raw = raw.rstrip("\r\n")
+        if raw[:1] in (" ", "\t") and current is not None:
+            current += raw[1:]
+            continue
+        if current:
+            yield start, current
+        current, start = raw, number
+    if current:
+        yield start, current
+
+
+def _ics_property(line):
+    """"DTSTART;TZID=Europe/Paris:20260214T200000" -> ("DTSTART", {"TZID": ...}, "20260214T200000")."""
+    head, sep, value = line.partition(":")
+    if '"' in head:
+        # Paramètre entre guillemets qui peut contenir ":" (rare)
+        quoted = False
+        for i, ch in enumerate(line):
+            if ch == '"':
+                quoted = not quoted
+            elif ch == ":" and not quoted:
+                head, sep, value = line[:i], ":", line[i + 1:]
+                break
+        else:
+            return None
+    if not sep:
+        return None
+    name, *params = head.split(";")
+    return name.upper(), {k.upper(): v.strip('"') for k, _, v in (p.partition("=") for p in params)}, value
+
+
+def _ics_unescape(value):
+    return _ICS_UNESCAPE_RE.sub(lambda m: "\n" if m[1] in "nN" else m[1], value)
+
+
+def _ics_start(params, value, tz):
+    """DTSTART -> (date, minutes ou None) dans le fuseau du groupe."""
+    value = value.strip()
+    m = _ICS_DATE_RE.fullmatch(value)
+    if m:
+        return _make_date(int(m[1]), int(m[2]), int(m[3]), value), None
+    m = _ICS_DATETIME_RE.fullmatch(value)
+    if not m:
+        raise ValueError(f"DTSTART invalide : {value}")
+    _make_date(int(m[1]), int(m[2]), int(m[3]), value)
+    if int(m[4]) > 23 or int(m[5]) > 59:
+        raise ValueError(f"Heure impossible : {value}")
+    dt = datetime(int(m[1]), int(m[2]), int(m[3]), int(m[4]), int(m[5]))
+    if m[7]:
+        dt = dt.replace(tzinfo=timezone.utc).astimezone(tz)
+    elif "TZID" in params:
+        try:
+            dt = dt.replace(tzinfo=ZoneInfo(params["TZID"])).astimezone(tz)
+        except (ZoneInfoNotFoundError, ValueError):
+            pass    # TZID maison (Outlook...) : heure prise telle quelle, comme une heure locale
+    return dt.date(), dt.hour * 60 + dt.minute
+
+
+def _ics_rule(value, d):
+    """RRULE -> règle de l'event ; ValueError pour ce qu'on ne sait pas répéter."""
+    parts = {k: v for k, _, v in (p.partition("=") for p in value.upper().split(";") if p)}
+    freq = parts.get("FREQ")
+    byday = [b for b in parts.get("BYDAY", "").split(",") if b]
+    if parts.get("INTERVAL", "1") == "1" and "COUNT" not in parts and "UNTIL" not in parts:
+        if freq == "YEARLY" and not byday:
+            return "yearly"
+        if freq == "WEEKLY" and not byday:
+            return f"weekly:{d.weekday()}"
+        m = _ICS_BYDAY_RE.fullmatch(byday[0]) if len(byday) == 1 else None
+        if freq == "WEEKLY" and m and not m[1]:
+            return f"weekly:{_ICS_WEEKDAYS.index(m[2])}"
+        if freq == "MONTHLY" and m:
+            nth = int(m[1] or parts.get("BYSETPOS", "0"))
+            if nth in (1, 2, 3, 4, -1):
+                return f"monthly:{nth}:{_ICS_WEEKDAYS.index(m[2])}"
+    raise ValueError(f"Récurrence non gérée : {value}")
+
+
+def _ics_reminders(triggers, timed):
+    """TRIGGER des VALARM -> rappels (-P1D -> J-1, -PT2H -> H-2) ; None si ce sont ceux par défaut."""
+    offsets = []
+    for params, value in triggers:
+        m = _ICS_TRIGGER_RE.fullmatch(value.strip().upper())
+        if not m or params.get("RELATED", "START").upper() != "START":
+            continue    # date absolue, ou relative à la fin
+        weeks, days, hours, minutes, seconds = (int(g or 0) for g in m.groups()[1:])
+        total = ((weeks * 7 + days) * 24 + hours) * 60 + minutes + (seconds + 59) // 60
+        if m[1] != "-" and total:
+            continue    # après le début
+        if (weeks or days) and not (hours or minutes or seconds):
+            offsets.append(f"J-{weeks * 7 + days}")
+        elif timed:
+            offsets.append(f"H-{(total + 59) // 60}")
+        else:
+            offsets.append(f"J-{(total + 1439) // 1440}")
+    reminders = normalize_reminders(offsets) or None
+    return None if reminders == DEFAULT_REMINDERS else reminders
+
+
+def _ics_event(props, triggers, chat_id, tz):
+    if "DTSTART" not in props:
+        raise ValueError("DTSTART manquant")
+    d, minutes = _ics_start(*props["DTSTART"], tz)
+    summary = " ".join(_ics_unescape(props.get("SUMMARY", ({}, ""))[1]).split())   # une ligne dans /list_*
+    rule = _ics_rule(props["RRULE"][1], d) if "RRULE" in props else None
+    categories = {c.strip().casefold() for c in _ics_unescape(props.get("CATEGORIES", ({}, ""))[1]).split(",")}
+
+    if categories & _ICS_BIRTHDAY_CATEGORIES:
+        if rule not in (None, "yearly"):
+            raise ValueError("Anniversaire qui ne revient pas tous les ans")
+        m = _BDAY_PREFIX_RE.match(summary)
+        name = summary[m.end():] if m else summary
+        if not name:
+            raise ValueError("SUMMARY manquant")
+        user_id = props.get("X-TELEGRAM-USER-ID", ({}, ""))[1].strip()
+        return _import_birthday(
+            chat_id, name, d.day, d.month,
+            user_id=int(user_id) if user_id.isdigit() else None,
+            reminders=_ics_reminders(triggers, False),
+        )
+
+    if not summary:
+        raise ValueError("SUMMARY manquant")
+    reminders = _ics_reminders(triggers, minutes is not None)
+    check_reminders(reminders, minutes)
+    return Event(
+        chat_id, EventType.EVENT, summary, d.day, d.month, d.year,
+        time_of_day=minutes, reminders=reminders, rule=rule,
+    )
+
+
+def read_ics_events(lines, chat_id, tz, errors):
+    """Events des VEVENT d'un .ics (itérable de lignes), au fil de la lecture ; VEVENT invalides -> errors."""
+    props = None        # propriétés du VEVENT en cours (la première de chaque nom)
+    triggers = []
+    in_alarm = False
+    start = 0
+    for number, line in _ics_unfold(lines):
+        prop = _ics_property(line)
+        if prop is None:
+            continue
+        name, params, value = prop
+        if name == "BEGIN":
+            if value.upper() == "VEVENT":
+                props, triggers, in_alarm, start = {}, [], False, number
+            elif value.upper() == "VALARM":
+                in_alarm = True
+        elif name == "END":
+            if value.upper() == "VALARM":
+                in_alarm = False
+            elif value.upper() == "VEVENT" and props is not None:
+                try:
+                    yield _ics_event(props, triggers, chat_id, tz)
+                except ValueError as exc:
+                    errors.add(start, exc)
+                props = None
+        elif props is None:
+            continue    # VCALENDAR, VTIMEZONE...
+        elif in_alarm:
+            if name == "TRIGGER":
+                triggers.append((params, value))
+        else:
+            props.setdefault(name, (params, value))
+
+
+def _import_kind(doc):
+    name = (doc.file_name or "").casefold()
+    mime = (doc.mime_type or "").casefold()
+    if name.endswith(".ics") or mime == "text/calendar":
+        return "ics"
+    if name.endswith(".csv") or mime in ("text/csv", "text/comma-separated-values"):
+        return "csv"
+    return None
+
+
+def read_import(f, chat_id, tz, kind=None):
+    """
+    Events d'un fichier CSV ou ICS (binaire, lu ligne à ligne) ; kind None : deviné sur la 1re ligne.
+    Renvoie (events, ImportErrors) ; ValueError si le CSV n'a pas d'en-tête reconnu.
+    """
+    text = io.TextIOWrapper(f, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        first = text.readline()
+        lines = itertools.chain([first], text)
+        if kind is None:
+            kind = "ics" if first.strip().upper() == "BEGIN:VCALENDAR" else "csv"
+        errors = ImportErrors()
+        if kind == "ics":
+            events = list(read_ics_events(lines, chat_id, tz, errors))
+        else:
+            events = list(read_csv_events(lines, chat_id, datetime.now(tz).date(), errors))
+    finally:
+        text.detach()   # f reste ouvert (fermé par l'appelant)
+    return events, errors
+
+
+def _ics_escape(text):
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _ics_fold(line):
+    """Ligne .ics en octets, pliée tous les 75 octets (sans couper un caractère UTF-8), CRLF final."""
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return data + b"\r\n"
+    parts = []
+    start, limit = 0, 75
+    while len(data) - start > limit:
+        end = start + limit
+        while data[end] & 0xC0 == 0x80:     # octet de continuation UTF-8
+            end -= 1
+        parts.append(data[start:end])
+        start, limit = end, 74              # l'espace de continuation compte
+    parts.append(data[start:])
+    return b"\r\n ".join(parts) + b"\r\n"
+
+
+def _ics_rrule(rule):
+    kind, _, args = rule.partition(":")
+    if kind == "weekly":
+        return f"FREQ=WEEKLY;BYDAY={_ICS_WEEKDAYS[int(args)]}"
+    if kind == "monthly":
+        nth, weekday = args.split(":")
+        return f"FREQ=MONTHLY;BYDAY={int(nth)}{_ICS_WEEKDAYS[int(weekday)]}"
+    return "FREQ=YEARLY"
+
+
+def _ics_event_lines(e, tz, stamp):
+    yield "BEGIN:VEVENT"
+    yield f"UID:{hashlib.sha1(event_key(e).encode()).hexdigest()}@telegram-event-bot"
+    yield f"DTSTAMP:{stamp}"
+    if e.type is EventType.BIRTHDAY:
+        # Sans année connue : 2000 (bissextile, le 29-02 existe)
+        yield f"DTSTART;VALUE=DATE:2000{e.month:02d}{e.day:02d}"
+        yield "RRULE:FREQ=YEARLY"
+        yield "CATEGORIES:BIRTHDAY"
+        if e.user_id:
+            yield f"X-TELEGRAM-USER-ID:{e.user_id}"
+    else:
+        day = f"{e.year:04d}{e.month:02d}{e.day:02d}"
+        if e.time_of_day is None:
+            yield f"DTSTART;VALUE=DATE:{day}"
+        else:
+            # TZID IANA sans VTIMEZONE : compris par Google Agenda, Apple, Thunderbird
+            yield f"DTSTART;TZID={tz.key}:{day}T{e.time_of_day // 60:02d}{e.time_of_day % 60:02d}00"
+        if e.rule is not None:
+            yield f"RRULE:{_ics_rrule(e.rule)}"
+    summary = _ics_escape(e.title)
+    yield f"SUMMARY:{summary}"
+    for offset in e.reminders or DEFAULT_REMINDERS:
+        if offset[0] == "H" and e.time_of_day is None:
+            continue
+        amount = int(offset[2:])
+        yield "BEGIN:VALARM"
+        yield "ACTION:DISPLAY"
+        yield f"DESCRIPTION:{summary}"
+        yield f"TRIGGER:-P{amount}D" if offset[0] == "J" else f"TRIGGER:-PT{amount}H"
+        yield "END:VALARM"
+    yield "END:VEVENT"
+
+
+def write_ics(f, chat_id, tz):
+    """Calendrier du groupe écrit event par event dans f (binaire) ; renvoie le nombre d'events."""
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    f.writelines(_ics_fold(line) for line in (
+        "BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//Telegram_event_bot//FR", "CALSCALE:GREGORIAN",
+        f"X-WR-TIMEZONE:{tz.key}",
+    ))
+    count = 0
+    for type_ in EventType:
+        for e in STORAGE.events_for_chat(chat_id, type_):
+            if e.type is not EventType.BIRTHDAY and _event_date(e) is None:
+                continue    # date impossible d'une ancienne version
+            f.writelines(_ics_fold(line) for line in _ics_event_lines(e, tz, stamp))
+            count += 1
+    f.write(_ics_fold("END:VCALENDAR"))
+    return count
+
+
+async def import_events(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Fichier .csv / .ics envoyé avec la légende /import, ou /import en réponse à un fichier
+    (les légendes ne passent pas par CommandHandler : deux handlers, même fonction).
+    """
+    msg = update.message
+    doc = msg.document or (msg.reply_to_message.document if msg.reply_to_message else None)
+    if doc is None:
+        await msg.reply_text(
+            "Envoie un fichier .csv ou .ics avec la légende /import (ou réponds au fichier par /import)."
+        )
+        return
+    if doc.file_size and doc.file_size > IMPORT_MAX_BYTES:
+        await msg.reply_text(f"Fichier trop gros (max {IMPORT_MAX_BYTES // (1024 * 1024)} Mo).")
+        return
+
+    chat_id = update.effective_chat.id
+    tg_file = await context.bot.get_file(doc.file_id)
+    with tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES) as f:
+        await tg_file.download_to_memory(f)
+        f.seek(0)
+        try:
+            events, errors = await asyncio.to_thread(read_import, f, chat_id, chat_tz(chat_id), _import_kind(doc))
+        except ValueError as exc:
+            await msg.reply_text(f"{exc}.")
+            return
 
-    if question:
-        await update.message.reply_text(
-            f"❓ {question}\n\n🎱 {answer}"
+    lines = []
+    events, duplicates = unique_events(events)
+    if events:
+        durable, replaced = add_event_records(events)
+        await durable
+        birthdays = sum(1 for e in events if e.type is EventType.BIRTHDAY)
+        lines.append(
+            f"📥 Importé : {birthdays} anniversaire(s), {len(events) - birthdays} événement(s)"
+            + (f", dont {replaced} déjà présent(s) (remplacés)." if replaced else ".")
         )
+        if duplicates:
+            lines.append(f"🔁 {duplicates} doublon(s) dans le fichier (seule la dernière ligne est gardée).")
     else:
-        await update.message.reply_text(
-            f"🎱 {answer}"
+        lines.append("Rien à importer.")
+    if errors.count:
+        lines.append(f"⚠️ {errors.count} ligne(s) ignorée(s) :")
+        lines.extend(f"- {error}" for error in errors.first)
+    await msg.reply_text("\n".join(lines))
+
+
+async def export_events(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/export : anniversaires et événements du groupe en .ics (Google Agenda, Apple Calendrier...)."""
+    chat_id = update.effective_chat.id
+    if STORAGE.reads_disk:
+        await WRITER.flush()
+    with tempfile.TemporaryFile() as f:
+        count = await asyncio.to_thread(write_ics, f, chat_id, chat_tz(chat_id))
+        if not count:
+            await update.message.reply_text("Rien à exporter : aucun anniversaire ni événement.")
+            return
+        f.seek(0)
+        await update.message.reply_document(
+            document=f, filename="calendrier.ics", caption=f"📤 {count} anniversaire(s) / événement(s)"
         )
 
 
 # =========================
-# ANNIVERSAIRES & EVENTS
+# RAPPELS (J-n / H-n)
 # =========================
 
-def add_event_record(chat_id, type_, username, title, day, month, year=None, user_id=None, display=None):
-    DATA["events"].append(
-        {
-            "chat_id": chat_id,
-            "type": type_,          # "birthday" / "event"
-            "username": username,   # ancien champ (ex: @pseudo ou nom libre)
-            "title": title,
-            "day": day,
-            "month": month,
-            "year": year,
-            "user_id": user_id,     # NEW : id Telegram si on l'a (pour anniv / events liés à un user)
-            "display": display or username,  # NEW : nom à afficher
-        }
-    )
-    save_data()
+# État persistant (BOT_STATE_FILE) :
+# {
+#   "chat_tz": {"-100123": "America/Montreal"},         # fuseau par groupe (défaut : TZ)
+#   "reminders": {
+#       "sent": {"<event_key>": ["2026-03-25:7", "2026-03-25:H-2", ...]}   # rappels envoyés (date:rappel)
+#   }
+# }
 
+BOT_STATE = {"chat_tz": {}, "reminders": {"sent": {}}}
+_TZ_CACHE = {}
+_REMINDERS_IN_FLIGHT = set()
 
 
-async def add_bday(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """
-    Formats acceptés :
-    - /add_bday Satya IV le baiseur 15-02
-    - /add_bday @satya 15-02
-    - /add_bday Satya 15/02
-    - /add_bday (en cliquant sur le nom) Satya 15-02
-    """
-    if len(context.args) < 2:
-        await update.message.reply_text("Usage : /add_bday Nom 15-02")
-        return
+def _state_paths(own_path):
+    """Fichiers d'état à lire : le sien, ou ceux de tous les workers en mode multi-workers."""
+    if SHARD_RING is None:
+        return [own_path]
+    base, ext = own_path.split(".", 1)[0], own_path.rsplit(".", 1)[1]
+    return sorted(glob.glob(f"{base}.*.{ext}"))
 
-    msg = update.message
 
-    # 1) Dernier argument = date brute
-    date_raw = context.args[-1]
+def load_state():
+    global BOT_STATE
+    BOT_STATE = {"chat_tz": {}, "reminders": {"sent": {}}}
+    for path in _state_paths(BOT_STATE_FILE):
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except Exception:
+            print(f"⚠️ {path} illisible, état des rappels ignoré")
+            continue
+        reminders = state.get("reminders", {})
+        for chat_id, name in state.get("chat_tz", {}).items():
+            if owns_chat(int(chat_id)):
+                BOT_STATE["chat_tz"][chat_id] = name
+        for key, marks in reminders.get("sent", {}).items():
+            if owns_chat(int(key.split("|", 1)[0])):
+                BOT_STATE["reminders"]["sent"].setdefault(key, []).extend(marks)
+    _rekey_sent_marks(BOT_STATE["reminders"]["sent"])
+
 
-    # Normalisation de la date (15-02, 15/02, 15.02 → 15-02)
-    clean = re.sub(r"[^\d]", "-", date_raw)
-    parts = [p for p in clean.split("-") if p]
-    if len(parts) != 2:
-        await update.message.reply_text("Format de date invalide. Utilise JJ-MM (ex: 25-03).")
-        return
+def _legacy_event_key(e):
+    """event_key des versions d'avant la déduplication (nom en minuscules, sans normalisation)."""
+    who = e.user_id or (e.display or e.title or "").strip().lower()
+    return f"{e.chat_id}|{e.type.value}|{who}|{e.day:02d}-{e.month:02d}-{e.year or ''}"
 
-    try:
-        day = int(parts[0])
-        month = int(parts[1])
-    except ValueError:
-        await update.message.reply_text("Format de date invalide. Utilise JJ-MM (ex: 25-03).")
+
+def _rekey_sent_marks(sent):
+    """
+    Rappels déjà envoyés enregistrés sous l'ancienne clé : rattachés à la clé actuelle
+    de leur event (sinon ils repartiraient). À appeler après load_data().
+    """
+    unknown = {key for key in sent if STORAGE.get(key) is None}
+    if not unknown:
         return
+    moved = 0
+    for key, e in STORAGE.items():
+        old = _legacy_event_key(e)
+        if old != key and old in unknown:
+            marks = sent.setdefault(key, [])
+            marks.extend(mark for mark in sent.pop(old) if mark not in marks)
+            unknown.discard(old)
+            moved += 1
+            if not unknown:
+                break
+    if moved:
+        print(f"🔑 {moved} event(s) : rappels envoyés rattachés à la nouvelle clé")
+
+
+def save_state():
+    """Sérialise sur la boucle, écriture confiée à WRITER ; renvoie un Future (écrit sur disque)."""
+    # On oublie les rappels dont la date est passée depuis plus de 2 jours
+    horizon = (date.today() - timedelta(days=2)).isoformat()
+    sent = BOT_STATE["reminders"]["sent"]
+    for key in list(sent):
+        sent[key] = [mark for mark in sent[key] if mark[:10] >= horizon]
+        if not sent[key]:
+            del sent[key]
+    return WRITER.submit_file(BOT_STATE_FILE, json.dumps(BOT_STATE, ensure_ascii=False))
+
+
+def chat_tz(chat_id):
+    name = BOT_STATE["chat_tz"].get(str(chat_id))
+    if not name:
+        return TZ
+    tz = _TZ_CACHE.get(name)
+    if tz is None:
+        tz = _TZ_CACHE[name] = ZoneInfo(name)
+    return tz
+
+
+def _reminder_start(chat_id, local_now):
+    """Heure d'envoi du groupe : REMINDER_HOUR + décalage stable dans la fenêtre d'étalement."""
+    spread = zlib.crc32(str(chat_id).encode()) % max(1, REMINDER_WINDOW_MINUTES * 60)
+    start = local_now.replace(hour=REMINDER_HOUR, minute=0, second=0, microsecond=0)
+    return start + timedelta(seconds=spread)
+
+
+def reminder_mark(occurrence, offset):
+    """Marque d'un rappel envoyé : "2026-03-25:7" pour J-7 (format des versions précédentes), "2026-03-25:H-2"."""
+    amount = offset[2:] if offset[0] == "J" else offset
+    return f"{occurrence.isoformat()}:{amount}"
+
+
+def _reminder_times(e, occurrence, offset, tz):
+    """(envoi, péremption) du rappel, en timestamps. J-n : valable jusqu'à la fin du jour local."""
+    amount = int(offset[2:])
+    if offset[0] == "J":
+        day = occurrence - timedelta(days=amount)
+        midnight = datetime(day.year, day.month, day.day, tzinfo=tz)
+        return _reminder_start(e.chat_id, midnight).timestamp(), (midnight + timedelta(days=1)).timestamp()
+    starts = datetime(occurrence.year, occurrence.month, occurrence.day, tzinfo=tz) + timedelta(minutes=e.time_of_day)
+    fire = starts.timestamp() - amount * 3600
+    return fire, fire + REMINDER_LATE_MINUTES * 60
+
+
+def plan_reminders(e, key, now):
+    """
+    Rappels de l'event à envoyer maintenant [(occurrence, rappel), ...] et heure du suivant
+    (None : plus rien à rappeler). Les rappels déjà envoyés, en cours ou périmés sont ignorés.
+    """
+    sent = BOT_STATE["reminders"]["sent"].get(key, ())
+    tz = chat_tz(e.chat_id)
+    start = datetime.fromtimestamp(now, tz).date() - timedelta(days=1)
+    offsets = e.reminders or DEFAULT_REMINDERS
+    # Fenêtre bornée : une série dont aucun rappel ne s'applique (H-n sans heure) s'arrête
+    end = start + timedelta(days=_lead_days(offsets) + 2 * 366)
+    due, later = [], None
+    for occurrence in event_occurrences(e, start, end):
+        for offset in offsets:
+            if offset[0] == "H" and e.time_of_day is None:
+                continue
+            mark = reminder_mark(occurrence, offset)
+            if mark in sent or (key, mark) in _REMINDERS_IN_FLIGHT:
+                continue
+            fire, expires = _reminder_times(e, occurrence, offset, tz)
+            if now >= expires:
+                continue
+            if fire <= now:
+                due.append((occurrence, offset))
+            elif later is None or fire < later:
+                later = fire
+        if later is not None:
+            break
+    return due, later
 
-    # 2) Pseudo “texte libre” = tout sauf la date
-    raw_pseudo = " ".join(context.args[:-1]).strip()
 
-    user_id = None
-    username = None   # @pseudo si dispo
-    display = None    # nom à afficher dans les listes
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_LEAD_DAYS = {}     # tuple de rappels -> jours d'avance max (+ marge de fuseau)
 
-    # 3) On regarde les entités Telegram pour détecter vraie mention
-    if msg.entities:
-        for ent in msg.entities:
-            if ent.type == "bot_command":
-                continue
 
-            # Cas 1 : vraie mention @username
-            if ent.type == "mention":
-                raw = msg.text[ent.offset: ent.offset + ent.length]  # ex: "@jordan"
-                username = raw.lstrip("@")   # "jordan"
-                display = raw                # "@jordan" (conserve le @ visuellement)
-                break
+def _lead_days(offsets):
+    lead = _LEAD_DAYS.get(offsets)
+    if lead is None:
+        lead = _LEAD_DAYS[offsets] = max(map(reminder_lead, offsets), default=0) // 1440 + 2
+    return lead
 
-            # Cas 2 : text_mention (clic sur un nom sans username public)
-            if ent.type == "text_mention" and ent.user:
-                user_id = ent.user.id
-                username = ent.user.username  # peut être None
-                display = ent.user.full_name or ent.user.first_name
-                break
 
-    # 4) Si aucune entité structurée, on retombe sur le pseudo texte libre
-    if not display:
-        if not raw_pseudo:
-            await update.message.reply_text("Indique un nom avant la date (ex: /add_bday Satya 15-02)")
-            return
-        display = raw_pseudo
-        if not username:
-            username = raw_pseudo  # pour compat / info
+def _coarse_deadline(e, start):
+    """
+    Borne basse (timestamp) du prochain rappel, sans fuseau ni datetime : minuit UTC,
+    quelques jours avant la prochaine occurrence. None si l'event est passé.
+    (Appelée pour chaque event au chargement : pas de générateur ici.)
+    """
+    occurrence = next_occurrence(e, start)
+    if occurrence is None:
+        return None
+    return (occurrence.toordinal() - _lead_days(e.reminders or DEFAULT_REMINDERS) - _EPOCH_ORDINAL) * 86400
 
-    chat_id = update.effective_chat.id
-    title = f"Anniv {display}"
 
-    add_event_record(
-        chat_id=chat_id,
-        type_="birthday",
-        username=username,
-        title=title,
-        day=day,
-        month=month,
-        year=None,
-        user_id=user_id,
-        display=display,
-    )
+class ReminderScheduler:
+    """
+    Tous les rappels dans un seul tas (ExpiryHeap) : une entrée par event, à l'heure de
+    son prochain rappel. Un seul job JobQueue (run_once) est armé sur l'échéance la plus
+    proche, et ré-armé après chaque passage : ni balayage périodique, ni job par event.
+    Au chargement l'échéance est une borne basse bon marché (_coarse_deadline) ;
+    l'heure exacte (fuseau, REMINDER_HOUR, heure de l'event) est calculée quand elle ressort.
+    Au démarrage (load_later) le tas n'est construit qu'au premier réveil, armé tout de suite.
+    """
 
-    await update.message.reply_text(
-        f"🎂 Anniversaire de {display} enregistré le {day:02d}-{month:02d}."
-    )
+    KIND = "reminder"
+
+    def __init__(self):
+        self._heap = ExpiryHeap()
+        self._job_queue = None
+        self._callback = None
+        self._job = None
+        self._armed = None      # échéance du job armé
+        self._waking = False    # entre pop_due() et rearm() : un seul armement à la fin
+        self._source = None     # load_later : events à charger au premier réveil
+
+    def __len__(self):
+        self._load_pending()
+        return len(self._heap)
+
+    def start(self, job_queue, callback):
+        self._job_queue = job_queue
+        self._callback = callback
+        self._arm()
+
+    def load(self, keyed_events, now=None):
+        """keyed_events : [(event_key, event), ...] (STORAGE.items(), clés déjà calculées)."""
+        self._fill(keyed_events, now)
+        self._arm()
+
+    def load_later(self, source):
+        """
+        source() -> (event_key, event), ... : parcourue au premier réveil seulement.
+        D'ici là add / remove n'ont rien à faire, le stockage est déjà à jour.
+        """
+        self._source = source
+        self._heap = ExpiryHeap()
+        self._arm()
+
+    def _load_pending(self, now=None):
+        if self._source is not None:
+            self._fill(self._source(), now)
+
+    def _fill(self, keyed_events, now=None):
+        self._source = None     # chargement différé remplacé (ou fait)
+        now = time.time() if now is None else now
+        start = datetime.fromtimestamp(now, timezone.utc).date() - timedelta(days=1)
+        items = []
+        for key, e in keyed_events:
+            deadline = _coarse_deadline(e, start)
+            if deadline is not None:
+                items.append((key, deadline))
+        self._heap = ExpiryHeap()
+        self._heap.schedule_many(self.KIND, items)
+
+    def add(self, event):
+        if self._source is not None:
+            return
+        start = datetime.now(timezone.utc).date() - timedelta(days=1)
+        deadline = _coarse_deadline(event, start)
+        if deadline is None:
+            self.remove(event_key(event))
+        else:
+            self.schedule(event_key(event), deadline)
 
-async def list_bday(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Liste les anniversaires du groupe."""
-    chat_id = update.effective_chat.id
-    bdays = [
-        e for e in DATA["events"]
-        if e["chat_id"] == chat_id and e["type"] == "birthday"
-    ]
+    def add_many(self, events):
+        """Plusieurs events (import) : le job n'est ré-armé qu'une fois, à la fin."""
+        waking, self._waking = self._waking, True
+        try:
+            for event in events:
+                self.add(event)
+        finally:
+            self._waking = waking
+            if not waking:
+                self._arm()
+
+    def remove(self, key):
+        # Pas de ré-armement : au pire le job se réveille pour rien et se ré-arme
+        if self._source is None:
+            self._heap.cancel(self.KIND, key)
+
+    def schedule(self, key, deadline):
+        if self._source is not None:
+            return      # recalculé au premier réveil
+        self._heap.schedule(self.KIND, key, deadline)
+        if not self._waking and (self._armed is None or deadline < self._armed):
+            self._arm()
+
+    def retry(self, key, deadline):
+        """Nouvel essai, sans repousser un rappel déjà prévu plus tôt."""
+        current = self._heap.deadline(self.KIND, key)
+        if current is None or deadline < current:
+            self.schedule(key, deadline)
+
+    def pop_due(self, now, job=None):
+        """Clés des events à (re)planifier ; le job qui appelle est consommé. Suivi de rearm()."""
+        if job is None or job is self._job:     # un job remplacé pendant qu'il se déclenchait ne compte pas
+            self._job = self._armed = None
+        self._waking = True
+        self._load_pending(now)
+        return [key for _, key in self._heap.pop_due(now)]
+
+    def next_deadline(self):
+        if self._source is not None:
+            return time.time()      # premier réveil : construction du tas
+        return self._heap.next_deadline()
+
+    def _arm(self):
+        if self._job_queue is None:
+            return
+        deadline = self.next_deadline()
+        if self._job is not None and (
+            deadline == self._armed or (self._source is not None and self._armed <= deadline)
+        ):
+            return      # déjà armé à cette échéance (ou, avant le premier réveil, plus tôt)
+        if self._job is not None:
+            try:
+                self._job.schedule_removal()
+            except JobLookupError:      # déjà déclenché, le callback n'a pas encore tourné
+                pass
+            self._job = None
+        self._armed = deadline
+        if deadline is not None:
+            # Seul job des rappels : jamais abandonné, même en retard (boucle occupée au chargement)
+            self._job = self._job_queue.run_once(
+                self._callback, when=max(0.0, deadline - time.time()), name="reminders",
+                job_kwargs={"misfire_grace_time": None},
+            )
+
+    def rearm(self):
+        self._waking = False
+        self._arm()
+
+
+REMINDERS = ReminderScheduler()
+
+
+def reminder_text(e, evt_date, offset):
+    amount = int(offset[2:])
+    if e.type is EventType.BIRTHDAY:
+        display = e.display or e.username or "?"
+        if amount == 0:
+            return f"🎂 Aujourd'hui, c'est l'anniversaire de {display} ({evt_date.strftime('%d-%m')}) !"
+        if amount == 1:
+            return f"🎂 Demain, c'est l'anniversaire de {display} ({evt_date.strftime('%d-%m')}) !"
+        return f"🎂 J-{amount} avant l'anniversaire de {display} ({evt_date.strftime('%d-%m')}) !"
+    title = e.title
+    when = format_when(evt_date, e.time_of_day)
+    if offset[0] == "H":
+        if amount == 0:
+            return f"⏰ C'est maintenant : {title} ({when})"
+        return f"⏰ Dans {amount}h : {title} ({when})"
+    if amount == 0:
+        return f"📅 Aujourd'hui : {title} ({when})"
+    if amount == 1:
+        return f"📅 Demain : {title} ({when})"
+    return f"📅 J-{amount} avant : {title} ({when})"
+
+
+async def send_due_reminders(context: ContextTypes.DEFAULT_TYPE = None):
+    """
+    Job armé par REMINDERS sur l'échéance la plus proche : envoie les rappels arrivés
+    à échéance (J-n à partir de REMINDER_HOUR heure locale du groupe, étalé sur
+    REMINDER_WINDOW_MINUTES ; H-n à l'heure dite), puis planifie le rappel suivant de
+    chaque event. Les rappels envoyés sont mémorisés : après un redémarrage on rattrape
+    ce qui manque sans envoyer de doublon.
+    """
+    now = time.time()
+    sent = BOT_STATE["reminders"]["sent"]
+    pending = []    # (key, mark, future)
 
-    if not bdays:
-        await update.message.reply_text("Aucun anniversaire enregistré pour ce groupe.")
+    try:
+        for key in REMINDERS.pop_due(now, context.job if context is not None else None):
+            e = STORAGE.get(key)
+            if e is None:
+                continue    # supprimé entre-temps
+            due, later = plan_reminders(e, key, now)
+            if due:
+                local_today = datetime.fromtimestamp(now, chat_tz(e.chat_id)).date()
+            for occurrence, offset in due:
+                mark = reminder_mark(occurrence, offset)
+                _REMINDERS_IN_FLIGHT.add((key, mark))
+                # Plusieurs rappels du jour pour un même groupe => un seul message
+                future = SENDER.send(
+                    e.chat_id, reminder_text(e, occurrence, offset), coalesce_key=f"reminder:{local_today}"
+                )
+                pending.append((key, mark, future))
+            if later is not None:
+                REMINDERS.schedule(key, later)
+    finally:
+        REMINDERS.rearm()
+
+    if not pending:
         return
 
-    lines = []
-    for e in sorted(bdays, key=lambda x: (x["month"], x["day"], (x.get("display") or x.get("username") or ""))):
-        display = e.get("display") or e.get("username") or "?"
-        lines.append(f"- {e['day']:02d}-{e['month']:02d} : {display}")
+    results = await asyncio.gather(*(f for _, _, f in pending), return_exceptions=True)
+    for (key, mark, _), result in zip(pending, results):
+        _REMINDERS_IN_FLIGHT.discard((key, mark))
+        # Erreur réseau : nouvel essai dans REMINDER_RETRY_SECONDS.
+        # Autres erreurs (bot sorti du groupe...) : loggées par le sender, pas de nouvel essai.
+        if isinstance(result, NetworkError) and not isinstance(result, BadRequest):
+            REMINDERS.retry(key, time.time() + REMINDER_RETRY_SECONDS)
+            continue
+        sent.setdefault(key, []).append(mark)
 
-    await update.message.reply_text("🎂 Anniversaires enregistrés :\n" + "\n".join(lines))
+    await save_state()
 
 
-async def add_event(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """
-    /add_event 14-02-2026 Soirée raclette
-    /add_event 14-02-2026 Soirée chez @satya
-    /add_event 14-02-2026 Soirée chez Satya (en cliquant sur son nom)
-    """
-    if len(context.args) < 2:
-        await update.message.reply_text("Usage : /add_event 14-02-2026 Titre de l'événement")
+async def set_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/timezone [Europe/Paris] : affiche ou change le fuseau des rappels du groupe."""
+    chat_id = update.effective_chat.id
+    if not context.args:
+        await update.message.reply_text(f"🕘 Fuseau du groupe : {chat_tz(chat_id).key}")
         return
 
-    msg = update.message
-    date_str = context.args[0]
-    title = " ".join(context.args[1:])
-
-    # 1) Parse de la date
+    name = context.args[0]
     try:
-        d_str, m_str, y_str = date_str.split("-")
-        day = int(d_str)
-        month = int(m_str)
-        year = int(y_str)
-        _ = date(year, month, day)  # validation simple
-    except Exception:
-        await update.message.reply_text("Format de date invalide. Utilise JJ-MM-AAAA (ex: 14-02-2026).")
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        await update.message.reply_text("Fuseau inconnu. Exemple : /timezone Europe/Paris")
         return
 
-    # 2) Détection éventuelle d'une personne associée (mention / text_mention)
-    user_id = None
-    username = None
-    display = None
+    BOT_STATE["chat_tz"][str(chat_id)] = name
+    # Heures d'envoi exactes recalculées dans le nouveau fuseau
+    if STORAGE.reads_disk:
+        await WRITER.flush()
+    for type_ in EventType:
+        if STORAGE.reads_disk:     # SQLite : lecture disque hors de la boucle
+            events = await asyncio.to_thread(STORAGE.events_for_chat, chat_id, type_)
+        else:
+            events = STORAGE.events_for_chat(chat_id, type_)
+        REMINDERS.add_many(events)
+    await save_state()
+    await update.message.reply_text(
+        f"🕘 Rappels envoyés vers {REMINDER_HOUR}h ({name})."
+    )
 
-    if msg.entities:
-        for ent in msg.entities:
-            if ent.type == "bot_command":
-                continue
-            if ent.type == "mention":
-                raw = msg.text[ent.offset: ent.offset + ent.length]  # ex: "@satya"
-                username = raw.lstrip("@")
-                display = raw
-                break
-            if ent.type == "text_mention" and ent.user:
-                user_id = ent.user.id
-                username = ent.user.username
-                display = ent.user.full_name or ent.user.first_name
-                break
 
-    chat_id = update.effective_chat.id
+# =========================
+# STATS
+# =========================
 
-    add_event_record(
-        chat_id=chat_id,
-        type_="event",
-        username=username,
-        title=title,
-        day=day,
-        month=month,
-        year=year,
-        user_id=user_id,
-        display=display,
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Quelques compteurs internes (pour dimensionner les caches)."""
+    c = ASK_CACHE.stats()
+    depths = UPDATE_PROCESSOR.queue_depths()
+    deadline = REMINDERS.next_deadline()
+    next_wake = "aucun" if deadline is None else f"dans {max(0, int(deadline - time.time()))} s"
+    await update.message.reply_text(
+        "📊 Stats\n"
+        f"- Cache /ask : {c['size']} entrées, {c['hits']} hits / {c['misses']} misses "
+        f"({c['hit_rate']:.0%})\n"
+        f"- Envois : {SENDER.sent} ok, {SENDER.failed} échecs, {SENDER.queued} en file\n"
+        f"- Drunk mode : {len(DRUNK_USERS)} actifs, {len(PENDING_MESSAGES)} messages en attente, "
+        f"{len(DRUNK_EXPIRIES)} échéances\n"
+        f"- Updates en file : {sum(depths)} sur {len(depths)} groupe(s) actif(s) "
+        f"(le plus chargé : {max(depths, default=0)})\n"
+        f"- Écritures disque : {WRITER.batches} lots, {WRITER.pending} en attente, {WRITER.failures} échec(s)\n"
+        f"- Rappels : {len(REMINDERS)} events planifiés, prochain réveil {next_wake}"
     )
 
+
+# =========================
+# START / HELP
+# =========================
+
+async def help(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
-        f"📅 Événement enregistré le {day:02d}-{month:02d}-{year} : {title}"
+        "Hello 👋\n\n"
+        "Je gère :\n"
+        "🥴 Drunk Mode\n"
+        "🎉 Anniversaires & événements\n\n"
+        "Commandes utiles :\n"
+        "- /drunk_on [minutes]\n"
+        "- /drunk_off\n"
+        "- /drunk_status\n"
+        "- /add_bday @pseudo 25-03\n"
+        "- /del_bday @pseudo [25-03]\n"
+        "- /list_bday\n"
+        "- /add_event 14-02-2026 Soirée raclette\n"
+        "- /add_event samedi prochain 20h Soirée jeux H-2\n"
+        "- /add_event tous les jeudis 20h Soirée jeux\n"
+        "- /add_event premier vendredi du mois 19h Apéro\n"
+        "- /edit_event 14-02-2026 Soirée raclette -> 21-02-2026\n"
+        "- /del_event 14-02-2026 [Soirée raclette]\n"
+        "- /list_events\n"
+        "- /import (en légende d'un fichier .csv ou .ics)\n"
+        "- /export\n"
+        "- /timezone Europe/Paris\n"
+        "- /8ball Ta question existentielle\n"
+        "- /ask Demande à Mistral AI\n"
     )
 
 
+# =========================
+# TRAITEMENT CONCURRENT DES UPDATES
+# =========================
 
-async def list_events(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Liste les événements du groupe."""
-    chat_id = update.effective_chat.id
-    today = datetime.now(TZ).date()
+_CALLBACK_CHAT_RE = re.compile(r"^(?:confirm|cancel)\|(-?\d+)\|")
 
-    evts = [
-        e for e in DATA["events"]
-        if e["chat_id"] == chat_id and e["type"] == "event"
-    ]
 
-    if not evts:
-        await update.message.reply_text("Aucun événement enregistré pour ce groupe.")
-        return
+def update_chat_key(update):
+    """
+    Groupe auquel appartient une update. Les boutons du drunk mode arrivent
+    souvent en DM : on les rattache au groupe encodé dans callback_data pour
+    qu'ils passent après le message retenu, jamais en même temps.
+    """
+    query = getattr(update, "callback_query", None)
+    if query is not None and query.data:
+        match = _CALLBACK_CHAT_RE.match(query.data)
+        if match:
+            return int(match.group(1))
+    chat = getattr(update, "effective_chat", None)
+    return chat.id if chat is not None else 0
 
-    # tri par date
-    def evt_date(e):
-        return date(e["year"], e["month"], e["day"])
 
-    lines = []
-    for e in sorted(evts, key=evt_date):
-        d = evt_date(e)
-        status = "✅ passé" if d < today else "🕒 à venir"
-        lines.append(f"- {d.strftime('%d-%m-%Y')} : {e['title']} ({status})")
+class ChatShardedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Updates traitées en parallèle entre groupes, dans l'ordre au sein d'un groupe :
+    chaque groupe qui a des updates en attente a sa file et sa tâche, qui la vide puis
+    disparaît. Au plus max_in_flight groupes sont traités en même temps ; un groupe garde
+    sa place tant que sa file n'est pas vide (les autres attendent leur tour).
+
+    PTB voit max_concurrent_updates=1 : son fetcher attend donc do_process_update,
+    qui ne fait que mettre l'update dans la file de son groupe. Quand max_pending
+    updates attendent déjà (tous groupes), le fetcher attend, update_queue se remplit
+    et la pression remonte jusqu'au webhook (WEBHOOK_BACKPRESSURE).
+    """
 
-    await update.message.reply_text("📅 Événements du groupe :\n" + "\n".join(lines))
+    def __init__(self, max_in_flight=8, max_pending=512):
+        super().__init__(max_concurrent_updates=1)
+        self.max_in_flight = max_in_flight
+        self.max_pending = max_pending
+        self._queues = {}   # groupe -> deque des updates en attente
+        self._tasks = {}    # groupe -> tâche qui vide sa file
+        self._running = None
+        self._room = None
+
+    async def initialize(self):
+        self._running = asyncio.Semaphore(self.max_in_flight)
+        self._room = asyncio.Semaphore(self.max_pending)
+
+    async def drain(self):
+        """Attend que les updates déjà en file soient traitées (après app.stop(), avant shutdown)."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    async def shutdown(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def do_process_update(self, update, coroutine):
+        await self._room.acquire()
+        key = update_chat_key(update)
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            self._tasks[key] = asyncio.create_task(self._run_chat(key, queue))
+        queue.append(coroutine)
+
+    async def _run_chat(self, key, queue):
+        try:
+            async with self._running:
+                # Pas d'await entre la file vide et la sortie : une update qui arrive
+                # ensuite ouvre une nouvelle file, l'ordre du groupe est conservé.
+                while queue:
+                    coroutine = queue.popleft()
+                    try:
+                        await coroutine
+                    except Exception as exc:
+                        # Les erreurs des handlers passent par Application.process_error ; ici l'imprévu
+                        print(f"⚠️ Update non traitée : {exc!r}")
+                    finally:
+                        self._room.release()
+        finally:
+            del self._queues[key]
+            del self._tasks[key]
+
+    def queue_depths(self):
+        """Updates en attente, par groupe actif."""
+        return [len(q) for q in self._queues.values()]
+
+
+UPDATE_PROCESSOR = ChatShardedUpdateProcessor(
+    max_in_flight=UPDATE_MAX_IN_FLIGHT, max_pending=UPDATE_MAX_PENDING,
+)
 
 
 # =========================
-# RAPPELS QUOTIDIENS (J-7 / J-1)
+# WEBHOOK (SERVEUR HTTP)
 # =========================
 
-async def daily_reminder(context: ContextTypes.DEFAULT_TYPE):
+_HTTP_REASONS = {
+    200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+    405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class HttpServer:
     """
-    Job quotidien qui envoie les rappels J-7 / J-1
-    pour les anniversaires et événements.
+    Mini serveur HTTP/1.1 sur asyncio, sans dépendance :
+    juste ce qu'il faut pour recevoir des webhooks en local (keep-alive, Content-Length).
+    `handler(method, path, headers, body)` renvoie (status, content_type, body_bytes).
     """
-    today = datetime.now(TZ).date()
 
-    for e in DATA["events"]:
-        chat_id = e["chat_id"]
-        type_ = e["type"]
-        day = e["day"]
-        month = e["month"]
-        year = e.get("year")
+    MAX_BODY = 1 << 20
 
-        if type_ == "birthday":
-            # prochaine occurrence de l'anniv
-            evt_date = date(today.year, month, day)
-            if evt_date < today:
-                evt_date = date(today.year + 1, month, day)
-        else:  # event daté
-            if not year:
-                continue
-            evt_date = date(year, month, day)
+    def __init__(self, handler):
+        self.handler = handler
+        self._server = None
+        self._connections = {}  # writer -> tâche : connexions keep-alive fermées par stop()
 
-        delta = (evt_date - today).days
+    async def start(self, host, port):
+        self._server = await asyncio.start_server(self._serve, host, port)
+        return self._server.sockets[0].getsockname()[1]
 
-        if delta not in (7, 1):
-            continue
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._connections):
+                writer.close()
+            await asyncio.gather(*self._connections.values(), return_exceptions=True)
+            await self._server.wait_closed()
 
-               # Message
-        if type_ == "birthday":
-            display = e.get("display") or e.get("username") or "?"
-            if delta == 7:
-                text = f"🎂 J-7 avant l'anniversaire de {display} ({evt_date.strftime('%d-%m')}) !"
-            else:
-                text = f"🎂 Demain, c'est l'anniversaire de {display} ({evt_date.strftime('%d-%m')}) !"
-        else:
-            title = e["title"]
-            if delta == 7:
-                text = f"📅 J-7 avant : {title} ({evt_date.strftime('%d-%m-%Y')})"
-            else:
-                text = f"📅 Demain : {title} ({evt_date.strftime('%d-%m-%Y')})"
+    async def _serve(self, reader, writer):
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, _version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, "text/plain", b"bad request", close=True)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._respond(writer, 400, "text/plain", b"bad content-length", close=True)
+                    break
+                if length > self.MAX_BODY:
+                    await self._respond(writer, 413, "text/plain", b"too large", close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                try:
+                    status, content_type, payload = await self.handler(method, target, headers, body)
+                except Exception as exc:
+                    print(f"⚠️ Erreur HTTP {method} {target} : {exc!r}")
+                    status, content_type, payload = 500, "text/plain", b"internal error"
+                close = headers.get("connection", "").lower() == "close"
+                await self._respond(writer, status, content_type, payload, close=close)
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, content_type, payload, close=False):
+        head = (
+            f"HTTP/1.1 {status} {_HTTP_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + payload)
+        await writer.drain()
+
+
+class WebhookReceiver:
+    """
+    Reçoit les updates Telegram (POST JSON) et les pousse dans la file bornée
+    de l'Application. File pleine :
+    - "wait"   : on retient la réponse HTTP jusqu'à WEBHOOK_WAIT_TIMEOUT (Telegram ralentit),
+    - "reject" : 503 immédiat (Telegram renverra l'update plus tard).
+    """
 
+    def __init__(self, app, path, secret=None, backpressure="wait", wait_timeout=10.0):
+        self.app = app
+        self.path = path
+        self.secret = secret
+        self.backpressure = backpressure
+        self.wait_timeout = wait_timeout
+        self.accepted = 0
+        self.rejected = 0
+
+    async def handle(self, method, path, headers, body):
+        if path != self.path:
+            return 404, "text/plain", b"not found"
+        if method != "POST":
+            return 405, "text/plain", b"method not allowed"
+        # En octets : compare_digest refuse les str non ASCII (TypeError -> 500 au lieu de 403)
+        if self.secret and not hmac.compare_digest(
+            headers.get("x-telegram-bot-api-secret-token", "").encode("latin-1"), self.secret.encode("utf-8")
+        ):
+            return 403, "text/plain", b"forbidden"
         try:
-            await context.bot.send_message(chat_id=chat_id, text=text)
-        except Exception:
-            # Si le bot est sorti du groupe ou autre → on ignore
-            continue
+            data = json.loads(body)
+        except ValueError:
+            return 400, "text/plain", b"invalid json"
+        if not isinstance(data, dict):
+            return 400, "text/plain", b"invalid update"
+
+        if not await self.deliver(data):
+            self.rejected += 1
+            return 503, "text/plain", b"busy"
+        self.accepted += 1
+        return 200, "text/plain", b"ok"
+
+    async def deliver(self, data):
+        """Pousse l'update dans la file de l'Application ; False si la file est pleine."""
+        update = Update.de_json(data, self.app.bot)
+        queue = self.app.update_queue
+        try:
+            if self.backpressure == "reject":
+                queue.put_nowait(update)
+            else:
+                await asyncio.wait_for(queue.put(update), timeout=self.wait_timeout)
+        except (asyncio.QueueFull, asyncio.TimeoutError):
+            return False
+        return True
+
+
+async def _run_application(app, start_server):
+    """
+    Cycle de vie de l'Application sans Updater (webhook, worker) :
+    `start_server(app)` démarre la source d'updates et renvoie sa coroutine d'arrêt.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+    stop_server = await start_server(app)
+
+    try:
+        await stop.wait()
+    finally:
+        await stop_server()
+        await app.stop()
+        if app.post_stop:
+            await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+
+
+async def _start_webhook_server(app):
+    if WEBHOOK_URL:
+        await app.bot.set_webhook(
+            url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    receiver = WebhookReceiver(
+        app, WEBHOOK_PATH,
+        secret=WEBHOOK_SECRET,
+        backpressure=WEBHOOK_BACKPRESSURE,
+        wait_timeout=WEBHOOK_WAIT_TIMEOUT,
+    )
+    server = HttpServer(receiver.handle)
+    port = await server.start(WEBHOOK_LISTEN, WEBHOOK_PORT)
+    print(f"Bot started (webhook sur {WEBHOOK_LISTEN}:{port}{WEBHOOK_PATH}).")
+    return server.stop
 
 
 # =========================
-# START / HELP
+# MODE MULTI-WORKERS (SHARDING PAR GROUPE)
 # =========================
 
-async def help(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "Hello 👋\n\n"
-        "Je gère :\n"
-        "🥴 Drunk Mode\n"
-        "🎉 Anniversaires & événements\n\n"
-        "Commandes utiles :\n"
-        "- /drunk_on [minutes]\n"
-        "- /drunk_off\n"
-        "- /drunk_status\n"
-        "- /add_bday @pseudo 25-03\n"
-        "- /list_bday\n"
-        "- /add_event 14-02-2026 Soirée raclette\n"
-        "- /list_events\n"
-        "- /8ball Ta question existentielle\n"
-        "- /ask Demande à Mistral AI\n"
+# BOT_MODE=sharded : ce process devient un frontal webhook qui lance BOT_WORKERS
+# process "worker" (ce même script, BOT_MODE=worker) et leur répartit les updates
+# par hachage cohérent du chat_id, via des sockets Unix locales.
+# Chaque worker ne charge que les groupes de son shard (base SQLite partagée,
+# fichiers d'état suffixés par son nom). SIGUSR1 sur le frontal ajoute un worker :
+# les workers écrivent leur état, le nouveau le reprend, les autres lâchent
+# les groupes qui ne sont plus à eux.
+
+class HashRing:
+    """Hachage cohérent (points virtuels) : ajouter un nœud ne déplace qu'environ 1/N des clés."""
+
+    def __init__(self, nodes, vnodes=64):
+        self.nodes = list(nodes)
+        points = sorted(
+            (self._hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes)
+        )
+        self._keys = [h for h, _ in points]
+        self._owners = [node for _, node in points]
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(str(value).encode()).digest()[:8], "big")
+
+    def node_for(self, key):
+        i = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._owners[i]
+
+
+SHARD_RING = HashRing(BOT_RING.split(",")) if BOT_RING else None
+
+
+def owns_chat(chat_id):
+    return SHARD_RING is None or SHARD_RING.node_for(chat_id) == BOT_WORKER
+
+
+def worker_socket_path(name):
+    return os.path.join(WORKER_SOCKET_DIR, f"eventbot-{name}.sock")
+
+
+_UPDATE_CHAT_FIELDS = (
+    "message", "edited_message", "channel_post", "edited_channel_post",
+    "my_chat_member", "chat_member", "chat_join_request",
+)
+
+
+def raw_update_chat_key(data):
+    """Même logique que update_chat_key, sur le JSON brut (le frontal ne construit pas d'Update)."""
+    query = data.get("callback_query")
+    if query:
+        match = _CALLBACK_CHAT_RE.match(query.get("data") or "")
+        if match:
+            return int(match.group(1))
+        if query.get("message"):
+            return query["message"]["chat"]["id"]
+        return query["from"]["id"]
+    for field in _UPDATE_CHAT_FIELDS:
+        obj = data.get(field)
+        if obj and "chat" in obj:
+            return obj["chat"]["id"]
+    for obj in data.values():
+        if isinstance(obj, dict) and "from" in obj:
+            return obj["from"]["id"]
+    return 0
+
+
+async def _flush_shard_state():
+    """Écrit tout l'état local (avant un rééquilibrage)."""
+    await WRITER.flush()
+    async with _DRUNK_FLUSH_LOCK:
+        _DRUNK_LOG.clear()
+        await asyncio.to_thread(_write_drunk_snapshot, _drunk_snapshot_text())
+    await save_state()
+
+
+async def _adopt_ring(nodes):
+    """Nouveau ring : on recharge les groupes qui nous appartiennent, on lâche les autres."""
+    global SHARD_RING
+    await WRITER.flush()
+    SHARD_RING = HashRing(nodes)
+    rate = _worker_send_rate(nodes)
+    SENDER.global_bucket.rate = SENDER.global_bucket.capacity = rate
+    load_data()
+    load_state()
+    await save_state()
+    async with _DRUNK_FLUSH_LOCK:
+        reset_drunk_state()
+        load_drunk_state()
+        await asyncio.to_thread(_write_drunk_snapshot, _drunk_snapshot_text())
+    print(f"🔀 {BOT_WORKER} : ring {','.join(nodes)}, {len(STORAGE)} événement(s)")
+
+
+async def _start_worker_socket(app):
+    """Worker : lit les updates (une ligne JSON chacune) envoyées par le frontal."""
+    path = worker_socket_path(BOT_WORKER)
+    if os.path.exists(path):
+        os.remove(path)
+
+    async def serve(reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                data = json.loads(line)
+                ctl = data.get("_ctl")
+                if ctl == "flush":
+                    await _flush_shard_state()
+                elif ctl == "adopt":
+                    await _adopt_ring(data["ring"])
+                else:
+                    # File bornée pleine => on arrête de lire => le frontal ralentit
+                    await app.update_queue.put(Update.de_json(data, app.bot))
+                    continue
+                writer.write(b"ok\n")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_unix_server(serve, path, limit=2 * HttpServer.MAX_BODY)
+    print(f"Worker {BOT_WORKER} started ({path}).")
+
+    async def stop():
+        server.close()
+        await server.wait_closed()
+        if os.path.exists(path):
+            os.remove(path)
+
+    return stop
+
+
+class ShardRouter(WebhookReceiver):
+    """Frontal : reçoit le webhook et transmet chaque update au worker propriétaire du groupe."""
+
+    def __init__(self, names, path, secret=None, wait_timeout=10.0):
+        super().__init__(None, path, secret=secret, wait_timeout=wait_timeout)
+        self.ring = HashRing(names)
+        self.procs = {}
+        self._conns = {}                # name -> (reader, writer)
+        self._open = asyncio.Event()    # fermé pendant un rééquilibrage
+        self._open.set()
+
+    def spawn(self, name):
+        env = dict(
+            os.environ, BOT_MODE="worker", BOT_WORKER=name, BOT_RING=",".join(self.ring.nodes)
+        )
+        self.procs[name] = subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+
+    async def _connection(self, name, retries=300):
+        conn = self._conns.get(name)
+        if conn is not None:
+            return conn
+        for _ in range(retries):
+            try:
+                conn = await asyncio.open_unix_connection(worker_socket_path(name))
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                await asyncio.sleep(0.1)   # worker en cours de démarrage
+        else:
+            raise ConnectionError(f"worker {name} injoignable")
+        self._conns[name] = conn
+        return conn
+
+    async def deliver(self, data):
+        await self._open.wait()
+        name = self.ring.node_for(raw_update_chat_key(data))
+        try:
+            _reader, writer = await self._connection(name, retries=1)
+            writer.write(json.dumps(data, ensure_ascii=False).encode("utf-8") + b"\n")
+            await asyncio.wait_for(writer.drain(), timeout=self.wait_timeout)
+        except (ConnectionError, OSError, asyncio.TimeoutError):
+            # Worker mort ou saturé : 503, Telegram renverra l'update
+            self._conns.pop(name, None)
+            return False
+        return True
+
+    async def _control(self, name, message):
+        reader, writer = await self._connection(name)
+        writer.write(json.dumps(message).encode("utf-8") + b"\n")
+        await writer.drain()
+        await reader.readline()
+
+    async def add_worker(self):
+        """Ajoute un worker et rééquilibre ; les updates sont retenues pendant l'opération."""
+        self._open.clear()
+        try:
+            old_nodes = self.ring.nodes
+            name = f"w{len(self.procs)}"
+            while name in self.procs:
+                name += "_"
+            for node in old_nodes:
+                await self._control(node, {"_ctl": "flush"})
+            self.ring = HashRing(old_nodes + [name])
+            self.spawn(name)
+            await self._connection(name)   # le worker a chargé son shard
+            for node in old_nodes:
+                await self._control(node, {"_ctl": "adopt", "ring": self.ring.nodes})
+            print(f"🔀 Worker {name} ajouté ({len(self.ring.nodes)} workers).")
+        finally:
+            self._open.set()
+
+    async def stop_workers(self, timeout=10.0):
+        for _reader, writer in self._conns.values():
+            writer.close()
+        for proc in self.procs.values():
+            proc.terminate()
+        for proc in self.procs.values():
+            try:
+                await asyncio.to_thread(proc.wait, timeout)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+async def run_front():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    router = ShardRouter(
+        [f"w{i}" for i in range(BOT_WORKERS)],
+        WEBHOOK_PATH,
+        secret=WEBHOOK_SECRET,
+        wait_timeout=WEBHOOK_WAIT_TIMEOUT,
     )
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    rebalances = set()
+
+    def _rebalance_done(task):
+        rebalances.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"⚠️ Ajout de worker échoué : {task.exception()!r}")
+
+    def _on_sigusr1():
+        # Référence gardée : une tâche sans référence peut être collectée en cours de route.
+        task = asyncio.create_task(router.add_worker())
+        rebalances.add(task)
+        task.add_done_callback(_rebalance_done)
+
+    loop.add_signal_handler(signal.SIGUSR1, _on_sigusr1)
+
+    for name in router.ring.nodes:
+        router.spawn(name)
+    if WEBHOOK_URL:
+        async with Bot(BOT_TOKEN) as bot:
+            await bot.set_webhook(
+                url=WEBHOOK_URL,
+                secret_token=WEBHOOK_SECRET or None,
+                allowed_updates=Update.ALL_TYPES,
+            )
+    server = HttpServer(router.handle)
+    port = await server.start(WEBHOOK_LISTEN, WEBHOOK_PORT)
+    print(f"Bot started (frontal sur {WEBHOOK_LISTEN}:{port}{WEBHOOK_PATH}, {BOT_WORKERS} workers).")
+
+    try:
+        await stop.wait()
+    finally:
+        await server.stop()
+        await router.stop_workers()
 
 
 # =========================
 # MAIN
 # =========================
 
-def main():
-    load_data()
+async def post_init(app):
+    WRITER.start()
+    SENDER.start(app.bot)
+    await start_metrics_server()
+
+
+async def post_stop(app):
+    # Updates déjà acceptées (files des shards) traitées tant que le bot peut encore répondre
+    await UPDATE_PROCESSOR.drain()
+
+
+async def post_shutdown(app):
+    await stop_metrics_server()
+    await SENDER.stop()
+    async with _DRUNK_FLUSH_LOCK:
+        _DRUNK_LOG.clear()
+        _write_drunk_snapshot(_drunk_snapshot_text())
+    await WRITER.stop()
+    ASK_CACHE.save()
+    STORAGE.close()
+
 
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+def build_application(base_url=None):
+    """
+    Application avec tous les handlers et jobs.
+    base_url : autre serveur Bot API (ex : faux serveur local de bench.py).
+    """
+    builder = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .concurrent_updates(UPDATE_PROCESSOR)
+        .request(InstrumentedRequest(connection_pool_size=256))
+        .get_updates_request(InstrumentedRequest())
+    )
+    if base_url is not None:
+        builder = builder.base_url(base_url)
+    if BOT_MODE in ("webhook", "worker"):
+        # Pas de getUpdates : les updates arrivent par HTTP / socket dans une file bornée
+        builder = builder.updater(None).update_queue(asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE))
+    app = builder.build()
 
     # Commandes générales
     app.add_handler(CommandHandler("help", help))
+    app.add_handler(CommandHandler("stats", stats))
 
-    # Mistral
-    app.add_handler(CommandHandler("ask", ask))
+    # Mistral (block=False : un /ask lent ne retient pas les autres updates du groupe)
+    app.add_handler(CommandHandler("ask", ask, block=False))
 
 
     # Drunk mode
@@ -685,28 +5029,64 @@ def main():
     app.add_handler(CommandHandler("list_bday", list_bday))
     app.add_handler(CommandHandler("add_event", add_event))
     app.add_handler(CommandHandler("list_events", list_events))
+    app.add_handler(CommandHandler("del_bday", del_bday))
+    app.add_handler(CommandHandler("del_event", del_event))
+    app.add_handler(CommandHandler("edit_event", edit_event))
+    app.add_handler(CommandHandler("timezone", set_timezone))
+    app.add_handler(CommandHandler("import", import_events))
+    app.add_handler(
+        MessageHandler(filters.Document.ALL & filters.CaptionRegex(r"^/import(?:@\w+)?(?:\s|$)"), import_events)
+    )
+    app.add_handler(CommandHandler("export", export_events))
 
     # Callbacks (drunk mode)
     app.add_handler(CallbackQueryHandler(drunk_callback, pattern="^(confirm|cancel)\\|"))
+    app.add_handler(CallbackQueryHandler(list_page_callback, pattern="^page\\|"))
 
-    # Messages texte dans les groupes (pour drunk mode)
+    # Messages texte dans les groupes (pour drunk mode) : DRUNK_USER en premier,
+    # les messages des autres utilisateurs sont écartés avant tout autre test
     app.add_handler(
         MessageHandler(
-            filters.TEXT & ~filters.COMMAND & filters.ChatType.GROUPS,
+            DRUNK_USER & filters.TEXT & ~filters.COMMAND & filters.ChatType.GROUPS,
             drunk_message_filter,
         )
     )
 
-    # 🔕 On désactive les rappels quotidiens pour l'instant
-    # (sinon ça demande une config JobQueue spécifique)
-    # Si tu veux les remettre plus tard, on réactivera ce bloc avec une JobQueue correctement initialisée.
-    # from telegram.ext import JobQueue
-    # app.job_queue = JobQueue()
-    # app.job_queue.set_application(app)
-    # app.job_queue.run_daily(
-    #     daily_reminder,
-    #     time=dtime(hour=9, minute=0, tz=TZ),
-    # )
+    # Durée / erreurs de chaque handler (voir /metrics)
+    instrument_handlers(app)
+
+    # Rappels : un seul job run_once, ré-armé par REMINDERS sur la prochaine échéance
+    REMINDERS.start(app.job_queue, instrumented(send_due_reminders))
+    # Ménage des drunk modes expirés / confirmations abandonnées
+    app.job_queue.run_repeating(instrumented(drunk_sweeper), interval=DRUNK_SWEEP_SECONDS, name="drunk_sweeper")
+    # Écriture de l'état drunk mode (hors du chemin des messages)
+    app.job_queue.run_repeating(instrumented(flush_drunk_state), interval=DRUNK_FLUSH_SECONDS, name="drunk_flush")
+    return app
+
+
+def main():
+    if BOT_MODE == "sharded":
+        if STORAGE_BACKEND != "sqlite":
+            raise SystemExit("Le mode sharded demande STORAGE_BACKEND=sqlite (base partagée entre workers).")
+        # Migration JSON -> SQLite faite une seule fois, avant de lancer les workers
+        STORAGE.load()
+        STORAGE.close()
+        asyncio.run(run_front())
+        return
+
+    load_data()
+    load_state()
+    load_drunk_state()
+    ASK_CACHE.load()
+
+    app = build_application()
+
+    if BOT_MODE == "webhook":
+        asyncio.run(_run_application(app, _start_webhook_server))
+        return
+    if BOT_MODE == "worker":
+        asyncio.run(_run_application(app, _start_worker_socket))
+        return
 
     print("Bot started.")
     app.run_polling()
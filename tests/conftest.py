@@ -0,0 +1,8 @@
+import os
+import sys
+
+# bot.py lit sa configuration à l'import : faux jetons, aucun appel réseau dans les tests
+os.environ.setdefault("BOT_TOKEN", "123456:test")
+os.environ.setdefault("MISTRAL_API_KEY", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,113 @@
+"""/ask en streaming contre les faux serveurs Bot API / Mistral du banc d'essai."""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from mistralai.async_client import MistralAsyncClient
+from telegram import Bot
+
+import bench
+import bot
+
+QUESTION = "Dois-je sortir ce soir ?"
+HEADER = f"❓ {QUESTION}\n🔮 "
+FULL_ANSWER = "Les astres disent que oui, sans hésiter. " + bench.ANSWER_END
+CHAT_ID = -1001
+
+
+@pytest.fixture(autouse=True)
+def _no_flood_limits(monkeypatch):
+    monkeypatch.setattr(bot.SENDER, "private_rate", 1e6)
+    monkeypatch.setattr(bot.SENDER, "group_rate", 1e6)
+
+
+class ApiLog:
+    """Appels reçus par le faux Bot API : (date, méthode, texte)."""
+
+    def __init__(self):
+        self.calls = []
+
+    def on_api_call(self, method, params):
+        self.calls.append((time.monotonic(), method, params.get("text")))
+
+    def texts(self, method):
+        return [text for _, m, text in self.calls if m == method]
+
+    def times(self, method):
+        return [at for at, m, _ in self.calls if m == method]
+
+
+def run_ask(monkeypatch, mistral_latency=0, mistral_token_ms=0, timeout=20.0, edit_interval=0.2):
+    monkeypatch.setattr(bot, "MISTRAL_TIMEOUT", timeout)
+    monkeypatch.setattr(bot, "ASK_EDIT_INTERVAL", edit_interval)
+    log = ApiLog()
+    args = SimpleNamespace(api_latency=0, mistral_latency=mistral_latency, mistral_token_ms=mistral_token_ms)
+
+    async def scenario():
+        telegram_server, mistral_server = bench.make_fake_servers(bot, log, args)
+        telegram_port = await telegram_server.start("127.0.0.1", 0)
+        mistral_port = await mistral_server.start("127.0.0.1", 0)
+        monkeypatch.setattr(bot, "mistral", MistralAsyncClient(
+            api_key="test", endpoint=f"http://127.0.0.1:{mistral_port}", timeout=timeout, max_retries=1,
+        ))
+        monkeypatch.setattr(bot, "MISTRAL_SEMAPHORE", asyncio.Semaphore(1))
+        tg = Bot("123456:test", base_url=f"http://127.0.0.1:{telegram_port}/bot")
+        await tg.initialize()
+        bot.SENDER.start(tg)
+        try:
+            update = SimpleNamespace(effective_chat=SimpleNamespace(id=CHAT_ID))
+            started = time.monotonic()
+            answer = await bot._ask_streaming(
+                update, SimpleNamespace(bot=tg), QUESTION, bot.ASK_PROMPT_TEMPLATE.format(question=QUESTION)
+            )
+            return answer, started
+        finally:
+            await bot.SENDER.stop()
+            await tg.shutdown()
+            await telegram_server.stop()
+            await mistral_server.stop()
+
+    answer, started = asyncio.run(scenario())
+    return answer, started, log
+
+
+def test_placeholder_then_full_answer(monkeypatch):
+    answer, started, log = run_ask(monkeypatch, mistral_token_ms=60)
+
+    assert log.texts("sendMessage") == [HEADER + "…"]
+    assert log.times("sendMessage")[0] <= log.times("editMessageText")[0]
+    assert answer == FULL_ANSWER
+    assert log.texts("editMessageText")[-1] == HEADER + FULL_ANSWER
+
+
+def test_edits_are_throttled(monkeypatch):
+    interval = 0.2
+    answer, started, log = run_ask(monkeypatch, mistral_token_ms=60, edit_interval=interval)
+
+    # Éditions intermédiaires (« … ») : au plus une par intervalle ; la dernière, à la fin du flux, en plus
+    edits = [at for at, method, text in log.calls if method == "editMessageText" and text.endswith(" …")]
+    assert edits
+    assert all(b - a >= interval - 0.02 for a, b in zip(edits, edits[1:]))
+    elapsed = log.times("editMessageText")[-1] - started
+    assert len(edits) <= elapsed / interval + 1
+    assert len(log.texts("editMessageText")) < len(FULL_ANSWER.split())
+
+
+def test_timeout_keeps_partial_answer(monkeypatch):
+    answer, started, log = run_ask(monkeypatch, mistral_token_ms=150, timeout=0.5)
+
+    assert answer is None   # réponse coupée : pas mise en cache
+    final = log.texts("editMessageText")[-1]
+    assert final.startswith(HEADER + "Les ")
+    assert final.endswith(" […]")
+    assert bench.ANSWER_END not in final
+
+
+def test_timeout_before_first_token(monkeypatch):
+    answer, started, log = run_ask(monkeypatch, mistral_latency=800, timeout=0.3)
+
+    assert answer is None
+    assert log.texts("sendMessage") == [HEADER + "…"]
+    assert log.texts("editMessageText") == ["⏳ Mistral met trop de temps à répondre, réessaie plus tard."]
@@ -0,0 +1,58 @@
+"""Analyse des dates / heures de /add_event et /add_bday (invariants du fuzz du banc d'essai)."""
+
+import random
+from datetime import date
+
+import pytest
+
+import bench
+import bot
+
+TODAY = date(2026, 10, 14)     # un mercredi
+SATURDAY = date(2026, 10, 17)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_tokens_only_raise_value_error(seed):
+    rng = random.Random(seed)
+    for _ in range(2000):
+        tokens = [bench._random_token(rng) for _ in range(rng.randint(0, 5))]
+        # _fuzz_one laisse passer toute exception autre que ValueError
+        assert bench._fuzz_one(bot, tokens, TODAY) is None
+
+
+@pytest.mark.parametrize("text", ["31-02-2027", "29-02-2027", "29/02/27", "31 février 2027", "29 février 2027"])
+def test_impossible_dates_rejected(text):
+    with pytest.raises(ValueError):
+        bot.parse_date_prefix(text.split(), TODAY)
+    with pytest.raises(ValueError):
+        bot.parse_when(text.split(), TODAY)
+    with pytest.raises(ValueError):
+        bot.parse_day_month_suffix(["Nolwenn"] + text.split())
+
+
+def test_february_29_in_leap_year():
+    assert bot.parse_date_prefix(["29-02-2028"], TODAY) == (date(2028, 2, 29), None, 1)
+    assert bot.parse_day_month_suffix(["29-02-2028"]) == (29, 2, 1)
+    # Sans année : prochaine année bissextile
+    assert bot.parse_date_prefix(["29-02"], TODAY) == (date(2028, 2, 29), None, 1)
+    with pytest.raises(ValueError):
+        bot.parse_date_prefix(["31-02"], TODAY)
+
+
+@pytest.mark.parametrize("text, expected, minutes, n", [
+    ("demain", date(2026, 10, 15), None, 1),
+    ("Demain 20h", date(2026, 10, 15), 20 * 60, 2),
+    ("après-demain", date(2026, 10, 16), None, 1),
+    ("samedi", SATURDAY, None, 1),
+    ("samedi prochain", SATURDAY, None, 2),
+    ("samedi prochain à 20h30 Soirée jeux", SATURDAY, 20 * 60 + 30, 4),
+    ("mercredi", date(2026, 10, 21), None, 1),     # aujourd'hui : la semaine suivante
+    ("dans 3 jours", date(2026, 10, 17), None, 3),
+])
+def test_relative_dates(text, expected, minutes, n):
+    assert bot.parse_date_prefix(text.split(), TODAY) == (expected, minutes, n)
+
+
+def test_samedi_prochain_from_saturday():
+    assert bot.parse_date_prefix(["samedi", "prochain"], SATURDAY) == (date(2026, 10, 24), None, 2)